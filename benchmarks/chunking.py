@@ -0,0 +1,222 @@
+"""Chunking benchmark: datasources.chunker.split_text against the original splitter.
+
+Both split the same synthetic book and must produce identical sections. The
+peak memory of splitting the book streamed page by page is reported too, it
+should not grow with the number of pages:
+
+    python -m benchmarks.chunking --pages 1000 --output chunking.json
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from datasources.chunker import split_text
+
+DEFAULT_PAGES = 1000
+CHARS_PER_PAGE = 3000
+
+
+def reference_split_text(
+    page_map: List[Tuple[int, int, str]],
+    doc_max_section_length: int,
+    doc_sentence_search_limit: int,
+    doc_section_overlap: int,
+) -> Iterator[Tuple[str, int]]:
+    """The original character-by-character splitter of ingest.create_sections.
+
+    Kept verbatim as the specification split_text is checked against.
+    """
+    SENTENCE_ENDINGS = [".", "!", "?"]
+    WORDS_BREAKS = [",", ";", ":", " ", "(", ")", "[", "]", "{", "}", "\t", "\n"]
+
+    def find_page(offset):
+        mapsize = len(page_map)
+        for i in range(mapsize - 1):
+            if offset >= page_map[i][1] and offset < page_map[i + 1][1]:
+                return i
+        return mapsize - 1
+
+    all_text = "".join(p[2] for p in page_map)
+    length = len(all_text)
+    start = 0
+    end = length
+    while start + doc_section_overlap < length:
+        last_word = -1
+        end = start + doc_max_section_length
+
+        if end > length:
+            end = length
+        else:
+            # Try to find the end of the sentence
+            while (
+                end < length
+                and (end - start - doc_max_section_length) < doc_sentence_search_limit
+                and all_text[end] not in SENTENCE_ENDINGS
+            ):
+                if all_text[end] in WORDS_BREAKS:
+                    last_word = end
+                end += 1
+            if end < length and all_text[end] not in SENTENCE_ENDINGS and last_word > 0:
+                end = last_word  # Fall back to at least keeping a whole word
+        if end < length:
+            end += 1
+
+        # Try to find the start of the sentence or at least a whole word boundary
+        last_word = -1
+        while (
+            start > 0
+            and start > end - doc_max_section_length - 2 * doc_sentence_search_limit
+            and all_text[start] not in SENTENCE_ENDINGS
+        ):
+            if all_text[start] in WORDS_BREAKS:
+                last_word = start
+            start -= 1
+        if all_text[start] not in SENTENCE_ENDINGS and last_word > 0:
+            start = last_word
+        if start > 0:
+            start += 1
+
+        section_text = all_text[start:end]
+        yield (section_text, find_page(start))
+
+        last_table_start = section_text.rfind("<table")
+        if (
+            last_table_start > 2 * doc_sentence_search_limit
+            and last_table_start > section_text.rfind("</table")
+        ):
+            start = min(end - doc_section_overlap, start + last_table_start)
+        else:
+            start = end - doc_section_overlap
+
+    if start + doc_section_overlap < end:
+        yield (all_text[start:end], find_page(start))
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [
+        "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(1, 12)))
+        for _ in range(rng.randint(3, 30))
+    ]
+    for i in range(len(words) - 1):
+        if rng.random() < 0.1:
+            words[i] += rng.choice(",;:")
+    return " ".join(words) + rng.choice("..!?")
+
+
+def _table(rng: random.Random) -> str:
+    rows = "".join(
+        "<tr>" + "".join(f"<td>{rng.randint(0, 999)}</td>" for _ in range(4)) + "</tr>"
+        for _ in range(rng.randint(2, 20))
+    )
+    return f"<table>{rows}</table>"
+
+
+def synthetic_pages(
+    pages: int, chars_per_page: int = CHARS_PER_PAGE, seed: int = 0
+) -> Iterator[Tuple[int, int, str]]:
+    """A book of prose with the odd table and empty page, streamed like an extractor."""
+    rng = random.Random(seed)
+    offset = 0
+    for page_num in range(pages):
+        parts: List[str] = []
+        size = 0
+        target = 0 if rng.random() < 0.02 else chars_per_page
+        while size < target:
+            part = _table(rng) if rng.random() < 0.03 else _sentence(rng)
+            parts.append(part)
+            size += len(part) + 1
+        text = " ".join(parts) + ("\n" if parts else "")
+        yield (page_num, offset, text)
+        offset += len(text)
+
+
+def synthetic_page_map(
+    pages: int, chars_per_page: int = CHARS_PER_PAGE, seed: int = 0
+) -> List[Tuple[int, int, str]]:
+    return list(synthetic_pages(pages, chars_per_page, seed))
+
+
+def _streaming_peak_bytes(pages: int, args: Tuple[int, int, int], seed: int) -> int:
+    """Peak memory allocated while splitting a book streamed page by page."""
+    tracemalloc.start()
+    try:
+        for _ in split_text(synthetic_pages(pages, seed=seed), *args):
+            pass
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _time(split, page_map, args, repeats: int) -> Tuple[float, List]:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        sections = list(split(page_map, *args))
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), sections
+
+
+def run(
+    pages: int = DEFAULT_PAGES,
+    max_section_length: int = 1000,
+    sentence_search_limit: int = 100,
+    section_overlap: int = 100,
+    repeats: int = 3,
+    seed: int = 0,
+) -> Dict:
+    """Time both splitters on one synthetic book and check they agree."""
+    page_map = synthetic_page_map(pages, seed=seed)
+    args = (max_section_length, sentence_search_limit, section_overlap)
+    reference_seconds, expected = _time(reference_split_text, page_map, args, repeats)
+    seconds, sections = _time(split_text, page_map, args, repeats)
+    return {
+        "pages": pages,
+        "characters": sum(len(page[2]) for page in page_map),
+        "sections": len(sections),
+        "identical": sections == expected,
+        "reference_seconds": reference_seconds,
+        "seconds": seconds,
+        "pages_per_second": pages / seconds if seconds > 0 else float("inf"),
+        "speedup": reference_seconds / seconds if seconds > 0 else float("inf"),
+        "streaming_peak_bytes": _streaming_peak_bytes(pages, args, seed),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.chunking",
+        description="Benchmark the section splitter on a synthetic book.",
+    )
+    parser.add_argument("--pages", type=int, default=DEFAULT_PAGES)
+    parser.add_argument("--max-section-length", type=int, default=1000)
+    parser.add_argument("--sentence-search-limit", type=int, default=100)
+    parser.add_argument("--section-overlap", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here, not stdout")
+    args = parser.parse_args(argv)
+
+    results = run(
+        pages=args.pages,
+        max_section_length=args.max_section_length,
+        sentence_search_limit=args.sentence_search_limit,
+        section_overlap=args.section_overlap,
+        repeats=args.repeats,
+        seed=args.seed,
+    )
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+        print(f"Results written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""Retrieval benchmarks for FAISSDS: build throughput, load time, search latency.
+
+Synthetic corpora are embedded with the deterministic StubProvider, so runs
+need no network and results only depend on the code and the host:
+
+    python -m benchmarks.retrieval --sizes 1000 100000 --output bench.json
+
+Every run writes one JSON document with the environment and one result per
+(size, index type, storage) combination.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, get_args
+
+import faiss
+import numpy as np
+
+from datasources import faiss_ds
+from datasources.embedding_providers import StubProvider
+from datasources.faiss_ds import FAISSDS, SearchMode, Storage
+from datasources.index_factory import IndexConfig, IndexType
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+DEFAULT_DIM = 256
+DEFAULT_QUERIES = 200
+VOCABULARY_SIZE = 20_000
+WORDS_PER_SECTION = 120
+
+
+def _vocabulary(seed: int) -> List[str]:
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return [
+        "".join(rng.choices(letters, k=rng.randint(3, 10)))
+        for _ in range(VOCABULARY_SIZE)
+    ]
+
+
+def synthetic_sections(n: int, seed: int = 0) -> Iterator[Dict]:
+    """n sections of Zipf-distributed words, generated lazily like real extraction."""
+    vocabulary = np.array(_vocabulary(seed))
+    cdf = np.cumsum(1 / np.arange(1, len(vocabulary) + 1))
+    cdf /= cdf[-1]
+    rng = np.random.default_rng(seed)
+    for i in range(n):
+        words = np.searchsorted(cdf, rng.random(WORDS_PER_SECTION))
+        text = " ".join(vocabulary[words].tolist())
+        yield {
+            "id": f"bench-{i}",
+            "search_key": text,
+            "content": text,
+            "file_url": f"bench/bench_{i // 100}.pdf#page={i % 100 + 1}",
+        }
+
+
+def _sample_queries(n_sections: int, n_queries: int, seed: int) -> List[str]:
+    # queries are sections of the corpus, regenerated instead of kept in memory
+    rng = random.Random(seed + 1)
+    wanted = set(rng.sample(range(n_sections), min(n_queries, n_sections)))
+    return [
+        section["search_key"]
+        for i, section in enumerate(synthetic_sections(n_sections, seed))
+        if i in wanted
+    ]
+
+
+def _rss_bytes() -> Optional[int]:
+    """Resident set size of this process, None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _dir_bytes(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path)
+        if os.path.isfile(os.path.join(path, name))
+    )
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def bench_create(
+    name: str, size: int, config: IndexConfig, dim: int, seed: int
+) -> Dict:
+    start = time.perf_counter()
+    info = FAISSDS.create(
+        synthetic_sections(size, seed),
+        name,
+        index_config=config,
+        provider=StubProvider(dim=dim),
+    )
+    elapsed = time.perf_counter() - start
+    report = info["report"]
+    return {
+        "seconds": elapsed,
+        "sections_per_second": size / elapsed if elapsed > 0 else float("inf"),
+        "index_bytes": report["index_bytes"],
+        "disk_bytes": _dir_bytes(os.path.join(faiss_ds.DATASOURCE_PATH, name)),
+        "recall": report["recall"],
+    }
+
+
+def bench_load(name: str, storage: Storage, repeats: int) -> Dict:
+    times = []
+    rss_delta = None
+    for i in range(repeats):
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        ds = FAISSDS(name, storage=storage)
+        times.append(time.perf_counter() - start)
+        rss_after = _rss_bytes()
+        if i == 0 and rss_before is not None and rss_after is not None:
+            rss_delta = rss_after - rss_before
+        nbytes = ds.nbytes
+        del ds
+    return {
+        "seconds_min": min(times),
+        "seconds_median": statistics.median(times),
+        "resident_bytes": nbytes,
+        "rss_delta_bytes": rss_delta,
+    }
+
+
+def bench_search(
+    name: str, storage: Storage, queries: List[str], topk: int, mode: SearchMode
+) -> Dict:
+    ds = FAISSDS(name, storage=storage)
+    # warm up the page cache and lazily built state
+    for query in queries[:10]:
+        ds.search_request(query, topk=topk, mode=mode)
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        ds.search_request(query, topk=topk, mode=mode)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "mode": mode,
+        "queries": len(queries),
+        "topk": topk,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "qps": len(latencies) / sum(latencies) if sum(latencies) > 0 else float("inf"),
+    }
+
+
+def run(
+    sizes: List[int],
+    index_types: List[IndexType],
+    storages: List[Storage],
+    modes: List[SearchMode],
+    dim: int = DEFAULT_DIM,
+    n_queries: int = DEFAULT_QUERIES,
+    topk: int = 5,
+    load_repeats: int = 3,
+    seed: int = 0,
+    workdir: Optional[str] = None,
+) -> Dict:
+    """Run every benchmark combination and return the machine-readable results."""
+    own_workdir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix="faissds-bench-")
+    previous_path = faiss_ds.DATASOURCE_PATH
+    faiss_ds.DATASOURCE_PATH = workdir
+    results = []
+    try:
+        for size in sizes:
+            queries = _sample_queries(size, n_queries, seed)
+            for index_type in index_types:
+                name = f"bench_{index_type}_{size}"
+                config = IndexConfig(index_type=index_type, eval_queries=50)
+                print(
+                    f"Building {index_type} index of {size} sections...",
+                    file=sys.stderr,
+                )
+                create = bench_create(name, size, config, dim, seed)
+                for storage in storages:
+                    results.append(
+                        {
+                            "size": size,
+                            "dim": dim,
+                            "index_type": index_type,
+                            "storage": storage,
+                            "create": create,
+                            "load": bench_load(name, storage, load_repeats),
+                            "search": [
+                                bench_search(name, storage, queries, topk, mode)
+                                for mode in modes
+                            ],
+                        }
+                    )
+                shutil.rmtree(os.path.join(workdir, name), ignore_errors=True)
+    finally:
+        faiss_ds.DATASOURCE_PATH = previous_path
+        if own_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "faiss": faiss.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embedding": StubProvider(dim=dim).describe(),
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.retrieval",
+        description="Benchmark FAISSDS build, load and search on synthetic corpora.",
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument(
+        "--index-types", nargs="+", choices=get_args(IndexType), default=["Flat"]
+    )
+    parser.add_argument(
+        "--storages", nargs="+", choices=get_args(Storage), default=["memory", "mmap"]
+    )
+    parser.add_argument(
+        "--modes", nargs="+", choices=get_args(SearchMode), default=["vector"]
+    )
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES)
+    parser.add_argument("--topk", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here, not stdout")
+    args = parser.parse_args(argv)
+
+    results = run(
+        sizes=args.sizes,
+        index_types=args.index_types,
+        storages=args.storages,
+        modes=args.modes,
+        dim=args.dim,
+        n_queries=args.queries,
+        topk=args.topk,
+        seed=args.seed,
+    )
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+        print(f"Results written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
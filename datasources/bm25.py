@@ -0,0 +1,258 @@
+import array
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .storage import map_npz
+
+BM25_NAME = "bm25.npz"
+
+# Only short queries made of rare terms (names, dates, acronyms) are answered
+# lexically without embedding them
+LEXICAL_MAX_TERMS = 4
+LEXICAL_MAX_DF_RATIO = 0.05
+
+# Longer "words" are hashes, URLs or extraction noise nobody searches for
+_MAX_TOKEN_LENGTH = 64
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        token
+        for token in _TOKEN_RE.findall(text.lower())
+        if len(token) <= _MAX_TOKEN_LENGTH
+    ]
+
+
+class BM25Index:
+    """An inverted index of section search keys scored with Okapi BM25.
+
+    Postings are stored in CSR form, one row per term, holding the metadata
+    row of each section containing the term and the term's precomputed BM25
+    weight in it, so scoring a query only sums the postings of its terms.
+    The sorted terms are packed back to back as UTF-8 in `term_bytes`, term i
+    spanning `term_offsets[i]:term_offsets[i + 1]`, and looked up by binary
+    search, so the vocabulary takes little more than its text.
+    """
+
+    def __init__(
+        self,
+        term_bytes: np.ndarray,
+        term_offsets: np.ndarray,
+        indptr: np.ndarray,
+        doc_ids: np.ndarray,
+        weights: np.ndarray,
+        num_docs: int,
+    ):
+        self.term_bytes = term_bytes
+        self.term_offsets = term_offsets
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.num_docs = num_docs
+
+    @property
+    def nbytes(self) -> int:
+        """Resident size in bytes, arrays mapped from the page cache not counted."""
+        arrays = [
+            self.term_bytes,
+            self.term_offsets,
+            self.indptr,
+            self.doc_ids,
+            self.weights,
+        ]
+        return sum(int(a.nbytes) for a in arrays if not isinstance(a, np.memmap))
+
+    def _term(self, row: int) -> bytes:
+        return self.term_bytes[
+            self.term_offsets[row] : self.term_offsets[row + 1]
+        ].tobytes()
+
+    def _row(self, term: str) -> Optional[int]:
+        # UTF-8 bytes sort in the same order as the strings they encode
+        key = term.encode("utf-8")
+        low, high = 0, len(self.term_offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.term_offsets) - 1 and self._term(low) == key:
+            return low
+        return None
+
+    def document_frequency(self, term: str) -> int:
+        row = self._row(term)
+        if row is None:
+            return 0
+        return int(self.indptr[row + 1] - self.indptr[row])
+
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Score the sections sharing a term with `query`.
+
+        Returns:
+            Tuple: the scores, metadata rows and fraction of the query terms
+                found, of the (at most) k best sections, best first.
+        """
+        query_terms = set(tokenize(query))
+        rows = [row for row in map(self._row, query_terms) if row is not None]
+        if not rows or k <= 0:
+            return (
+                np.empty(0, np.float32),
+                np.empty(0, np.int64),
+                np.empty(0, np.float32),
+            )
+
+        spans = [slice(self.indptr[row], self.indptr[row + 1]) for row in rows]
+        docs = np.concatenate([self.doc_ids[span] for span in spans])
+        weights = np.concatenate([self.weights[span] for span in spans])
+        unique_docs, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+        matched = np.bincount(inverse)
+
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return (
+            scores[top].astype(np.float32),
+            unique_docs[top].astype(np.int64),
+            (matched[top] / len(query_terms)).astype(np.float32),
+        )
+
+    def confident_search(
+        self,
+        query: str,
+        k: int,
+        max_terms: int = LEXICAL_MAX_TERMS,
+        max_df_ratio: float = LEXICAL_MAX_DF_RATIO,
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Lexical hits for queries that name something specific, None otherwise.
+
+        A query is answered only if it has at most `max_terms` terms, each of
+        them occurring in no more than `max_df_ratio` of the sections, and
+        only the sections containing every term are returned.
+        """
+        query_terms = set(tokenize(query))
+        if not query_terms or len(query_terms) > max_terms:
+            return None
+        max_df = max(1, int(max_df_ratio * self.num_docs))
+        for term in query_terms:
+            if not 0 < self.document_frequency(term) <= max_df:
+                return None
+
+        scores, rows, coverage = self.search(query, k)
+        complete = coverage == 1.0
+        if not complete.any():
+            return None
+        return scores[complete], rows[complete]
+
+    def save(self, path: str) -> None:
+        # np.savez appends .npz to names without it, so write through a file object
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                term_bytes=self.term_bytes,
+                term_offsets=self.term_offsets,
+                indptr=self.indptr,
+                doc_ids=self.doc_ids,
+                weights=self.weights,
+                num_docs=np.int64(self.num_docs),
+            )
+
+    @staticmethod
+    def load(path: str, mmap: bool = False) -> "BM25Index":
+        """Read an index, with its terms and postings mapped from the page cache if `mmap`."""
+        with np.load(path) as data:
+            if "terms" in data:
+                # written before the terms were packed, repack them in memory
+                term_bytes, term_offsets = _pack_terms(data["terms"].tolist())
+                arrays = {"term_bytes": term_bytes, "term_offsets": term_offsets}
+                arrays.update(
+                    (name, data[name]) for name in ["indptr", "doc_ids", "weights"]
+                )
+                mmap = False
+            elif not mmap:
+                arrays = {name: data[name] for name in data.files}
+            num_docs = int(data["num_docs"])
+        if mmap:
+            arrays = map_npz(path)
+        return BM25Index(
+            arrays["term_bytes"],
+            arrays["term_offsets"],
+            arrays["indptr"],
+            arrays["doc_ids"],
+            arrays["weights"],
+            num_docs,
+        )
+
+
+def _pack_terms(terms: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """The UTF-8 of sorted `terms` back to back, and where each one starts and ends."""
+    encoded = [term.encode("utf-8") for term in terms]
+    term_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(term) for term in encoded], out=term_offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), term_offsets
+
+
+class BM25Builder:
+    """Collects postings section by section, in metadata order."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> (metadata rows, term frequencies)
+        self._postings: Dict[str, Tuple[array.array, array.array]] = {}
+        self._doc_lengths = array.array("I")
+
+    def add(self, text: str) -> None:
+        doc = len(self._doc_lengths)
+        tokens = tokenize(text)
+        self._doc_lengths.append(len(tokens))
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, tf in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array.array("I"), array.array("I"))
+            postings[0].append(doc)
+            postings[1].append(tf)
+
+    def build(self) -> BM25Index:
+        num_docs = len(self._doc_lengths)
+        doc_lengths = np.frombuffer(self._doc_lengths, dtype=np.uint32).astype(
+            np.float32
+        )
+        avgdl = float(doc_lengths.mean()) if num_docs and doc_lengths.any() else 1.0
+        norms = self.k1 * (1 - self.b + self.b * doc_lengths / avgdl)
+
+        terms = sorted(self._postings)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        doc_ids = []
+        weights = []
+        for i, term in enumerate(terms):
+            docs = np.frombuffer(self._postings[term][0], dtype=np.uint32)
+            tfs = np.frombuffer(self._postings[term][1], dtype=np.uint32).astype(
+                np.float32
+            )
+            df = len(docs)
+            idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            doc_ids.append(docs.astype(np.int32))
+            weights.append((idf * tfs * (self.k1 + 1) / (tfs + norms[docs])))
+            indptr[i + 1] = indptr[i] + df
+
+        return BM25Index(
+            *_pack_terms(terms),
+            indptr,
+            np.concatenate(doc_ids) if doc_ids else np.empty(0, np.int32),
+            np.concatenate(weights).astype(np.float32)
+            if weights
+            else np.empty(0, np.float32),
+            num_docs,
+        )
@@ -0,0 +1,186 @@
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+SENTENCE_ENDINGS = ".!?"
+WORDS_BREAKS = ",;: ()[]{}\t\n"
+
+
+def _positions(codes: np.ndarray, chars: str) -> np.ndarray:
+    """Sorted offsets of every occurrence of any of the ASCII `chars` in the text."""
+    # a lookup table over ASCII, every other character maps to DEL, not wanted
+    table = np.zeros(128, dtype=bool)
+    table[[ord(c) for c in chars]] = True
+    return np.flatnonzero(table[np.minimum(codes, 127)])
+
+
+def _code_points(text: str) -> np.ndarray:
+    # one uint32 per character, so array offsets are string offsets
+    return np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+
+
+class PageLocator:
+    """Maps text offsets to the page they fall on by binary search."""
+
+    def __init__(self, page_offsets: Iterable[int] = ()):
+        self.page_offsets = list(page_offsets)
+        # pages forgotten by drop_before, counted in the returned page indexes
+        self.dropped = 0
+
+    def add(self, offset: int) -> None:
+        self.page_offsets.append(offset)
+
+    def drop_before(self, offset: int) -> None:
+        """Forget the pages that end before `offset`, no longer looked up."""
+        i = bisect_right(self.page_offsets, offset) - 1
+        if i > 0:
+            del self.page_offsets[:i]
+            self.dropped += i
+
+    def __call__(self, offset: int) -> int:
+        i = bisect_right(self.page_offsets, offset) - 1
+        # offsets before the first page fall on the last, as they always have
+        if i < 0:
+            i = len(self.page_offsets) - 1
+        return self.dropped + i
+
+
+class _TextWindow:
+    """The part of a document's text the splitter still needs, read page by page.
+
+    Positions are offsets in the whole text. Pages are only read once a
+    position past the window is needed, and `drop` releases the text before
+    a position along with the sentence endings and word breaks located in it.
+    """
+
+    def __init__(self, pages: Iterable[Tuple[int, int, str]]):
+        self._pages = iter(pages)
+        self.find_page = PageLocator()
+        self.text = ""
+        self.base = 0
+        self.exhausted = False
+        self.sentence_ends: List[int] = []
+        self.word_breaks: List[int] = []
+
+    def read_past(self, position: int) -> int:
+        """Read pages until the text extends past `position` or ends.
+
+        Returns:
+            int: the length of the text read so far, the whole text's length
+                once the pages are exhausted.
+        """
+        end = self.base + len(self.text)
+        texts = []
+        while end <= position and not self.exhausted:
+            page = next(self._pages, None)
+            if page is None:
+                self.exhausted = True
+                break
+            self.find_page.add(page[1])
+            codes = _code_points(page[2])
+            self.sentence_ends += (_positions(codes, SENTENCE_ENDINGS) + end).tolist()
+            self.word_breaks += (_positions(codes, WORDS_BREAKS) + end).tolist()
+            texts.append(page[2])
+            end += len(page[2])
+        if texts:
+            self.text = "".join([self.text, *texts])
+        return end
+
+    def slice(self, start: int, end: int) -> str:
+        return self.text[start - self.base : end - self.base]
+
+    def drop(self, position: int) -> None:
+        """Release the text before `position`, which is not needed anymore."""
+        dead = position - self.base
+        # only compact once most of the window is dead, so a page is copied
+        # a bounded number of times however many sections it holds
+        if dead <= len(self.text) // 2:
+            return
+        self.text = self.text[dead:]
+        self.base = position
+        del self.sentence_ends[: bisect_left(self.sentence_ends, position)]
+        del self.word_breaks[: bisect_left(self.word_breaks, position)]
+        self.find_page.drop_before(position)
+
+
+def split_text(
+    pages: Iterable[Tuple[int, int, str]],
+    max_section_length: int,
+    sentence_search_limit: int,
+    section_overlap: int,
+) -> Iterator[Tuple[str, int]]:
+    """Cut the text of a page map into overlapping sections.
+
+    Sections end after a sentence ending found within `sentence_search_limit`
+    characters past `max_section_length`, or at least on a word break, and
+    start on a sentence or word boundary found by searching backwards. An
+    unclosed <table> near the end of a section starts the next section.
+
+    Pages are consumed incrementally, so they can be streamed from an
+    extractor: only the text from the start of the current section's
+    backward search up to its forward search limit is kept. Sentence endings
+    and word breaks are located once per page and each boundary search is a
+    binary search over them.
+
+    Yields:
+        Tuple[str, int]: the text of each section and the index in `pages`
+            of the page it starts on.
+    """
+    window = _TextWindow(pages)
+    sentence_ends = window.sentence_ends
+    word_breaks = window.word_breaks
+
+    start = 0
+    while window.read_past(start + section_overlap) > start + section_overlap:
+        end = start + max_section_length
+        # with the text read one character past the search limit, every
+        # boundary below is decided as if the whole text was known
+        length = window.read_past(end + sentence_search_limit + 1)
+        if end > length:
+            end = length
+        else:
+            # the end of a sentence, searched up to the limit inclusive
+            limit = min(length, end + sentence_search_limit)
+            i = bisect_left(sentence_ends, end)
+            if i < len(sentence_ends) and sentence_ends[i] <= min(limit, length - 1):
+                end = sentence_ends[i]
+            else:
+                # or else the last word break before the limit
+                j = bisect_left(word_breaks, limit) - 1
+                if limit < length and j >= 0 and word_breaks[j] >= max(end, 1):
+                    end = word_breaks[j]
+                else:
+                    end = limit
+        if end < length:
+            end += 1
+
+        # the start of the sentence, or at least a whole word
+        floor = max(0, end - max_section_length - 2 * sentence_search_limit)
+        if start > floor:
+            i = bisect_right(sentence_ends, start) - 1
+            if i >= 0 and sentence_ends[i] >= floor:
+                start = sentence_ends[i]
+            else:
+                j = bisect_right(word_breaks, floor)
+                if j < len(word_breaks) and word_breaks[j] <= start:
+                    start = word_breaks[j]
+                else:
+                    start = floor
+        if start > 0:
+            start += 1
+
+        section_text = window.slice(start, end)
+        yield (section_text, window.find_page(start))
+
+        last_table_start = section_text.rfind("<table")
+        if (
+            last_table_start > 2 * sentence_search_limit
+            and last_table_start > section_text.rfind("</table")
+        ):
+            start = min(end - section_overlap, start + last_table_start)
+        else:
+            start = end - section_overlap
+
+        # the next section's backward search stops short of this
+        window.drop(max(0, start - max_section_length - 2 * sentence_search_limit))
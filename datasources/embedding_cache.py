@@ -0,0 +1,140 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Collapse all runs of whitespace, so trivially different queries share a key."""
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """A two-tier cache of embeddings: an in-process LRU in front of SQLite.
+
+    Vectors are keyed on the model name and the normalized text and stored
+    as raw float32 bytes. Pass `path=":memory:"` for a cache that does not
+    outlive the process.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_memory_entries: int = 10_000,
+        max_disk_entries: Optional[int] = 1_000_000,
+    ):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    vector BLOB NOT NULL
+                )
+                """
+            )
+        # rows on disk, an upper bound as puts replacing a row count it again
+        (self._disk_entries,) = self.conn.execute(
+            "SELECT COUNT(*) FROM embeddings"
+        ).fetchone()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode()).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        """Return the cached vector, or None on a miss. Vectors are read-only."""
+        key = self.key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+            row = self.conn.execute(
+                "SELECT vector FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            vector = np.frombuffer(row[0], dtype=np.float32)
+            self._remember(key, vector)
+            self.disk_hits += 1
+            return vector
+
+    def put(self, model: str, text: str, vector: np.ndarray) -> None:
+        key = self.key(model, text)
+        vector = np.array(vector, dtype=np.float32)
+        vector.flags.writeable = False
+        with self._lock:
+            self._remember(key, vector)
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                    (key, model, vector.tobytes()),
+                )
+                self._disk_entries += 1
+                self._prune()
+
+    def _prune(self) -> None:
+        # drop the oldest tenth once the table outgrows its cap, counting the
+        # rows only when the running count says it might have
+        if self.max_disk_entries is None or self._disk_entries <= self.max_disk_entries:
+            return
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count > self.max_disk_entries:
+            excess = count - self.max_disk_entries + self.max_disk_entries // 10
+            self.conn.execute(
+                """
+                DELETE FROM embeddings WHERE rowid IN (
+                    SELECT rowid FROM embeddings ORDER BY rowid ASC LIMIT ?
+                )
+                """,
+                (excess,),
+            )
+            count -= excess
+        self._disk_entries = count
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            with self.conn:
+                self.conn.execute("DELETE FROM embeddings")
+            self._disk_entries = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    def close(self) -> None:
+        self.conn.close()
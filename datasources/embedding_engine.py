@@ -0,0 +1,183 @@
+import asyncio
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import openai
+
+# Limits of the embeddings endpoint: inputs per request and tokens per request
+MAX_BATCH_SIZE = 2048
+MAX_BATCH_TOKENS = 300_000
+
+
+def estimate_tokens(text: str) -> int:
+    """A cheap upper estimate of the token count (BPE averages ~4 bytes/token)."""
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+def parse_reset(value: Optional[str]) -> float:
+    """Parse rate-limit reset durations such as "1s", "6m0s" or "120ms" into seconds."""
+    if not value:
+        return 0.0
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(
+        float(amount) * units[unit]
+        for amount, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    )
+
+
+class EmbeddingEngine:
+    """Embeds many texts with several token-budgeted requests in flight.
+
+    Texts are packed into batches bounded by both `max_batch_size` inputs and
+    `max_batch_tokens` estimated tokens. Up to `max_concurrency` batches are
+    sent at once through an async client; the x-ratelimit headers of every
+    response pause new requests before the token budget runs out, and 429s
+    back off exponentially (or for retry-after) across all workers.
+    Embeddings are returned in the order of the input texts, shortened to
+    `dimensions` by the API when given (text-embedding-3 models only).
+    """
+
+    def __init__(
+        self,
+        model: str = "text-embedding-ada-002",
+        max_batch_size: int = 1000,
+        max_batch_tokens: int = MAX_BATCH_TOKENS,
+        max_concurrency: int = 4,
+        max_retries: int = 6,
+        client_factory: Optional[Callable] = None,
+        dimensions: Optional[int] = None,
+    ):
+        self.model = model
+        self.dimensions = dimensions
+        self.max_batch_size = min(max_batch_size, MAX_BATCH_SIZE)
+        self.max_batch_tokens = min(max_batch_tokens, MAX_BATCH_TOKENS)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        # the engine does its own retries, so the client must not
+        self.client_factory = client_factory or (
+            lambda: openai.AsyncOpenAI(max_retries=0)
+        )
+
+        self._pause_until = 0.0
+        self._backoff = 1.0
+        self.stats: Dict = {
+            "requests": 0,
+            "texts": 0,
+            "tokens": 0,
+            "retries": 0,
+            "elapsed": 0.0,
+        }
+
+    def pack_batches(self, texts: List[str]) -> List[List[int]]:
+        """Group text positions into consecutive batches within both limits."""
+        batches: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if current and (
+                len(current) >= self.max_batch_size
+                or current_tokens + tokens > self.max_batch_tokens
+            ):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def embed(self, texts: List[str]) -> List[np.ndarray]:
+        """Synchronous wrapper around `embed_async`, usable inside a running loop."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.embed_async(texts))
+        # a loop is already running in this thread (e.g. the bot), use another one
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, self.embed_async(texts)).result()
+
+    async def embed_async(self, texts: List[str]) -> List[np.ndarray]:
+        texts = [text.replace("\n", " ") for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        start = time.perf_counter()
+
+        client = self.client_factory()
+        try:
+
+            async def run(batch: List[int]) -> None:
+                async with semaphore:
+                    vectors = await self._request(client, [texts[i] for i in batch])
+                for i, vector in zip(batch, vectors):
+                    results[i] = vector
+
+            await asyncio.gather(*(run(batch) for batch in self.pack_batches(texts)))
+        finally:
+            await client.close()
+
+        self.stats["elapsed"] += time.perf_counter() - start
+        return results  # type: ignore[return-value]
+
+    async def _request(self, client, batch_texts: List[str]) -> List[np.ndarray]:
+        tokens = sum(estimate_tokens(text) for text in batch_texts)
+        extra = {"dimensions": self.dimensions} if self.dimensions else {}
+        for attempt in range(self.max_retries + 1):
+            delay = self._pause_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            try:
+                raw = await client.embeddings.with_raw_response.create(
+                    input=batch_texts, model=self.model, **extra
+                )
+            except (
+                openai.RateLimitError,
+                openai.APIConnectionError,
+                openai.InternalServerError,
+            ) as e:
+                if attempt == self.max_retries:
+                    raise
+                self._back_off(getattr(e, "response", None))
+                continue
+
+            self._backoff = 1.0
+            self._respect_headers(raw.headers, tokens)
+            response = raw.parse()
+            self.stats["requests"] += 1
+            self.stats["texts"] += len(batch_texts)
+            self.stats["tokens"] += getattr(
+                getattr(response, "usage", None), "total_tokens", tokens
+            )
+            return [
+                np.array(data.embedding, dtype=np.float32) for data in response.data
+            ]
+        raise RuntimeError("unreachable")
+
+    def _back_off(self, response) -> None:
+        """Pause every worker after a 429, doubling the pause on repeated failures."""
+        self.stats["retries"] += 1
+        headers = getattr(response, "headers", None) or {}
+        if headers.get("retry-after-ms"):
+            delay = float(headers["retry-after-ms"]) / 1000
+        elif headers.get("retry-after"):
+            delay = float(headers["retry-after"])
+        else:
+            delay = self._backoff * (1 + random.random())
+            self._backoff = min(self._backoff * 2, 60.0)
+        self._pause_until = max(self._pause_until, time.monotonic() + delay)
+
+    def _respect_headers(self, headers, tokens: int) -> None:
+        """Hold new requests until reset when the next batch would exceed the budget."""
+        remaining = headers.get("x-ratelimit-remaining-tokens")
+        if remaining is not None and int(remaining) < tokens * self.max_concurrency:
+            reset = parse_reset(headers.get("x-ratelimit-reset-tokens"))
+            self._pause_until = max(self._pause_until, time.monotonic() + reset)
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        if remaining_requests is not None and int(remaining_requests) < 1:
+            reset = parse_reset(headers.get("x-ratelimit-reset-requests"))
+            self._pause_until = max(self._pause_until, time.monotonic() + reset)
@@ -0,0 +1,251 @@
+import functools
+import hashlib
+import math
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+import numpy as np
+import openai
+
+from .bm25 import tokenize
+from .embedding_engine import EmbeddingEngine
+
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY") or 4)
+# Model of the datasources created before providers were recorded
+LEGACY_OPENAI_MODEL = "text-embedding-ada-002"
+# Only these can return shortened embeddings through the `dimensions` parameter
+SHORTENABLE_OPENAI_MODELS = ("text-embedding-3-small", "text-embedding-3-large")
+
+
+@functools.lru_cache(maxsize=1)
+def openai_client() -> openai.OpenAI:
+    """The synchronous client shared by every OpenAI provider, created on first use."""
+    return openai.OpenAI()
+
+
+@functools.lru_cache(maxsize=65536)
+def _feature_hash(feature: str) -> int:
+    # stable across processes, unlike hash()
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class EmbeddingProvider(ABC):
+    """Turns texts into float32 vectors for the FAISS datasources.
+
+    `model` names the vector space: vectors of different models are never
+    compared, cached or stored under the same key. `describe()` is recorded
+    in the index directory and `get_provider(**description)` rebuilds an
+    equivalent provider to embed the queries of that datasource.
+    """
+
+    name = ""
+    # Whether vectors are worth keeping in the query cache and embedding store
+    cacheable = False
+
+    @property
+    @abstractmethod
+    def model(self) -> str:
+        """The name of the vector space texts are embedded into."""
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed a corpus, returning a (len(texts), dim) float32 matrix."""
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """Embed a few queries, where latency matters more than throughput."""
+        return self.embed(texts)
+
+    @property
+    def embed_chunk_size(self) -> int:
+        """The fewest texts per `embed()` call that keep the provider busy, 0 for any."""
+        return 0
+
+    def params(self) -> Dict:
+        return {}
+
+    def describe(self) -> Dict:
+        return {"provider": self.name, **self.params()}
+
+
+class OpenAIProvider(EmbeddingProvider):
+    """The OpenAI embeddings API, through the concurrent EmbeddingEngine for corpora.
+
+    `dimensions` asks text-embedding-3 models for shortened vectors, e.g. 256
+    or 512 instead of 1536, which shrinks the index and speeds up search
+    proportionally.
+    """
+
+    name = "openai"
+    cacheable = True
+
+    def __init__(
+        self,
+        model: str = LEGACY_OPENAI_MODEL,
+        dimensions: Optional[int] = None,
+        max_batch_size: int = 1000,
+        max_concurrency: int = EMBEDDING_CONCURRENCY,
+    ):
+        if dimensions is not None and model not in SHORTENABLE_OPENAI_MODELS:
+            raise ValueError(f"{model} does not support a custom output dimension")
+        self._model = model
+        self.dimensions = dimensions
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self._engine: Optional[EmbeddingEngine] = None
+
+    @property
+    def model(self) -> str:
+        # shortened vectors are a different space from the full ones
+        if self.dimensions:
+            return f"{self._model}@{self.dimensions}"
+        return self._model
+
+    @property
+    def _extra(self) -> Dict:
+        return {"dimensions": self.dimensions} if self.dimensions else {}
+
+    @property
+    def engine(self) -> EmbeddingEngine:
+        """The engine of every corpus embedded, so rate-limit pauses carry over.
+
+        Built on first use, after the batch size and concurrency were set.
+        """
+        if self._engine is None:
+            self._engine = EmbeddingEngine(
+                model=self._model,
+                max_batch_size=self.max_batch_size,
+                max_concurrency=self.max_concurrency,
+                dimensions=self.dimensions,
+            )
+        return self._engine
+
+    @property
+    def embed_chunk_size(self) -> int:
+        # a batch for every request in flight
+        return self.max_concurrency * self.max_batch_size
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return _stack(self.engine.embed(texts))
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        # a single request on the shared client, no event loop to spin up
+        response = openai_client().embeddings.create(
+            input=texts, model=self._model, **self._extra
+        )
+        return _stack(
+            [np.array(data.embedding, dtype=np.float32) for data in response.data]
+        )
+
+    def params(self) -> Dict:
+        return {"model": self._model, **self._extra}
+
+
+class HashingProvider(EmbeddingProvider):
+    """A CPU-local embedding: signed feature hashing of word unigrams and bigrams.
+
+    Needs no network or model files and embeds tens of thousands of sections
+    per second. Retrieval quality is lexical, close to TF-IDF, so it is meant
+    for offline development, load tests and benchmarks.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    @property
+    def model(self) -> str:
+        return f"hashing-{self.dim}"
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        tokens = tokenize(text)
+        counts: Dict[str, int] = {}
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            counts[feature] = counts.get(feature, 0) + 1
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, count in counts.items():
+            value = _feature_hash(feature)
+            sign = 1.0 if value >> 63 else -1.0
+            vector[value % self.dim] += sign * (1.0 + math.log(count))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return _stack([self._embed_one(text) for text in texts], self.dim)
+
+    def params(self) -> Dict:
+        return {"dim": self.dim}
+
+
+class StubProvider(EmbeddingProvider):
+    """Deterministic unit vectors seeded by each text, for tests and load tests.
+
+    Equal texts get equal vectors, any other pair is unrelated.
+    """
+
+    name = "stub"
+
+    def __init__(self, dim: int = 16):
+        self.dim = dim
+
+    @property
+    def model(self) -> str:
+        return f"stub-{self.dim}"
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(
+            hashlib.sha256(text.encode("utf-8")).digest()[:8], "little"
+        )
+        vector = np.random.default_rng(seed).standard_normal(self.dim)
+        return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return _stack([self._embed_one(text) for text in texts], self.dim)
+
+    def params(self) -> Dict:
+        return {"dim": self.dim}
+
+
+PROVIDERS = {
+    OpenAIProvider.name: OpenAIProvider,
+    HashingProvider.name: HashingProvider,
+    StubProvider.name: StubProvider,
+}
+
+
+def _stack(vectors: List[np.ndarray], dim: int = 0) -> np.ndarray:
+    if not vectors:
+        return np.empty((0, dim), dtype=np.float32)
+    return np.vstack(vectors).astype(np.float32, copy=False)
+
+
+def get_provider(provider: str = "openai", **params) -> EmbeddingProvider:
+    """Build a provider from its name and parameters, as recorded by `describe()`."""
+    if provider not in PROVIDERS:
+        raise ValueError(
+            f"Unknown embedding provider: {provider}, expected one of {list(PROVIDERS)}"
+        )
+    return PROVIDERS[provider](**params)
+
+
+def default_provider() -> EmbeddingProvider:
+    """The provider new datasources are created with, set by EMBEDDING_PROVIDER."""
+    name = os.getenv("EMBEDDING_PROVIDER") or "openai"
+    model = os.getenv("EMBEDDING_MODEL")
+    dimensions = os.getenv("EMBEDDING_DIMENSIONS")
+    if name == "openai":
+        return OpenAIProvider(
+            model=model or LEGACY_OPENAI_MODEL,
+            dimensions=int(dimensions) if dimensions else None,
+        )
+    return get_provider(name)
+
+
+def provider_from_info(description: Optional[Dict]) -> EmbeddingProvider:
+    """The provider a datasource was built with, from its recorded description."""
+    if not description:
+        return OpenAIProvider(model=LEGACY_OPENAI_MODEL)
+    return get_provider(**description)
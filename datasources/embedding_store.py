@@ -0,0 +1,200 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+import numpy as np
+
+# SQLite caps the number of parameters of a single statement
+_QUERY_BATCH = 500
+
+
+class EmbeddingStore:
+    """A persistent, content-addressed store of section embeddings.
+
+    Vectors are keyed on a hash of the model name and the exact text that was
+    embedded, so re-ingesting a datasource only embeds sections that changed.
+    Entries are never evicted on their own; `gc` drops those no datasource
+    refers to any more.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    vector BLOB NOT NULL
+                )
+                """
+            )
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """The stored vector of each text, None for the ones never embedded."""
+        keys = [self.key(model, text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for i in range(0, len(keys), _QUERY_BATCH):
+                batch = keys[i : i + _QUERY_BATCH]
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+
+            vectors = [found.get(key) for key in keys]
+            hits = sum(vector is not None for vector in vectors)
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(
+        self, model: str, texts: List[str], vectors: Iterable[np.ndarray]
+    ) -> None:
+        rows = [
+            (self.key(model, text), model, np.asarray(vector, np.float32).tobytes())
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def models(self) -> List[str]:
+        with self._lock:
+            return [
+                model
+                for (model,) in self.conn.execute(
+                    "SELECT DISTINCT model FROM embeddings"
+                )
+            ]
+
+    def gc(self, referenced: Set[str], dry_run: bool = False) -> int:
+        """Delete every entry whose key is not in `referenced`.
+
+        Returns:
+            int: the number of entries deleted, or that would be with `dry_run`.
+        """
+        with self._lock, self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS referenced (key TEXT)")
+            self.conn.execute("DELETE FROM referenced")
+            self.conn.executemany(
+                "INSERT INTO referenced (key) VALUES (?)", ((k,) for k in referenced)
+            )
+            condition = "key NOT IN (SELECT key FROM referenced)"
+            if dry_run:
+                (count,) = self.conn.execute(
+                    f"SELECT COUNT(*) FROM embeddings WHERE {condition}"
+                ).fetchone()
+            else:
+                count = self.conn.execute(
+                    f"DELETE FROM embeddings WHERE {condition}"
+                ).rowcount
+            self.conn.execute("DELETE FROM referenced")
+        if count and not dry_run and self.path != ":memory:":
+            self.conn.execute("VACUUM")
+        return count
+
+    def stats(self) -> Dict:
+        with self._lock:
+            (entries,) = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def _search_keys(datasource_path: str) -> Iterator[str]:
+    """The search key of every section of every datasource, including ones being written."""
+    if not os.path.isdir(datasource_path):
+        return
+    for name in sorted(os.listdir(datasource_path)):
+        index_dir = os.path.join(datasource_path, name)
+        for file_name in ["meta_data.jsonl", "meta_data.jsonl.tmp"]:
+            path = os.path.join(index_dir, file_name)
+            if not os.path.isfile(path):
+                continue
+            with open(path, "r") as fi:
+                for line in fi:
+                    if line.strip():
+                        yield json.loads(line)["search_key"]
+
+
+def referenced_keys(datasource_path: str, models: Iterable[str]) -> Set[str]:
+    """Store keys of every section in `datasource_path`, under each of `models`."""
+    models = list(models)
+    return {
+        EmbeddingStore.key(model, text)
+        for text in _search_keys(datasource_path)
+        for model in models
+    }
+
+
+def collect_garbage(
+    store: EmbeddingStore, datasource_path: str, dry_run: bool = False
+) -> Dict:
+    """Drop the stored embeddings of sections no datasource contains any more."""
+    referenced = referenced_keys(datasource_path, store.models())
+    removed = store.gc(referenced, dry_run=dry_run)
+    return {"removed": removed, "referenced": len(referenced), **store.stats()}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m datasources.embedding_store",
+        description="Maintain the store of section embeddings.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    gc = commands.add_parser(
+        "gc", help="delete embeddings no datasource refers to any more"
+    )
+    gc.add_argument(
+        "--store",
+        default=os.getenv("EMBEDDING_STORE_FILE") or "embedding_store.db",
+        help="path of the store (default: $EMBEDDING_STORE_FILE or embedding_store.db)",
+    )
+    gc.add_argument(
+        "--datasources", default="datasources", help="directory of the datasources"
+    )
+    gc.add_argument(
+        "--dry-run", action="store_true", help="only count what would be deleted"
+    )
+    args = parser.parse_args(argv)
+
+    store = EmbeddingStore(args.store)
+    try:
+        result = collect_garbage(store, args.datasources, dry_run=args.dry_run)
+    finally:
+        store.close()
+    verb = "Would remove" if args.dry_run else "Removed"
+    print(
+        f"{verb} {result['removed']} unreferenced embeddings, "
+        f"{result['entries']} entries in {args.store}."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+import json
+import os
+from typing import IO, Any, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+EXTRACTION_CACHE_DIR = "extraction_cache"
+
+
+class ExtractionCache:
+    """Extracted content of files, so re-ingesting unchanged files skips extraction.
+
+    Entries are keyed on the file content hash, the extraction method and the
+    extractor version, and stored as gzip-compressed JSON lines in a
+    directory of the datasource: the kind of extraction, then one line per
+    page, or the whole text or CSV rows. Pages are written and read back one
+    at a time, so caching does not hold a document's page map in memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        # keys looked up or stored through this instance
+        self.used: Set[str] = set()
+
+    @staticmethod
+    def key(content_hash: str, method: str, version: str, doc_slice: bool) -> str:
+        # sliced and whole documents are extracted differently
+        return hashlib.sha256(
+            f"{content_hash}\0{method}\0{version}\0{int(doc_slice)}".encode()
+        ).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.jsonl.gz")
+
+    def contains(self, key: str) -> bool:
+        """Whether an entry is stored for `key`, without opening it."""
+        if os.path.exists(self._entry_path(key)):
+            return True
+        self.used.add(key)
+        self.misses += 1
+        return False
+
+    def get(self, key: str) -> Optional[Tuple[str, Any]]:
+        """The cached extraction, None on a miss. Pages are read lazily."""
+        self.used.add(key)
+        try:
+            f = gzip.open(self._entry_path(key), "rt", encoding="utf-8")
+        except OSError:
+            self.misses += 1
+            return None
+        try:
+            kind = json.loads(f.readline())
+        except (OSError, ValueError):
+            f.close()
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if kind == "pages":
+            return kind, self._read_pages(f)
+        with f:
+            return kind, json.loads(f.readline())
+
+    @staticmethod
+    def _read_pages(f: IO[str]) -> Iterator[Tuple[int, int, str]]:
+        with f:
+            for line in f:
+                yield tuple(json.loads(line))
+
+    def record(self, key: str, extraction: Tuple[str, Any]) -> Tuple[str, Any]:
+        """Store an extraction, returning it to be used in its place.
+
+        Pages are written as they are consumed from the returned extraction
+        and the entry only appears once the last page went through.
+        """
+        kind, content = extraction
+        if kind == "pages":
+            return kind, self._record_pages(key, content)
+        with self._writer(key) as (f, publish):
+            f.write(json.dumps(kind) + "\n")
+            f.write(json.dumps(content) + "\n")
+            publish()
+        return extraction
+
+    def _record_pages(
+        self, key: str, pages: Iterable[Tuple[int, int, str]]
+    ) -> Iterator[Tuple[int, int, str]]:
+        with self._writer(key) as (f, publish):
+            f.write(json.dumps("pages") + "\n")
+            for page in pages:
+                f.write(json.dumps(page) + "\n")
+                yield page
+            publish()
+
+    def _writer(self, key: str) -> "_EntryWriter":
+        os.makedirs(self.path, exist_ok=True)
+        return _EntryWriter(self, key, self._entry_path(key))
+
+    def prune(self, keep: Iterable[str]) -> int:
+        """Delete every entry but the `keep` keys, returning how many were deleted."""
+        if not os.path.isdir(self.path):
+            return 0
+        keep_names = {f"{key}.jsonl.gz" for key in keep}
+        removed = 0
+        for name in os.listdir(self.path):
+            if name not in keep_names:
+                os.remove(os.path.join(self.path, name))
+                removed += 1
+        return removed
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stored": self.stored,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class _EntryWriter:
+    """Writes an entry beside its final path, swapped in by `publish()`.
+
+    An entry left unpublished, e.g. because its pages were not all consumed,
+    is deleted on exit.
+    """
+
+    def __init__(self, cache: ExtractionCache, key: str, path: str):
+        self.cache = cache
+        self.key = key
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.published = False
+
+    def __enter__(self):
+        self.file = gzip.open(self.tmp_path, "wt", encoding="utf-8")
+        return self.file, self.publish
+
+    def publish(self) -> None:
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+        self.published = True
+        self.cache.used.add(self.key)
+        self.cache.stored += 1
+
+    def __exit__(self, *exc) -> None:
+        if not self.published:
+            self.file.close()
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
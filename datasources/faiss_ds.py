@@ -1,60 +1,332 @@
+import functools
+import itertools
 import json
 import os
+import time
 from pathlib import Path
-from typing import Dict, Iterator, List
+from typing import Dict, Iterable, Iterator, List, Literal, Optional, cast
 
 import faiss
 import numpy as np
-import openai
 from faiss import read_index
 
+from .bm25 import BM25_NAME, BM25Builder, BM25Index
+from .embedding_cache import EmbeddingCache, normalize_text
+from .embedding_engine import estimate_tokens
+from .embedding_providers import (
+    EmbeddingProvider,
+    default_provider,
+    provider_from_info,
+)
+from .embedding_store import EmbeddingStore
+from .index_factory import (
+    IndexConfig,
+    evaluate_index,
+    exact_rerank,
+    has_native_ids,
+    new_index,
+    set_search_params,
+    supports_remove,
+    train_index,
+)
+from .ingest_job import IngestJob
+from .storage import (
+    MetaStore,
+    MetaStoreWriter,
+    MmapFlatIndex,
+    Records,
+    VectorSpill,
+    read_index_mmap,
+)
+
 DATASOURCE_PATH = "datasources"
+INDEX_INFO_NAME = "index_info.json"
+# Labels of the vectors of ID-mapped indexes, aligned with the metadata rows
+VECTOR_IDS_NAME = "vector_ids.npy"
+# float32 copies of quantized vectors, memory-mapped to rerank shortlists exactly
+RERANK_VECTORS_NAME = "rerank_vectors.npy"
+EMBEDDING_CACHE_FILE = os.getenv("EMBEDDING_CACHE_FILE") or "embedding_cache.db"
+EMBEDDING_STORE_FILE = os.getenv("EMBEDDING_STORE_FILE") or "embedding_store.db"
+# Sections embedded and indexed at a time by FAISSDS.create, at least as many
+# as the embedding provider has in flight at once
+CREATE_CHUNK_SIZE = 4000
 
-client = openai.OpenAI()
+# Vector candidates per query fused with the lexical ones in hybrid mode, and
+# the rank offset of reciprocal rank fusion
+HYBRID_CANDIDATES = 50
+RRF_K = 60
 
+# "memory" loads everything into the process, "mmap" serves the index vectors
+# and section records from the page cache so workers on one host share them
+Storage = Literal["memory", "mmap"]
 
-def get_embedding(text, model="text-embedding-ada-002"):
-    text = text.replace("\n", " ")
-    response = client.embeddings.create(input=[text], model=model)
-    embedding: List[float] = response.data[0].embedding
-    return np.array(embedding, dtype=np.float32)
+# "vector" embeds every query, "lexical" only uses BM25, "hybrid" fuses both
+# rankings and "auto" answers confident lexical matches without embedding
+SearchMode = Literal["vector", "lexical", "hybrid", "auto"]
 
 
-def get_embeddings(texts, model="text-embedding-ada-002", batch_size=1000):
-    embeddings = []
-    for i in range(0, len(texts), batch_size):
-        batch_texts = texts[i : i + batch_size]
-        batch_texts = [text.replace("\n", " ") for text in batch_texts]
-        response = client.embeddings.create(input=batch_texts, model=model)
-        batch_embeddings = [
-            np.array(data.embedding, dtype=np.float32) for data in response.data
-        ]
-        embeddings.extend(batch_embeddings)
-    return embeddings
+@functools.lru_cache(maxsize=1)
+def query_cache() -> EmbeddingCache:
+    """Where repeated questions are answered from instead of the embeddings API.
+
+    Opened on first use, so importing this module creates no database file.
+    """
+    return EmbeddingCache(EMBEDDING_CACHE_FILE)
+
+
+@functools.lru_cache(maxsize=1)
+def embedding_store() -> EmbeddingStore:
+    """Where sections already embedded by an earlier ingest are taken from.
+
+    Opened on first use, like `query_cache`.
+    """
+    return EmbeddingStore(EMBEDDING_STORE_FILE)
+
+
+def get_embedding(
+    text, provider: Optional[EmbeddingProvider] = None, use_cache=True
+) -> np.ndarray:
+    return get_query_embeddings([text], provider=provider, use_cache=use_cache)[0]
+
+
+def get_query_embeddings(
+    texts: List[str],
+    provider: Optional[EmbeddingProvider] = None,
+    use_cache=True,
+) -> np.ndarray:
+    """Embed several queries with at most one provider call.
+
+    Returns:
+        np.ndarray: a (len(texts), dim) float32 matrix, in the order of `texts`.
+    """
+    provider = provider or default_provider()
+    use_cache = use_cache and provider.cacheable
+    texts = [normalize_text(text) for text in texts]
+    vectors: Dict[str, np.ndarray] = {}
+    if use_cache:
+        for text in texts:
+            cached = query_cache().get(provider.model, text)
+            if cached is not None:
+                vectors[text] = cached
+
+    missing = list(dict.fromkeys(text for text in texts if text not in vectors))
+    if missing:
+        for text, vector in zip(missing, provider.embed_queries(missing)):
+            vectors[text] = vector
+            if use_cache:
+                query_cache().put(provider.model, text, vector)
+
+    return np.vstack([vectors[text] for text in texts])
+
+
+def get_embeddings(
+    texts, provider: Optional[EmbeddingProvider] = None, use_store=True
+) -> List[np.ndarray]:
+    """Embed many texts, e.g. with token-budgeted batches sent concurrently.
+
+    Texts found in the embedding store are not sent again, and the ones that
+    are embedded are added to it.
+
+    Returns:
+        List[np.ndarray]: one float32 vector per text, in the order of `texts`.
+    """
+    provider = provider or default_provider()
+    use_store = use_store and provider.cacheable
+    texts = list(texts)
+    vectors: List[Optional[np.ndarray]]
+    if use_store:
+        vectors = embedding_store().get_many(provider.model, texts)
+    else:
+        vectors = [None] * len(texts)
+
+    missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+    if missing:
+        embedded = dict(zip(missing, provider.embed(missing)))
+        if use_store:
+            embedding_store().put_many(provider.model, missing, embedded.values())
+        vectors = [embedded[t] if v is None else v for t, v in zip(texts, vectors)]
+    # every text has its vector by now
+    return cast(List[np.ndarray], vectors)
+
+
+@functools.lru_cache(maxsize=4096)
+def _public_file_url(file_loc: str) -> str:
+    """Map a stored "<datasource>/<file>#page=n" location to its served URL."""
+    parts = file_loc.split("/")
+    ds_name = parts[0] if len(parts) > 0 else ""
+    filename = parts[1] if len(parts) > 1 else ""
+    return f"/datasource/{ds_name}/{filename}"
+
+
+def read_index_info(index_dir: str) -> Dict:
+    """Read how a datasource's index was built, {} for datasources predating it."""
+    path = os.path.join(index_dir, INDEX_INFO_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_index_info(index_dir: str, info: Dict) -> None:
+    path = os.path.join(index_dir, INDEX_INFO_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(info, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def read_vector_ids(index_dir: str, mmap_mode=None) -> Optional[np.ndarray]:
+    """The label of each metadata row, None when labels are the row numbers."""
+    path = os.path.join(index_dir, VECTOR_IDS_NAME)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode=mmap_mode)
+
+
+def read_rerank_vectors(index_dir: str) -> Optional[np.ndarray]:
+    """The memory-mapped float32 vectors kept for exact reranking, if any."""
+    path = os.path.join(index_dir, RERANK_VECTORS_NAME)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r")
+
+
+def _write_vectors(path: str, vectors: np.ndarray, chunk_size: int) -> None:
+    # copied chunk by chunk, so memory-mapped inputs are never fully resident
+    out = np.lib.format.open_memmap(
+        path, mode="w+", dtype=np.float32, shape=vectors.shape
+    )
+    for i in range(0, vectors.shape[0], chunk_size):
+        out[i : i + chunk_size] = vectors[i : i + chunk_size]
+    out.flush()
+    del out
+
+
+def _file_of(record: Dict) -> str:
+    """The uploaded file name a section was cut from, from "<datasource>/<file>#page=n"."""
+    return record.get("file_url", "").split("#")[0].split("/", 1)[-1]
+
+
+def _chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def _reciprocal_rank_fusion(rankings: List[np.ndarray], k: int):
+    """Fuse rankings of metadata rows by summing 1 / (RRF_K + rank) per row.
+
+    Returns:
+        Tuple: the fused scores and rows of the k best rows, best first.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking.tolist()):
+            if row != -1:
+                fused[row] = fused.get(row, 0.0) + 1.0 / (RRF_K + rank + 1)
+    best = sorted(fused.items(), key=lambda item: -item[1])[:k]
+    return (
+        np.array([score for _, score in best], dtype=np.float32),
+        np.array([row for row, _ in best], dtype=np.int64),
+    )
+
+
+def datasource_files(index_name: str) -> List[str]:
+    """Paths of the files a FAISSDS reads when loading `index_name`."""
+    index_dir = os.path.join(DATASOURCE_PATH, index_name)
+    return [
+        os.path.join(index_dir, "faiss.index"),
+        os.path.join(index_dir, "meta_data.jsonl"),
+        os.path.join(index_dir, BM25_NAME),
+        os.path.join(index_dir, INDEX_INFO_NAME),
+        os.path.join(index_dir, VECTOR_IDS_NAME),
+        os.path.join(index_dir, RERANK_VECTORS_NAME),
+    ]
 
 
 class FAISSDS:
     """A datasource model that uses FAISS as a vector store with OpenAI embeddings."""
 
-    def __init__(self, index_name):
+    def __init__(self, index_name, storage: Storage = "memory"):
         super().__init__()
         self.index_name = index_name
-        self.documents = []
-        self.index = None
+        self.storage = storage
+        self.documents: Records = []
+
+        self.info = read_index_info(self.index_dir)
+        # Queries are embedded the way the sections were
+        self.provider = provider_from_info(self.info.get("embedding"))
+        self.vector_ids = read_vector_ids(
+            self.index_dir, mmap_mode="r" if storage == "mmap" else None
+        )
+
+        if storage == "mmap":
+            # Records are read on demand from the offset-indexed store
+            self.documents = MetaStore.from_jsonl(self.index_dir, self.meta_path)
+            self.index = read_index_mmap(self.index_path)
+        else:
+            # Read the documents from data.jsonl
+            with open(self.meta_path, "r") as fi:
+                self.documents = [json.loads(line) for line in fi]
+
+            # Load the FAISS index
+            self.index = read_index(self.index_path)
+
+        self.set_search_params(**self.info.get("search_params", {}))
+
+        # Shortlists of quantized indexes are rescored against these, read from
+        # the page cache in both storage modes
+        self.rerank_factor = int(self.info.get("rerank_factor", 0))
+        self.rerank_vectors = None
+        if self.rerank_factor > 0:
+            self.rerank_vectors = read_rerank_vectors(self.index_dir)
 
-        # Read the documents from data.jsonl
-        json_name = "meta_data.jsonl"
-        jsonpath = os.path.join(DATASOURCE_PATH, self.index_name, json_name)
+        # Datasources created before the lexical index have none
+        bm25_path = os.path.join(self.index_dir, BM25_NAME)
+        self.bm25 = (
+            BM25Index.load(bm25_path, mmap=storage == "mmap")
+            if os.path.exists(bm25_path)
+            else None
+        )
 
-        with open(jsonpath, "r") as fi:
-            self.documents = [json.loads(line) for line in fi]
+    @property
+    def index_dir(self) -> str:
+        return os.path.join(DATASOURCE_PATH, self.index_name)
 
-        # Load the FAISS index
-        index_name = "faiss.index"
-        index_path = os.path.join(DATASOURCE_PATH, self.index_name, index_name)
-        self.index = read_index(index_path)
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.index_dir, "faiss.index")
 
-    def search_request(self, search_query: str, topk: int, skip: int = 0) -> List[Dict]:
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.index_dir, "meta_data.jsonl")
+
+    def files(self) -> List[str]:
+        """The on-disk files this datasource was loaded from."""
+        return datasource_files(self.index_name)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate resident size of the loaded index and documents, in bytes.
+
+        Memory-mapped vectors and records live in the shared page cache and are
+        not counted, the rerank vectors are mapped in both storage modes.
+        """
+        if isinstance(self.documents, MetaStore):
+            nbytes = self.documents.nbytes
+            if not isinstance(self.index, MmapFlatIndex):
+                nbytes += os.path.getsize(self.index_path)
+            if self.bm25 is not None:
+                nbytes += self.bm25.nbytes
+            return nbytes
+        return sum(
+            os.path.getsize(path)
+            for path in self.files()
+            if os.path.exists(path) and os.path.basename(path) != RERANK_VECTORS_NAME
+        )
+
+    def search_request(
+        self, search_query: str, topk: int, skip: int = 0, mode: SearchMode = "vector"
+    ) -> List[Dict]:
         """
         Perform FAISS Similarity Search and return the top k vectors that match the query.
 
@@ -62,80 +334,474 @@ class FAISSDS:
             search_query (str): The search query.
             topk (int): The number of top most similar vectors to retrieve.
             skip (int): Number of initial results to skip.
+            mode (SearchMode): How to rank the sections, see `search_many`.
 
         Returns:
             List[Dict]: The search results with the top k vectors.
         """
-        query_embedding = get_embedding(search_query)
-        vector = np.array(
-            [query_embedding], dtype=np.float32
-        )  # FAISS expects a 2D array
-        scores, indices = self.index.search(vector, topk + skip)
-        hits = []
+        return self.search_many([search_query], topk=topk, skip=skip, mode=mode)[0]
+
+    def search_many(
+        self,
+        search_queries: List[str],
+        topk: int,
+        skip: int = 0,
+        mode: SearchMode = "vector",
+    ) -> List[List[Dict]]:
+        """
+        Perform FAISS Similarity Search for several queries at once.
 
-        for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-            if i < skip:
-                continue
+        All queries are embedded in a single request and searched with one
+        `index.search` call over the stacked query matrix.
 
-            if idx == -1:
-                continue  # When not enough docs are returned
+        With `mode="lexical"` sections are ranked by BM25 alone and nothing is
+        embedded. `mode="auto"` answers short queries of rare terms (names,
+        dates, acronyms) lexically and embeds only the other queries.
+        `mode="hybrid"` fuses the vector and BM25 rankings with reciprocal
+        rank fusion. Datasources without a lexical index fall back to vector
+        search, except in lexical mode.
 
-            result = self.documents[idx]
+        Args:
+            search_queries (List[str]): The search queries.
+            topk (int): The number of top most similar vectors to retrieve per query.
+            skip (int): Number of initial results to skip per query.
+            mode (SearchMode): "vector", "lexical", "hybrid" or "auto".
 
-            # Process file URL
-            file_loc = result.get("file_url", "")
-            parts = file_loc.split("/")
-            ds_name = parts[0] if len(parts) > 0 else ""
-            filename = parts[1] if len(parts) > 1 else ""
-            file_url = f"/datasource/{ds_name}/{filename}"
-
-            hit = {
-                "id": result["id"],
-                "search_key": result["search_key"],
-                "content": result["content"],
-                "file_url": str(file_url),
-                "score": float(score),
-            }
-            hits.append(hit)
+        Returns:
+            List[List[Dict]]: The search results of each query, in query order.
+        """
+        if mode not in ("vector", "lexical", "hybrid", "auto"):
+            raise ValueError(f"Unknown search mode: {mode}")
+        if not search_queries:
+            return []
+        bm25 = self.bm25
+        if bm25 is None:
+            if mode == "lexical":
+                raise ValueError(
+                    f"{self.index_name} has no lexical index, recreate it to search lexically."
+                )
+            mode = "vector"
+
+        k = topk + skip
+        results: List[Optional[List[Dict]]] = [None] * len(search_queries)
+        pending = []
+        for i, query in enumerate(search_queries):
+            lexical = None
+            if bm25 is not None and mode == "lexical":
+                lexical = bm25.search(query, k)[:2]
+            elif bm25 is not None and mode == "auto":
+                lexical = bm25.confident_search(query, k)
+            if lexical is not None:
+                results[i] = self._make_hits(lexical[0][skip:], lexical[1][skip:])
+            else:
+                pending.append(i)
+        if not pending:
+            return results  # type: ignore[return-value]
 
+        vectors = get_query_embeddings(
+            [search_queries[i] for i in pending], provider=self.provider
+        )
+        if bm25 is not None and mode == "hybrid":
+            n = max(k, HYBRID_CANDIDATES)
+            _, vector_rows = self._vector_search(vectors, n)
+            for i, row_indices in zip(pending, vector_rows):
+                lexical_rows = bm25.search(search_queries[i], n)[1]
+                scores, indices = _reciprocal_rank_fusion(
+                    [row_indices, lexical_rows], k
+                )
+                results[i] = self._make_hits(scores[skip:], indices[skip:])
+        else:
+            for i, hits in zip(pending, self.search_vectors(vectors, topk, skip)):
+                results[i] = hits
+        return results  # type: ignore[return-value]
+
+    def search_vectors(
+        self, vectors: np.ndarray, topk: int, skip: int = 0
+    ) -> List[List[Dict]]:
+        """
+        Search with query vectors embedded beforehand by `self.provider`.
+
+        Args:
+            vectors (np.ndarray): A (n, dim) float32 matrix of query vectors.
+            topk (int): The number of top most similar vectors to retrieve per query.
+            skip (int): Number of initial results to skip per query.
+
+        Returns:
+            List[List[Dict]]: The search results of each query vector.
+        """
+        scores, indices = self._vector_search(vectors, topk + skip)
+        return [
+            self._make_hits(row_scores[skip:], row_indices[skip:])
+            for row_scores, row_indices in zip(scores, indices)
+        ]
+
+    def _vector_search(self, vectors: np.ndarray, k: int):
+        rerank_vectors = self.rerank_vectors
+        scores, indices = self.index.search(
+            vectors, k * self.rerank_factor if rerank_vectors is not None else k
+        )
+        if self.vector_ids is not None:
+            # ID-mapped labels are sorted in metadata order
+            rows = np.searchsorted(self.vector_ids, indices)
+            indices = np.where(indices == -1, -1, rows)
+        if rerank_vectors is not None:
+            scores, indices = exact_rerank(vectors, indices, rerank_vectors, k)
+        return scores, indices
+
+    def _make_hits(self, scores: np.ndarray, indices: np.ndarray) -> List[Dict]:
+        # -1 marks slots left empty when there are fewer than k documents
+        valid = indices != -1
+        hits = []
+        for score, idx in zip(scores[valid].tolist(), indices[valid].tolist()):
+            result = self.documents[idx]
+            hits.append(
+                {
+                    "id": result["id"],
+                    "search_key": result["search_key"],
+                    "content": result["content"],
+                    "file_url": _public_file_url(result.get("file_url", "")),
+                    "score": score,
+                }
+            )
         return hits
 
+    def set_search_params(
+        self, nprobe: Optional[int] = None, ef_search: Optional[int] = None
+    ) -> None:
+        """Trade recall for latency on IVF (`nprobe`) and HNSW (`ef_search`) indexes."""
+        set_search_params(self.index, nprobe=nprobe, ef_search=ef_search)
+
     @staticmethod
-    def create(section: Iterator[Dict], index_name) -> Dict:
+    def create(
+        section: Iterator[Dict],
+        index_name,
+        index_config: Optional[IndexConfig] = None,
+        chunk_size: Optional[int] = None,
+        provider: Optional[EmbeddingProvider] = None,
+        checkpoint: Optional[IngestJob] = None,
+    ) -> Dict:
         """
         Create a FAISS index from sections.
 
+        Sections are consumed `chunk_size` at a time: each chunk is embedded,
+        written to the metadata files and added to the index before the next
+        one is read, so memory use does not grow with the corpus beyond the
+        index itself. Indexes that need training are filled once every chunk
+        has been embedded, from vectors spilled to disk.
+
         Args:
             section (Iterator[Dict]): An iterator of section dictionaries.
+            index_config (Optional[IndexConfig]): The type of index to build,
+                an exact flat index by default.
+            chunk_size (Optional[int]): Number of sections embedded and added
+                at a time, CREATE_CHUNK_SIZE or enough to fill every request
+                the provider has in flight by default.
+            provider (Optional[EmbeddingProvider]): How sections and, later,
+                queries are embedded, `default_provider()` if not given. It
+                is recorded in index_info.json.
+            checkpoint (Optional[IngestJob]): The ingest job every embedded
+                chunk is checkpointed to, and replayed from when a previous
+                run of the job was interrupted.
 
         Returns:
-            Dict: A dictionary containing index creation info, e.g., {"index_name": index_name}
+            Dict: A dictionary containing index creation info, e.g.,
+                {"index_name": index_name, "report": {...}} where the report
+                holds the embedding and build times, size, recall@k and QPS
+                of the index.
         """
-        sections = list(section)
-        keys = [entry["search_key"] for entry in sections]
+        index_config = index_config or IndexConfig()
+        provider = provider or default_provider()
+        chunk_size = chunk_size or max(CREATE_CHUNK_SIZE, provider.embed_chunk_size)
 
         # Create directory for the index
         index_dir = Path(DATASOURCE_PATH) / index_name
         index_dir.mkdir(parents=True, exist_ok=True)
 
-        # Save documents to data.jsonl
+        # Every file is written beside the current one and only swapped in once
+        # the whole index has been built, so a failed run keeps the old datasource
+        index_path = index_dir / "faiss.index"
         data_jsonl_path = index_dir / "meta_data.jsonl"
-        with open(data_jsonl_path, "w") as f:
-            for entry in sections:
-                json.dump(entry, f)
-                f.write("\n")
+        bm25_path = index_dir / BM25_NAME
+        rerank_path = index_dir / RERANK_VECTORS_NAME
+        tmp_paths = [
+            f"{index_path}.tmp",
+            f"{data_jsonl_path}.tmp",
+            f"{bm25_path}.tmp",
+            f"{rerank_path}.tmp",
+        ]
 
-        # Generate embeddings using OpenAI embeddings (batched)
-        embeddings = get_embeddings(keys)
-        embeddings = np.vstack(embeddings)
+        faiss_index = None
+        factory = ""
+        add_time = 0.0
+        embed_time = 0.0
+        embed_tokens = 0
+        spill = VectorSpill(str(index_dir / "vectors.tmp"))
+        meta = MetaStoreWriter(str(index_dir))
+        bm25 = BM25Builder()
+        try:
+            # Save documents to data.jsonl and the offset-indexed store for mmap
+            with meta, open(f"{data_jsonl_path}.tmp", "w") as f:
+                for chunk in _chunked(section, chunk_size):
+                    texts = [entry["search_key"] for entry in chunk]
+                    start = time.perf_counter()
+                    embeddings = checkpoint.replay(texts) if checkpoint else None
+                    if embeddings is None:
+                        # Generate embeddings using OpenAI embeddings (batched)
+                        embeddings = np.vstack(get_embeddings(texts, provider))
+                        embed_tokens += sum(estimate_tokens(text) for text in texts)
+                        if checkpoint is not None:
+                            checkpoint.checkpoint(texts, embeddings)
+                    embed_time += time.perf_counter() - start
+                    for entry in chunk:
+                        json.dump(entry, f)
+                        f.write("\n")
+                        meta.append(entry)
+                        bm25.add(entry["search_key"])
+                    spill.append(embeddings)
 
-        # Create FAISS index
-        embedding_dim = embeddings.shape[1]
-        faiss_index = faiss.IndexFlatIP(embedding_dim)
-        faiss_index.add(embeddings)
+                    if index_config.requires_training:
+                        continue
+                    if faiss_index is None:
+                        faiss_index, factory = new_index(
+                            embeddings.shape[1], 0, index_config
+                        )
+                    start = time.perf_counter()
+                    faiss_index.add(embeddings)
+                    add_time += time.perf_counter() - start
 
-        # Save the FAISS index
-        index_path = index_dir / "faiss.index"
-        faiss.write_index(faiss_index, str(index_path))
+            streamed_add_time = add_time
+            build_start = time.perf_counter()
+            vectors = spill.open()
+            if vectors.shape[0] == 0:
+                raise ValueError(f"No sections to index for {index_name}.")
+
+            # Create FAISS index
+            train_time = 0.0
+            if faiss_index is None:
+                faiss_index, factory = new_index(
+                    vectors.shape[1], vectors.shape[0], index_config
+                )
+                train_time = train_index(faiss_index, vectors, index_config)
+                start = time.perf_counter()
+                for i in range(0, vectors.shape[0], chunk_size):
+                    faiss_index.add(np.ascontiguousarray(vectors[i : i + chunk_size]))
+                add_time = time.perf_counter() - start
+            set_search_params(faiss_index, **index_config.search_params())
+
+            # Save the FAISS index and the lexical index next to it
+            faiss.write_index(faiss_index, f"{index_path}.tmp")
+            bm25.build().save(f"{bm25_path}.tmp")
+
+            search = None
+            factor = index_config.rerank_factor
+            if factor > 0:
+                _write_vectors(f"{rerank_path}.tmp", vectors, chunk_size)
+
+                def search(queries, k):
+                    _, rows = faiss_index.search(queries, k * factor)
+                    return exact_rerank(queries, rows, vectors, k)
+
+            # Record how the index was built, its size against a float32 flat
+            # index and how well it searches
+            index_bytes = os.path.getsize(f"{index_path}.tmp")
+            flat_bytes = vectors.shape[0] * vectors.shape[1] * 4
+            report = {
+                "index_type": index_config.index_type,
+                "encoding": index_config.encoding,
+                "pca_dim": index_config.pca_dim,
+                "rerank_factor": factor,
+                "factory": factory,
+                "ntotal": int(faiss_index.ntotal),
+                "dim": int(vectors.shape[1]),
+                "train_time": train_time,
+                "add_time": add_time,
+                "embed_time": embed_time,
+                "embed_tokens": embed_tokens,
+                "index_bytes": index_bytes,
+                "flat_bytes": flat_bytes,
+                "memory_saving": 1 - index_bytes / flat_bytes,
+                **evaluate_index(faiss_index, vectors, index_config, search=search),
+            }
+
+            # training, adding, evaluating and writing, past the embedding
+            report["build_time"] = streamed_add_time + time.perf_counter() - build_start
+
+            # Published in dependency order: the id map and index_info.json
+            # describe the index, so they go first; the store is never older
+            # than the JSONL, which goes last. A datasource loaded before is
+            # reloaded once the JSONL changed and then sees every new file,
+            # and an ingest interrupted in between publishes them all again.
+            vector_ids_path = index_dir / VECTOR_IDS_NAME
+            if vector_ids_path.exists():
+                # a fresh index is labelled by row number again
+                vector_ids_path.unlink()
+            write_index_info(
+                str(index_dir),
+                {
+                    "embedding": provider.describe(),
+                    "search_params": index_config.search_params(),
+                    "rerank_factor": index_config.rerank_factor,
+                    "report": report,
+                },
+            )
+            os.replace(f"{index_path}.tmp", index_path)
+            os.replace(f"{bm25_path}.tmp", bm25_path)
+            if factor > 0:
+                os.replace(f"{rerank_path}.tmp", rerank_path)
+            elif rerank_path.exists():
+                rerank_path.unlink()
+            meta.publish()
+            os.replace(f"{data_jsonl_path}.tmp", data_jsonl_path)
+        except BaseException:
+            meta.discard()
+            for path in tmp_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        finally:
+            spill.remove()
+
+        return {"index_name": index_name, "report": report}
+
+    @staticmethod
+    def append(section: Iterator[Dict], index_name) -> Dict:
+        """
+        Embed sections and add them to an existing FAISS index, with the
+        embedding provider the index was created with.
+
+        IVF indexes get fresh labels past the largest one in use, other
+        index types label vectors by row number.
+
+        Args:
+            section (Iterator[Dict]): An iterator of section dictionaries.
+
+        Returns:
+            Dict: {"index_name": index_name, "added": number of sections added}
+        """
+        sections = list(section)
+        index_dir = os.path.join(DATASOURCE_PATH, index_name)
+        if not sections:
+            return {"index_name": index_name, "added": 0}
+
+        index = read_index(os.path.join(index_dir, "faiss.index"))
+        vector_ids = read_vector_ids(index_dir)
+        provider = provider_from_info(read_index_info(index_dir).get("embedding"))
+
+        embeddings = np.vstack(
+            get_embeddings([entry["search_key"] for entry in sections], provider)
+        )
+        if embeddings.shape[1] != index.d:
+            raise ValueError(
+                f"{provider.model} embeddings have {embeddings.shape[1]} dimensions, "
+                f"the index of {index_name} has {index.d}."
+            )
+        if has_native_ids(index):
+            if vector_ids is None:
+                vector_ids = np.arange(index.ntotal, dtype=np.int64)
+            next_id = int(vector_ids[-1]) + 1 if len(vector_ids) else 0
+            new_ids = np.arange(next_id, next_id + len(sections), dtype=np.int64)
+            index.add_with_ids(embeddings, new_ids)
+            vector_ids = np.concatenate([vector_ids, new_ids])
+        else:
+            index.add(embeddings)
+        rerank_vectors = read_rerank_vectors(index_dir)
+        if rerank_vectors is not None:
+            rerank_vectors = np.concatenate([rerank_vectors, embeddings])
+
+        def records():
+            with open(os.path.join(index_dir, "meta_data.jsonl"), "r") as fi:
+                for line in fi:
+                    yield json.loads(line)
+            yield from sections
+
+        _publish_update(index_dir, index, records(), vector_ids, rerank_vectors)
+        return {"index_name": index_name, "added": len(sections)}
+
+    @staticmethod
+    def remove_files(index_name, file_names: List[str]) -> Dict:
+        """
+        Remove every section cut from the given uploaded files.
+
+        Args:
+            file_names (List[str]): Names of the files, as stored in the
+                sections' file_url.
+
+        Returns:
+            Dict: {"index_name": index_name, "removed": number of sections removed}
+        """
+        index_dir = os.path.join(DATASOURCE_PATH, index_name)
+        names = set(file_names)
+        with open(os.path.join(index_dir, "meta_data.jsonl"), "r") as fi:
+            records = [json.loads(line) for line in fi]
+        remove = np.array([_file_of(record) in names for record in records], dtype=bool)
+        if not remove.any():
+            return {"index_name": index_name, "removed": 0}
+
+        index = read_index(os.path.join(index_dir, "faiss.index"))
+        if not supports_remove(index):
+            raise ValueError(
+                f"The index of {index_name} cannot remove vectors, recreate it instead."
+            )
+
+        vector_ids = read_vector_ids(index_dir)
+        if has_native_ids(index):
+            if vector_ids is None:
+                vector_ids = np.arange(index.ntotal, dtype=np.int64)
+            index.remove_ids(vector_ids[remove])
+            vector_ids = vector_ids[~remove]
+        else:
+            # flat indexes compact in order, so rows stay aligned with the metadata
+            index.remove_ids(np.flatnonzero(remove).astype(np.int64))
+
+        rerank_vectors = read_rerank_vectors(index_dir)
+        if rerank_vectors is not None:
+            rerank_vectors = rerank_vectors[~remove]
+
+        kept = (record for record, drop in zip(records, remove) if not drop)
+        _publish_update(index_dir, index, kept, vector_ids, rerank_vectors)
+        return {"index_name": index_name, "removed": int(remove.sum())}
+
+
+def _publish_update(
+    index_dir: str,
+    index,
+    records: Iterator[Dict],
+    vector_ids: Optional[np.ndarray],
+    rerank_vectors: Optional[np.ndarray] = None,
+) -> None:
+    """Write an updated index and its metadata next to the old files, then swap them in."""
+    index_path = os.path.join(index_dir, "faiss.index")
+    jsonl_path = os.path.join(index_dir, "meta_data.jsonl")
+    vector_ids_path = os.path.join(index_dir, VECTOR_IDS_NAME)
+    bm25_path = os.path.join(index_dir, BM25_NAME)
+    rerank_path = os.path.join(index_dir, RERANK_VECTORS_NAME)
+
+    faiss.write_index(index, index_path + ".tmp")
+    bm25 = BM25Builder()
+    with open(jsonl_path + ".tmp", "w") as f:
+        for entry in records:
+            json.dump(entry, f)
+            f.write("\n")
+            bm25.add(entry["search_key"])
+    bm25.build().save(bm25_path + ".tmp")
+    if vector_ids is not None:
+        with open(vector_ids_path + ".tmp", "wb") as f:
+            np.save(f, vector_ids)
+    if rerank_vectors is not None:
+        _write_vectors(rerank_path + ".tmp", rerank_vectors, CREATE_CHUNK_SIZE)
+
+    # the id map first and the JSONL last, as in FAISSDS.create
+    if vector_ids is not None:
+        os.replace(vector_ids_path + ".tmp", vector_ids_path)
+    os.replace(index_path + ".tmp", index_path)
+    os.replace(bm25_path + ".tmp", bm25_path)
+    if rerank_vectors is not None:
+        os.replace(rerank_path + ".tmp", rerank_path)
+    os.replace(jsonl_path + ".tmp", jsonl_path)
+    with open(jsonl_path, "r") as fi:
+        MetaStore.write(index_dir, (json.loads(line) for line in fi))
 
-        return {"index_name": index_name}
+    info = read_index_info(index_dir)
+    if "report" in info:
+        info["report"]["ntotal"] = int(index.ntotal)
+        write_index_info(index_dir, info)
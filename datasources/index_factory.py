@@ -0,0 +1,293 @@
+import math
+import time
+from typing import Callable, Dict, Literal, Optional
+
+import faiss
+import numpy as np
+
+IndexType = Literal["Flat", "IVFFlat", "IVFPQ", "HNSW"]
+# How Flat, IVFFlat and HNSW indexes store each vector: as is, as 8-bit
+# scalar-quantized codes (4x smaller) or as half floats (2x smaller)
+Encoding = Literal["float32", "sq8", "fp16"]
+
+_CODECS = {"float32": "Flat", "sq8": "SQ8", "fp16": "SQfp16"}
+# Scalar quantizers only learn per-dimension ranges, a sample is plenty
+SQ_TRAIN_POINTS = 65536
+
+
+class IndexConfig:
+    """Describes the FAISS index built for a datasource.
+
+    Args:
+        index_type: "Flat" for exact search, "IVFFlat"/"IVFPQ" for inverted
+            file indexes (the latter product-quantized), "HNSW" for a graph index.
+        nlist: number of IVF cells, defaults to ~4*sqrt(n) bounded by the corpus size.
+        pq_m: number of PQ sub-quantizers, must divide the embedding dimension.
+        pq_nbits: bits per PQ code, lowered automatically for small corpora.
+        encoding: storage of the vectors of Flat, IVFFlat and HNSW indexes,
+            "float32", "sq8" or "fp16".
+        pca_dim: when set, vectors and queries are projected to this many
+            dimensions by a PCA trained on the corpus and stored in the index.
+        rerank_factor: when > 0, searches shortlist rerank_factor * k
+            candidates from the index and rescore them exactly against
+            float32 vectors memory-mapped from disk.
+        hnsw_m: neighbours per HNSW node.
+        ef_construction: HNSW build-time search depth.
+        nprobe: IVF cells visited per query.
+        ef_search: HNSW query-time search depth.
+        max_train_points: cap on the vectors sampled to train IVF/PQ indexes.
+        eval_queries: number of corpus vectors used as queries in the build report.
+        eval_k: the k of the recall@k measured in the build report.
+        seed: seed of the training and evaluation samples.
+    """
+
+    def __init__(
+        self,
+        index_type: IndexType = "Flat",
+        nlist: Optional[int] = None,
+        pq_m: int = 16,
+        pq_nbits: int = 8,
+        encoding: Encoding = "float32",
+        rerank_factor: int = 0,
+        pca_dim: Optional[int] = None,
+        hnsw_m: int = 32,
+        ef_construction: int = 40,
+        nprobe: int = 8,
+        ef_search: int = 64,
+        max_train_points: Optional[int] = None,
+        eval_queries: int = 200,
+        eval_k: int = 10,
+        seed: int = 1234,
+    ):
+        self.index_type = index_type
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.pq_nbits = pq_nbits
+        self.encoding = encoding
+        self.rerank_factor = rerank_factor
+        self.pca_dim = pca_dim
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.max_train_points = max_train_points
+        self.eval_queries = eval_queries
+        self.eval_k = eval_k
+        self.seed = seed
+
+    def resolve_nlist(self, n: int) -> int:
+        if self.nlist is not None:
+            return self.nlist
+        # faiss wants at least 39 training points per cell
+        return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+    def resolve_pq_nbits(self, n: int) -> int:
+        # like nlist, keep ~39 training points for each of the 2**nbits centroids
+        return max(1, min(self.pq_nbits, int(math.log2(max(n // 39, 2)))))
+
+    def factory_string(self, d: int, n: int) -> str:
+        """The faiss.index_factory description of this index for n vectors of dim d."""
+        if self.pca_dim is None:
+            return self._index_string(d, n)
+        if not 0 < self.pca_dim < d:
+            raise ValueError(f"pca_dim={self.pca_dim} must be below the dimension {d}")
+        return f"PCA{self.pca_dim},{self._index_string(self.pca_dim, n)}"
+
+    def _index_string(self, d: int, n: int) -> str:
+        if self.encoding not in _CODECS:
+            raise ValueError(f"Unknown encoding: {self.encoding}")
+        codec = _CODECS[self.encoding]
+        if self.index_type == "Flat":
+            return codec
+        if self.index_type == "IVFFlat":
+            return f"IVF{self.resolve_nlist(n)},{codec}"
+        if self.index_type == "IVFPQ":
+            if self.encoding != "float32":
+                raise ValueError(
+                    "IVFPQ indexes are already quantized, use encoding='float32'"
+                )
+            if d % self.pq_m != 0:
+                raise ValueError(
+                    f"pq_m={self.pq_m} does not divide the embedding dimension {d}"
+                )
+            return (
+                f"IVF{self.resolve_nlist(n)},PQ{self.pq_m}x{self.resolve_pq_nbits(n)}"
+            )
+        if self.index_type == "HNSW":
+            return f"HNSW{self.hnsw_m},{codec}"
+        raise ValueError(f"Unknown index type: {self.index_type}")
+
+    @property
+    def requires_training(self) -> bool:
+        """Whether the index can only be built once the whole corpus is known."""
+        return (
+            self.index_type in ("IVFFlat", "IVFPQ")
+            or self.encoding == "sq8"
+            or self.pca_dim is not None
+        )
+
+    def search_params(self) -> Dict:
+        return {"nprobe": self.nprobe, "ef_search": self.ef_search}
+
+
+def select_training_sample(
+    embeddings: np.ndarray, max_points: Optional[int], seed: int
+) -> np.ndarray:
+    """A uniform random sample of at most `max_points` rows, in corpus order."""
+    n = embeddings.shape[0]
+    if max_points is None or n <= max_points:
+        return embeddings
+    rows = np.random.default_rng(seed).choice(n, size=max_points, replace=False)
+    return embeddings[np.sort(rows)]
+
+
+def set_search_params(
+    index, nprobe: Optional[int] = None, ef_search: Optional[int] = None
+) -> None:
+    """Set the query-time knobs the index understands, ignoring the others."""
+    if not isinstance(index, faiss.Index):
+        return  # e.g. a memory-mapped flat index, which has nothing to tune
+    params = faiss.ParameterSpace()
+    if nprobe is not None and faiss.try_extract_index_ivf(index) is not None:
+        params.set_index_parameter(index, "nprobe", nprobe)
+    if ef_search is not None and _find_hnsw(index) is not None:
+        params.set_index_parameter(index, "efSearch", ef_search)
+
+
+def has_native_ids(index) -> bool:
+    """IVF indexes keep the label given to each vector when others are removed."""
+    return (
+        isinstance(index, faiss.Index)
+        and faiss.try_extract_index_ivf(index) is not None
+    )
+
+
+def supports_remove(index) -> bool:
+    """HNSW graphs cannot drop vectors, every other index type here can."""
+    return _find_hnsw(index) is None
+
+
+def _find_hnsw(index):
+    while index is not None:
+        index = faiss.downcast_index(index)
+        if isinstance(index, faiss.IndexHNSW):
+            return index
+        index = getattr(index, "index", None)
+    return None
+
+
+def new_index(d: int, n: int, config: IndexConfig):
+    """Create an empty inner-product index for n vectors of dim d.
+
+    Returns:
+        Tuple: the index and its faiss.index_factory string.
+    """
+    factory = config.factory_string(d, n)
+    index = faiss.index_factory(d, factory, faiss.METRIC_INNER_PRODUCT)
+    if config.index_type == "HNSW":
+        _find_hnsw(index).hnsw.efConstruction = config.ef_construction
+    return index, factory
+
+
+def train_index(index, embeddings: np.ndarray, config: IndexConfig) -> float:
+    """Train the index on a sample of `embeddings` if it needs it, returning seconds spent."""
+    if index.is_trained:
+        return 0.0
+    n = embeddings.shape[0]
+    max_points = config.max_train_points
+    if max_points is None and config.index_type in ("IVFFlat", "IVFPQ"):
+        max_points = 256 * config.resolve_nlist(n)
+    elif max_points is None:
+        max_points = SQ_TRAIN_POINTS
+    start = time.perf_counter()
+    index.train(select_training_sample(embeddings, max_points, config.seed))
+    return time.perf_counter() - start
+
+
+def build_index(embeddings: np.ndarray, config: IndexConfig) -> Dict:
+    """Build and fill an inner-product index of `embeddings` as described by `config`.
+
+    Returns:
+        Dict: {"index": the faiss index, "factory": its factory string,
+            "train_time": seconds spent training, "add_time": seconds spent adding}
+    """
+    n, d = embeddings.shape
+    index, factory = new_index(d, n, config)
+    train_time = train_index(index, embeddings, config)
+
+    start = time.perf_counter()
+    index.add(embeddings)
+    add_time = time.perf_counter() - start
+
+    set_search_params(index, **config.search_params())
+    return {
+        "index": index,
+        "factory": factory,
+        "train_time": train_time,
+        "add_time": add_time,
+    }
+
+
+def exact_rerank(queries: np.ndarray, rows: np.ndarray, vectors: np.ndarray, k: int):
+    """Rescore shortlisted rows by their exact inner product and keep the k best.
+
+    Args:
+        queries (np.ndarray): the (n, d) query vectors.
+        rows (np.ndarray): the (n, s) shortlisted rows of `vectors`, -1 for none.
+        vectors (np.ndarray): the float32 corpus vectors, typically memory-mapped.
+
+    Returns:
+        Tuple: the (n, k) exact scores and rows, best first, -1 where the
+            shortlist had fewer than k rows.
+    """
+    valid = rows != -1
+    gathered = vectors[np.where(valid, rows, 0)]
+    scores = np.einsum("nsd,nd->ns", gathered, queries).astype(np.float32)
+    scores[~valid] = -np.finfo(np.float32).max
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return (
+        np.take_along_axis(scores, order, axis=1),
+        np.take_along_axis(rows, order, axis=1),
+    )
+
+
+def evaluate_index(
+    index,
+    embeddings: np.ndarray,
+    config: IndexConfig,
+    search: Optional[Callable] = None,
+) -> Dict:
+    """Measure recall@k and score deviation against exact search, and throughput.
+
+    A sample of the corpus vectors is used as the query set, the exact
+    neighbours are computed by brute force over `embeddings`. The score
+    deviation is the mean absolute difference between the scores returned
+    and the exact scores at the same ranks, which is what quantized
+    encodings change. `search(queries, k)` replaces `index.search` when given.
+    """
+    search = search or index.search
+    n = embeddings.shape[0]
+    k = min(config.eval_k, n)
+    queries = select_training_sample(embeddings, config.eval_queries, config.seed + 1)
+
+    exact_scores, exact = faiss.knn(queries, embeddings, k, faiss.METRIC_INNER_PRODUCT)
+
+    found = np.empty_like(exact)
+    found_scores = np.empty_like(exact_scores)
+    start = time.perf_counter()
+    for i in range(queries.shape[0]):
+        scores, rows = search(queries[i : i + 1], k)
+        found_scores[i], found[i] = scores[0], rows[0]
+    elapsed = time.perf_counter() - start
+
+    hits = sum(len(np.intersect1d(exact[i], found[i])) for i in range(queries.shape[0]))
+    valid = found != -1
+    return {
+        "k": k,
+        "recall": hits / exact.size if exact.size else 1.0,
+        "score_deviation": float(np.abs(found_scores - exact_scores)[valid].mean())
+        if valid.any()
+        else 0.0,
+        "qps": queries.shape[0] / elapsed if elapsed > 0 else float("inf"),
+        "queries": int(queries.shape[0]),
+    }
@@ -1,31 +1,62 @@
-import itertools
+import hashlib
+import json
 import os
 import pathlib
 import re
 import shutil
-from typing import Dict, Iterator, List, Literal, Optional, Tuple
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+)
+
+from tools.conversion import CONVERSION_BATCH_SIZE, CONVERSION_WORKERS, convert_to_pdf
 
 # Assuming these extraction functions are available
 from tools.extraction import (
+    EXTRACTOR_VERSIONS,
     doc_to_pdf,
-    extract_csv,
-    pdf_to_page_map_azure,
-    pdf_to_page_map_pymupdf,
-    pdf_to_page_map_pypdf,
+    iter_csv_records,
+    iter_pages_azure,
+    iter_pages_pymupdf,
+    iter_pages_pypdf,
     read_docx,
     read_pptx,
 )
 
 # Importing FAISSDS directly
-from .faiss_ds import FAISSDS
+from .chunker import split_text
+from .embedding_providers import EmbeddingProvider, default_provider
+from .extraction_cache import EXTRACTION_CACHE_DIR, ExtractionCache
+from .faiss_ds import FAISSDS, read_index_info, write_index_info
+from .index_factory import IndexConfig
+from .ingest_job import INGEST_JOB_DIR, IngestJob
 
 # Configurations
 DATASOURCE_PATH = "datasources"
 PDF_PAGEMAP_EXTRACTION_METHOD: Literal["AzureFormRecognizer", "PyPDF", "PyMuPDF"] = (
     "AzureFormRecognizer"
 )
+FILE_MANIFEST_NAME = "files.json"
 slicable = [".pdf", ".docx", ".pptx", ".doc", ".docm"]
 libreoffice_convertable = [".docx", ".pptx", ".doc", ".docm"]
+# Extraction is CPU bound or waits on LibreOffice, files are extracted in
+# parallel processes; DatasourceConfig.extraction_workers overrides it
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS") or os.cpu_count() or 1)
+# Documents converted to PDF ahead of their extraction, a batch per LibreOffice
+CONVERSION_WINDOW = CONVERSION_BATCH_SIZE * CONVERSION_WORKERS
 
 
 # Assuming DatasourceConfig is a simple dictionary or a class you can define
@@ -39,6 +70,11 @@ class DatasourceConfig:
         doc_section_overlap=100,
         doc_sentence_search_limit=100,
         doc_slice=True,
+        index_config: Optional[IndexConfig] = None,
+        embedding_provider: Optional[EmbeddingProvider] = None,
+        extraction_workers: Optional[int] = None,
+        extraction_cache: bool = True,
+        extraction_method: Optional[str] = None,
     ):
         self.csv_header = csv_header
         self.csv_key = csv_key
@@ -47,6 +83,12 @@ class DatasourceConfig:
         self.doc_section_overlap = doc_section_overlap
         self.doc_sentence_search_limit = doc_sentence_search_limit
         self.doc_slice = doc_slice
+        self.index_config = index_config
+        self.embedding_provider = embedding_provider
+        self.extraction_workers = extraction_workers
+        self.extraction_cache = extraction_cache
+        # PDF_PAGEMAP_EXTRACTION_METHOD when not given
+        self.extraction_method = extraction_method
 
 
 def create_local_dir(datasource_name) -> str:
@@ -58,25 +100,37 @@ def create_local_dir(datasource_name) -> str:
     return str(new_dir)
 
 
-def save_local_copy(file, local_dir_path: str) -> str:
+def save_local_copy(file, local_dir_path: str, overwrite: bool = False) -> str:
     """
     Saves a locally uploaded file to a specified path and returns the file object.
     Works with any type of files.
     """
     full_path = pathlib.Path(local_dir_path) / str(file.filename)
-    if full_path.exists():
+    source = getattr(file.file, "name", None)
+    if (
+        isinstance(source, str)
+        and full_path.exists()
+        and os.path.samefile(source, full_path)
+    ):
+        # the upload was opened from this very copy, e.g. by create_upload_file
+        return str(full_path)
+    if full_path.exists() and not overwrite:
         print(f"A file with the name {file.filename} already exists at: {full_path}.")
+    elif isinstance(source, str) and os.path.isfile(source):
+        # a file on disk is copied by the kernel instead of read in here again
+        shutil.copyfile(source, full_path)
     else:
         # write the file to path
         with open(full_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         # Reset the file's position to the beginning
         file.file.seek(0)
+    _release(file)
     return str(full_path)
 
 
 def create_sections(
-    page_map: List[Tuple[int, int, str]],
+    page_map: Iterable[Tuple[int, int, str]],
     doc_max_section_length: int,
     doc_sentence_search_limit: int,
     doc_section_overlap: int,
@@ -85,7 +139,8 @@ def create_sections(
 ) -> Iterator:
     """Extract content and text from a page_map, creates a generator.
     Args:
-        page_map (List[Tuple[int, int, str]]): a list of pages to be read,
+        page_map (Iterable[Tuple[int, int, str]]): the pages to be read, a list
+            or pages streamed from an extractor,
             e.g: [(0, 0, "John is a great person"),
                   (1, 22, "He is always punctual.")]
             Whereas the first int represents the page number, 2nd int represents
@@ -104,80 +159,14 @@ def create_sections(
         section (generator): a generator with text content for indexing.
     """
 
-    def _split_text(page_map):
-        SENTENCE_ENDINGS = [".", "!", "?"]
-        WORDS_BREAKS = [",", ";", ":", " ", "(", ")", "[", "]", "{", "}", "\t", "\n"]
-
-        def find_page(offset):
-            mapsize = len(page_map)
-            for i in range(mapsize - 1):
-                if offset >= page_map[i][1] and offset < page_map[i + 1][1]:
-                    return i
-            return mapsize - 1
-
-        all_text = "".join(p[2] for p in page_map)
-        length = len(all_text)
-        start = 0
-        end = length
-        while start + doc_section_overlap < length:
-            last_word = -1
-            end = start + doc_max_section_length
-
-            if end > length:
-                end = length
-            else:
-                # Try to find the end of the sentence
-                while (
-                    end < length
-                    and (end - start - doc_max_section_length)
-                    < doc_sentence_search_limit
-                    and all_text[end] not in SENTENCE_ENDINGS
-                ):
-                    if all_text[end] in WORDS_BREAKS:
-                        last_word = end
-                    end += 1
-                if (
-                    end < length
-                    and all_text[end] not in SENTENCE_ENDINGS
-                    and last_word > 0
-                ):
-                    end = last_word  # Fall back to at least keeping a whole word
-            if end < length:
-                end += 1
-
-            # Try to find the start of the sentence or at least a whole word boundary
-            last_word = -1
-            while (
-                start > 0
-                and start > end - doc_max_section_length - 2 * doc_sentence_search_limit
-                and all_text[start] not in SENTENCE_ENDINGS
-            ):
-                if all_text[start] in WORDS_BREAKS:
-                    last_word = start
-                start -= 1
-            if all_text[start] not in SENTENCE_ENDINGS and last_word > 0:
-                start = last_word
-            if start > 0:
-                start += 1
-
-            section_text = all_text[start:end]
-            yield (section_text, find_page(start))
-
-            last_table_start = section_text.rfind("<table")
-            if (
-                last_table_start > 2 * doc_sentence_search_limit
-                and last_table_start > section_text.rfind("</table")
-            ):
-                start = min(end - doc_section_overlap, start + last_table_start)
-            else:
-                start = end - doc_section_overlap
-
-        if start + doc_section_overlap < end:
-            yield (all_text[start:end], find_page(start))
-
-    # create session, enumerating the above function
+    sections = split_text(
+        page_map,
+        max_section_length=doc_max_section_length,
+        sentence_search_limit=doc_sentence_search_limit,
+        section_overlap=doc_section_overlap,
+    )
     # page num + 1 as pdf file page numbers are 1 base
-    for i, (section, pagenum) in enumerate(_split_text(page_map)):
+    for i, (section, pagenum) in enumerate(sections):
         yield {
             "id": re.sub("[^0-9a-zA-Z_-]", "_", f"{filename}-{i}"),
             "search_key": section,
@@ -209,7 +198,7 @@ def create_section_non_slice(
 
 
 def create_section_csv(
-    json: List[Dict[str, str]],
+    json: Iterable[Dict[str, str]],
     file_url: str,
     search_key: str,
     csv_out_template: str,
@@ -219,7 +208,8 @@ def create_section_csv(
         The generator will then be passed to the datasource to be indexed
 
     Args:
-        json (List[Dict[str, str]]): a json representation of a csv
+        json (Iterable[Dict[str, str]]): a json representation of a csv, a
+            list or rows streamed from the file
             eg: [{"issue": "cannot start computer", "solution": "restart"},
                  {"issue": "black screen", "solution": "turn on computer"}]
         file_url (str): the url to retrieve the copy of the file
@@ -255,19 +245,39 @@ def create_upload_file(
     return UploadFile(filename=file_name, file=file_like)
 
 
-def main(
-    files: List,
-    existing_file_names: List[str],
-    datasource_name: str,
-    config: DatasourceConfig,
-) -> str:
-    """Upload files and create datasources from files."""
-    # Append local files to the files list
-    files += [
-        create_upload_file(datasource=datasource_name, file_name=file_name)
-        for file_name in existing_file_names
-    ]
+class PathUpload:
+    """A file on disk, handed to `main` like an uploaded one.
+
+    The file is only opened once `.file` is used, and every pass over the
+    files closes it again once done with it, so ingesting a directory of
+    thousands of files never holds more than a few of them open.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.filename = os.path.basename(path)
+        self._file: Optional[IO[bytes]] = None
+
+    @property
+    def file(self) -> IO[bytes]:
+        if self._file is None:
+            self._file = open(self.path, "rb")
+        return self._file
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
 
+def _release(file) -> None:
+    """Close a file opened from its path, once a pass over the files is done with it."""
+    if isinstance(file, PathUpload):
+        file.close()
+
+
+def _prepare_files(files: List) -> List:
+    """Normalize uploaded filenames and reject missing or duplicate names."""
     # Ensure files are not empty
     if not files:
         raise Exception("No files uploaded or local files selected.")
@@ -282,84 +292,514 @@ def main(
     if len(file_names) != len(set(file_names)):
         raise Exception("Duplicate filenames detected. Please use unique filenames.")
 
-    # Process files and create sections
-    section_generators: List[Iterator] = []
+    return files
 
-    for file in files:
-        file_url = os.path.join(datasource_name, file.filename)
-        file_type = os.path.splitext(file.filename)[1].lower()
 
-        extraction_method = {
-            "AzureFormRecognizer": pdf_to_page_map_azure,
-            "PyPDF": pdf_to_page_map_pypdf,
-            "PyMuPDF": pdf_to_page_map_pymupdf,
-        }
+def file_sha256(file) -> str:
+    """Hash the content of an uploaded file, leaving it rewound."""
+    digest = hashlib.sha256()
+    file.file.seek(0)
+    for chunk in iter(lambda: file.file.read(1 << 20), b""):
+        digest.update(chunk)
+    file.file.seek(0)
+    _release(file)
+    return digest.hexdigest()
+
+
+def read_file_manifest(datasource_name: str) -> Dict[str, Dict]:
+    """The files indexed in a datasource, {} if it predates the manifest."""
+    path = pathlib.Path(DATASOURCE_PATH) / datasource_name / FILE_MANIFEST_NAME
+    if not path.exists():
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_file_manifest(datasource_name: str, manifest: Dict[str, Dict]) -> None:
+    path = pathlib.Path(DATASOURCE_PATH) / datasource_name / FILE_MANIFEST_NAME
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+class _InMemoryUpload:
+    """An uploaded file read into memory, which is also how workers receive it.
+
+    Exposes the content both as `.file` and through its own file methods, as
+    the extraction functions use either.
+    """
+
+    def __init__(self, filename: str, data: bytes):
+        self.filename = filename
+        self.file = BytesIO(data)
 
-        if file_type in slicable and config.doc_slice:
-            # Convert to PDF if necessary
-            if file_type in libreoffice_convertable:
-                file = doc_to_pdf(file)
-                file_type = ".pdf"
-
-            # Extract page map
-            page_map = extraction_method[PDF_PAGEMAP_EXTRACTION_METHOD](file)
-
-            # Create sections
-            sections = create_sections(
-                filename=file.filename,
-                page_map=page_map,
-                doc_max_section_length=config.doc_max_section_length,
-                doc_sentence_search_limit=config.doc_sentence_search_limit,
-                doc_section_overlap=config.doc_section_overlap,
-                file_url=file_url,
-            )
-        elif file_type == ".csv":
-            # Extract CSV data
-            json_data = extract_csv(file, config.csv_header)
-            sections = create_section_csv(
-                json=json_data,
-                file_url=file_url,
-                search_key=config.csv_key if config.csv_header else "k0",
-                csv_out_template=config.csv_out_template,
-                filename=file.filename,
-            )
-        else:
-            # Handle non-slicable documents or when slicing is disabled
-            if file_type == ".docx":
-                text = read_docx(file)
-            elif file_type == ".pptx":
-                text = read_pptx(file)
-            elif file_type in libreoffice_convertable:
-                file = doc_to_pdf(file)
-                page_map = extraction_method[PDF_PAGEMAP_EXTRACTION_METHOD](file)
-                text = "".join([page[2] for page in page_map])
-            elif file_type == ".pdf":
-                page_map = extraction_method[PDF_PAGEMAP_EXTRACTION_METHOD](file)
-                text = "".join([page[2] for page in page_map])
-            elif file_type in [".txt", ".md"]:
-                file.file.seek(0)
-                text = file.file.read().decode("utf-8")
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def tell(self):
+        return self.file.tell()
+
+    def read(self, *args):
+        return self.file.read(*args)
+
+
+def extract_file(
+    file,
+    doc_slice: bool = True,
+    csv_header: bool = True,
+    method: Optional[str] = None,
+    file_type: Optional[str] = None,
+) -> Tuple[str, Any]:
+    """Extract the content of one uploaded file, before it is cut into sections.
+
+    The result is the compact form the sections are built from: ("pages",
+    pages) for documents to slice, where the pages are yielded as the
+    extractor decodes them, ("rows", records) for CSV files and ("text",
+    text) for documents indexed whole. `file_type` overrides the extension,
+    e.g. ".pdf" for a document already converted to PDF.
+    """
+    filename = file.filename
+    file_type = file_type or os.path.splitext(filename)[1].lower()
+    extraction_method = {
+        "AzureFormRecognizer": iter_pages_azure,
+        "PyPDF": iter_pages_pypdf,
+        "PyMuPDF": iter_pages_pymupdf,
+    }[method or PDF_PAGEMAP_EXTRACTION_METHOD]
+
+    if file_type in slicable and doc_slice:
+        # Convert to PDF if necessary
+        if file_type in libreoffice_convertable:
+            file = doc_to_pdf(file)
+        return "pages", extraction_method(file)
+    elif file_type == ".csv":
+        return "rows", iter_csv_records(file.file, csv_header)
+
+    # Handle non-slicable documents or when slicing is disabled
+    if file_type == ".docx":
+        text = read_docx(file)
+    elif file_type == ".pptx":
+        text = read_pptx(file)
+    elif file_type in libreoffice_convertable:
+        file = doc_to_pdf(file)
+        text = "".join(page[2] for page in extraction_method(file))
+    elif file_type == ".pdf":
+        text = "".join(page[2] for page in extraction_method(file))
+    elif file_type in [".txt", ".md"]:
+        file.file.seek(0)
+        text = file.file.read().decode("utf-8")
+    else:
+        raise Exception(f"Incompatible file type: {file_type}")
+    return "text", text
+
+
+def extraction_sections(
+    filename: str,
+    extraction: Tuple[str, Any],
+    datasource_name: str,
+    config: DatasourceConfig,
+) -> Iterator:
+    """The generator of sections of a file extracted by `extract_file`."""
+    file_url = os.path.join(datasource_name, filename)
+    kind, content = extraction
+    if kind == "pages":
+        return create_sections(
+            filename=filename,
+            page_map=content,
+            doc_max_section_length=config.doc_max_section_length,
+            doc_sentence_search_limit=config.doc_sentence_search_limit,
+            doc_section_overlap=config.doc_section_overlap,
+            file_url=file_url,
+        )
+    if kind == "rows":
+        return create_section_csv(
+            json=_report_rows(filename, content),
+            file_url=file_url,
+            search_key=config.csv_key if config.csv_header else "k0",
+            csv_out_template=config.csv_out_template,
+            filename=filename,
+        )
+    return create_section_non_slice(text=content, filename=filename, file_url=file_url)
+
+
+def _report_rows(filename: str, rows: Iterable[Dict]) -> Iterator[Dict]:
+    """Pass CSV rows through, printing how fast they were read once done."""
+    count = 0
+    elapsed = 0.0
+    resumed = time.perf_counter()
+    for row in rows:
+        # only the time spent reading, not the time spent embedding the rows
+        elapsed += time.perf_counter() - resumed
+        count += 1
+        yield row
+        resumed = time.perf_counter()
+    elapsed += time.perf_counter() - resumed
+    rate = count / elapsed if elapsed > 0 else float("inf")
+    print(f"Read {count} rows of {filename} in {elapsed:.2f}s ({rate:.0f} rows/s)")
+
+
+def _counted(items: Iterable, counts: Dict[str, int], name: str) -> Iterator:
+    counts[name] = 0
+    for item in items:
+        counts[name] += 1
+        yield item
+
+
+def _timed(items: Iterable, stats: Dict) -> Iterator:
+    """Pass items through, adding the time spent producing them to stats["time"]."""
+    resumed = time.perf_counter()
+    for item in items:
+        stats["time"] += time.perf_counter() - resumed
+        yield item
+        resumed = time.perf_counter()
+    stats["time"] += time.perf_counter() - resumed
+
+
+def _read_upload(file) -> bytes:
+    file.file.seek(0)
+    data = file.file.read()
+    file.file.seek(0)
+    _release(file)
+    return data
+
+
+def create_file_sections(
+    file, datasource_name: str, config: DatasourceConfig
+) -> Iterator:
+    """Extract one uploaded file and return the generator of its sections."""
+    upload = _InMemoryUpload(file.filename, _read_upload(file))
+    extraction = extract_file(
+        upload, config.doc_slice, config.csv_header, config.extraction_method
+    )
+    return extraction_sections(file.filename, extraction, datasource_name, config)
+
+
+def _is_csv(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() == ".csv"
+
+
+def needs_conversion(filename: str, doc_slice: bool) -> bool:
+    """Whether a file is extracted from its LibreOffice conversion to PDF."""
+    file_type = os.path.splitext(filename)[1].lower()
+    if file_type not in libreoffice_convertable:
+        return False
+    # whole .docx and .pptx files are read directly
+    return doc_slice or file_type not in [".docx", ".pptx"]
+
+
+def _extraction_inputs(
+    files: List, doc_slice: bool
+) -> Iterator[Tuple[str, bytes, Optional[str]]]:
+    """The name, content and type override of each file, read as they are taken.
+
+    Documents that need LibreOffice are converted to PDF a window of
+    CONVERSION_WINDOW documents at a time, once the first of the window is
+    reached, and each PDF is dropped once handed on.
+    """
+    converted: Dict[str, bytes] = {}
+    for i, file in enumerate(files):
+        if not needs_conversion(file.filename, doc_slice):
+            yield file.filename, _read_upload(file), None
+            continue
+        if file.filename not in converted:
+            window = [f for f in files[i:] if needs_conversion(f.filename, doc_slice)][
+                :CONVERSION_WINDOW
+            ]
+            pdfs = convert_to_pdf([(f.filename, _read_upload(f)) for f in window])
+            converted.update((f.filename, pdf) for f, pdf in zip(window, pdfs))
+        yield file.filename, converted.pop(file.filename), ".pdf"
+
+
+def _extract_bytes(
+    filename: str,
+    data: bytes,
+    file_type: Optional[str],
+    doc_slice: bool,
+    csv_header: bool,
+    method: str,
+) -> Tuple[str, Any]:
+    upload = _InMemoryUpload(filename, data)
+    return extract_file(upload, doc_slice, csv_header, method, file_type)
+
+
+def _extract_in_worker(*args) -> Tuple[str, Any]:
+    kind, content = _extract_bytes(*args)
+    # pages cross the process boundary as one page map
+    return kind, list(content) if kind == "pages" else content
+
+
+def _extract_ahead(
+    executor: ProcessPoolExecutor, jobs: Iterator[Tuple], ahead: int
+) -> Iterator[Tuple[str, Any]]:
+    """The extraction of every job in order, with at most `ahead` in flight.
+
+    The next file is only read and submitted once the oldest extraction was
+    taken, so however many files there are, memory holds about `ahead` of
+    them and their extractions while the sections are embedded.
+    """
+    futures: Deque[Future] = deque()
+    for args in jobs:
+        futures.append(executor.submit(_extract_in_worker, *args))
+        if len(futures) >= ahead:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+def _cache_keys(
+    files: List, cache: Optional[ExtractionCache], doc_slice: bool, method: str
+) -> Dict[str, str]:
+    """The extraction cache key of every file worth caching the extraction of."""
+    if cache is None:
+        return {}
+    version = EXTRACTOR_VERSIONS[method]
+    return {
+        file.filename: cache.key(file_sha256(file), method, version, doc_slice)
+        for file in files
+        # text and CSV files are read faster than a cache entry
+        if os.path.splitext(file.filename)[1].lower() in slicable
+    }
+
+
+def extract_sections(
+    files: List,
+    datasource_name: str,
+    config: DatasourceConfig,
+    cache: Optional[ExtractionCache] = None,
+    on_file_extracted: Optional[Callable[[str, Dict[str, int]], None]] = None,
+) -> Iterator:
+    """The sections of all files, in file order, extracted on a process pool.
+
+    Files whose extraction is in `cache` are not extracted again. Documents
+    that need LibreOffice are converted to PDF together, in batches, as the
+    extraction reaches them. Workers return the compact extraction of each file and its sections are
+    built here while the next files are still being extracted, so the index
+    sees the same sections in the same order as a sequential run. CSV files
+    are read here, their rows streamed a chunk at a time.
+    `on_file_extracted` is called with the name of each file and the number
+    of its sections and pages or CSV rows once all its sections were yielded.
+    """
+    method = config.extraction_method or PDF_PAGEMAP_EXTRACTION_METHOD
+    keys = _cache_keys(files, cache, config.doc_slice, method)
+    # entries are only opened once their file's turn comes, an open entry
+    # per cached file would run out of file descriptors on large subjects
+    cached = {
+        filename
+        for filename, key in keys.items()
+        if cache is not None and cache.contains(key)
+    }
+
+    pending = [file for file in files if file.filename not in cached]
+    options = (config.doc_slice, config.csv_header, method)
+    # CSV rows are streamed from the upload here, never loaded whole
+    pooled = [file for file in pending if not _is_csv(file.filename)]
+    workers = min(config.extraction_workers or INGEST_WORKERS, len(pooled))
+    executor = None
+    # files are read and converted lazily, as they are extracted
+    jobs = (
+        (*inputs, *options) for inputs in _extraction_inputs(pooled, config.doc_slice)
+    )
+    extractions: Iterator[Tuple[str, Any]]
+    if workers <= 1:
+        extractions = (_extract_bytes(*args) for args in jobs)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        extractions = _extract_ahead(executor, jobs, workers)
+
+    try:
+        for file in files:
+            extraction = None
+            if cache is not None and file.filename in cached:
+                extraction = cache.get(keys[file.filename])
+                if extraction is None:
+                    # the entry was unreadable, extract the file here instead
+                    upload = _InMemoryUpload(file.filename, _read_upload(file))
+                    extraction = cache.record(
+                        keys[file.filename], extract_file(upload, *options)
+                    )
+            elif _is_csv(file.filename):
+                extraction = extract_file(file, *options)
             else:
-                raise Exception(f"Incompatible file type: {file_type}")
+                extraction = next(extractions)
+                if cache is not None and file.filename in keys:
+                    extraction = cache.record(keys[file.filename], extraction)
+            kind, content = extraction
+            counts = {"sections": 0}
+            if kind in ("pages", "rows"):
+                content = _counted(content, counts, kind)
+            for section in extraction_sections(
+                file.filename, (kind, content), datasource_name, config
+            ):
+                counts["sections"] += 1
+                yield section
+            # CSV rows were streamed from the file
+            _release(file)
+            if on_file_extracted is not None:
+                on_file_extracted(file.filename, counts)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
 
-            sections = create_section_non_slice(
-                text=text, filename=file.filename, file_url=file_url
-            )
 
-        section_generators.append(sections)
+def extraction_cache(datasource_name: str) -> ExtractionCache:
+    """The extraction cache kept in a datasource's directory."""
+    return ExtractionCache(
+        os.path.join(DATASOURCE_PATH, datasource_name, EXTRACTION_CACHE_DIR)
+    )
 
-    # Combine all section generators
-    combined_sections = itertools.chain(*section_generators)
 
-    # Create index using FAISSDS
+def main(
+    files: List,
+    existing_file_names: List[str],
+    datasource_name: str,
+    config: DatasourceConfig,
+) -> str:
+    """Upload files and create datasources from files."""
+    # Append local files to the files list
+    files += [
+        create_upload_file(datasource=datasource_name, file_name=file_name)
+        for file_name in existing_file_names
+    ]
+    files = _prepare_files(files)
     local_dir_path = create_local_dir(datasource_name)
-
-    # create FAISS index
-    FAISSDS.create(section=combined_sections, index_name=datasource_name)
+    digests = {f.filename: file_sha256(f) for f in files}
+
+    # Progress is checkpointed, a run after a failed one resumes where it stopped
+    provider = config.embedding_provider or default_provider()
+    job = IngestJob.start(
+        os.path.join(local_dir_path, INGEST_JOB_DIR), digests, provider.describe()
+    )
+    if job.resumed:
+        print(
+            f"Resuming ingest of {datasource_name}: "
+            f"{len(job.chunks)} embedded chunks checkpointed"
+        )
+
+    # Process files and create sections, timing how long they take to come
+    cache = extraction_cache(datasource_name) if config.extraction_cache else None
+    extraction = {"time": 0.0}
+    combined_sections = _timed(
+        extract_sections(
+            files, datasource_name, config, cache, on_file_extracted=job.file_extracted
+        ),
+        extraction,
+    )
+
+    # create FAISS index, published only once complete
+    try:
+        FAISSDS.create(
+            section=combined_sections,
+            index_name=datasource_name,
+            index_config=config.index_config,
+            provider=provider,
+            checkpoint=job,
+        )
+    except BaseException as e:
+        job.fail(e)
+        raise
+
+    info = read_index_info(local_dir_path)
+    info["report"]["ingest_job"] = job.stats()
+    info["report"]["extraction"] = {
+        "files": len(files),
+        **{
+            count: sum(file.get(count, 0) for file in job.files.values())
+            for count in ("pages", "rows", "sections")
+        },
+        "seconds": extraction["time"],
+    }
+    if cache is not None:
+        # every file was extracted or looked up, the other entries are stale
+        cache.prune(keep=cache.used)
+        stats = cache.stats()
+        info["report"]["extraction_cache"] = stats
+        print(
+            f"Extraction cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['stored']} stored"
+        )
+    write_index_info(local_dir_path, info)
 
     # Save local copies of files
     for f in files:
         f.file.seek(0)
         save_local_copy(f, local_dir_path)
 
+    write_file_manifest(
+        datasource_name, {name: {"sha256": digest} for name, digest in digests.items()}
+    )
+    job.finish()
+
     return datasource_name
+
+
+def update(
+    files: List,
+    datasource_name: str,
+    config: DatasourceConfig,
+    removed_file_names: Optional[List[str]] = None,
+) -> Dict[str, List[str]]:
+    """Add, replace or remove files of an existing datasource in place.
+
+    Only files that are new or whose content changed since they were indexed
+    are extracted and embedded; their previous sections are dropped first.
+    A datasource that does not exist yet is created with `main`.
+
+    Returns:
+        Dict[str, List[str]]: the file names "added", "replaced", "removed"
+            and "unchanged" by the update.
+    """
+    removed_file_names = [
+        name.replace(" ", "_").lstrip("_").rstrip("_")
+        for name in removed_file_names or []
+    ]
+    result: Dict[str, List[str]] = {
+        "added": [],
+        "replaced": [],
+        "removed": [],
+        "unchanged": [],
+    }
+
+    index_path = pathlib.Path(DATASOURCE_PATH) / datasource_name / "faiss.index"
+    if not index_path.exists():
+        main(files, [], datasource_name, config)
+        result["added"] = [f.filename for f in files]
+        return result
+
+    files = _prepare_files(files) if files else []
+    manifest = read_file_manifest(datasource_name)
+
+    changed = []
+    for file in files:
+        digest = file_sha256(file)
+        known = manifest.get(file.filename)
+        if known is not None and known["sha256"] == digest:
+            result["unchanged"].append(file.filename)
+            continue
+        result["replaced" if known is not None else "added"].append(file.filename)
+        manifest[file.filename] = {"sha256": digest}
+        changed.append(file)
+
+    # drop the old sections of every changed file, also covering files indexed
+    # before the datasource had a manifest, along with the removed files
+    stale = [f.filename for f in changed] + removed_file_names
+    if stale:
+        FAISSDS.remove_files(index_name=datasource_name, file_names=stale)
+    for name in removed_file_names:
+        if manifest.pop(name, None) is not None:
+            result["removed"].append(name)
+        local_copy = pathlib.Path(DATASOURCE_PATH) / datasource_name / name
+        if local_copy.exists():
+            local_copy.unlink()
+
+    if changed:
+        cache = extraction_cache(datasource_name) if config.extraction_cache else None
+        FAISSDS.append(
+            section=extract_sections(changed, datasource_name, config, cache),
+            index_name=datasource_name,
+        )
+        local_dir_path = create_local_dir(datasource_name)
+        for f in changed:
+            f.file.seek(0)
+            save_local_copy(f, local_dir_path, overwrite=True)
+
+    write_file_manifest(datasource_name, manifest)
+    return result
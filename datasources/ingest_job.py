@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+INGEST_JOB_DIR = "ingest_job"
+JOB_MANIFEST_NAME = "job.json"
+CHUNKS_NAME = "chunks.jsonl"
+VECTORS_NAME = "vectors.f32"
+
+
+def _chunk_digest(texts: List[str]) -> str:
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8", "surrogatepass"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class IngestJob:
+    """The progress of building a datasource, kept on disk so a failed run resumes.
+
+    The job directory holds job.json, the manifest of the files being
+    ingested with their extraction status, and a checkpoint of every chunk
+    of sections embedded so far: their vectors back to back in vectors.f32
+    and one line per chunk in chunks.jsonl with its size and a digest of its
+    texts. A later run replays the checkpointed chunks instead of embedding
+    them again for as long as its chunks are the same; the first chunk that
+    differs drops the checkpoints from there on. The job is removed once the
+    index it was building is published.
+    """
+
+    def __init__(self, path: str, files: Dict[str, str], embedding: Dict):
+        self.path = path
+        self.embedding = embedding
+        self.files: Dict[str, Dict[str, Any]] = {
+            name: {"sha256": digest, "status": "pending", "sections": 0}
+            for name, digest in files.items()
+        }
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.chunks: List[Dict] = []
+        # chunks of this run replayed or embedded so far
+        self.position = 0
+        self.replayed = 0
+        self.embedded = 0
+        self.resumed = False
+
+    @classmethod
+    def start(cls, path: str, files: Dict[str, str], embedding: Dict) -> "IngestJob":
+        """Resume the job left at `path` by a failed run, or start a new one.
+
+        Args:
+            path (str): the job directory, inside the datasource's directory.
+            files (Dict[str, str]): the sha256 of every file to ingest, by name.
+            embedding (Dict): the description of the embedding provider;
+                checkpoints embedded by another one are dropped.
+        """
+        job = cls(path, files, embedding)
+        previous = job._read_manifest()
+        if previous is not None and previous.get("embedding") == embedding:
+            job.chunks = job._read_chunks()
+            job.resumed = bool(job.chunks)
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+        job._write_chunks()
+        job.save()
+        return job
+
+    def _read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.path, JOB_MANIFEST_NAME), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _read_chunks(self) -> List[Dict]:
+        """The checkpointed chunks whose vectors were completely written."""
+        chunks = []
+        try:
+            with open(os.path.join(self.path, CHUNKS_NAME), "r") as f:
+                for line in f:
+                    chunks.append(json.loads(line))
+        except (OSError, ValueError):
+            # a line cut short by a crash ends the usable checkpoints
+            pass
+        vectors_path = os.path.join(self.path, VECTORS_NAME)
+        size = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+        end = 0
+        for i, chunk in enumerate(chunks):
+            end += chunk["sections"] * chunk["dim"] * 4
+            if end > size:
+                return chunks[:i]
+        return chunks
+
+    def _write_chunks(self) -> None:
+        """Rewrite the chunk list and cut vectors.f32 to the chunks it lists."""
+        path = os.path.join(self.path, CHUNKS_NAME)
+        with open(f"{path}.tmp", "w") as f:
+            for chunk in self.chunks:
+                f.write(json.dumps(chunk) + "\n")
+        os.replace(f"{path}.tmp", path)
+        with open(os.path.join(self.path, VECTORS_NAME), "ab") as f:
+            f.truncate(sum(c["sections"] * c["dim"] * 4 for c in self.chunks))
+
+    def save(self) -> None:
+        path = os.path.join(self.path, JOB_MANIFEST_NAME)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(
+                {
+                    "status": self.status,
+                    "error": self.error,
+                    "embedding": self.embedding,
+                    "files": self.files,
+                    "embedded_chunks": len(self.chunks),
+                    "embedded_sections": sum(c["sections"] for c in self.chunks),
+                },
+                f,
+                indent=2,
+            )
+        os.replace(f"{path}.tmp", path)
+
+    def file_extracted(self, filename: str, counts: Dict[str, int]) -> None:
+        """Record that all sections of a file were extracted, and how many."""
+        self.files[filename].update(status="extracted", **counts)
+
+    def replay(self, texts: List[str]) -> Optional[np.ndarray]:
+        """The checkpointed vectors of the next chunk, None if it must be embedded."""
+        if self.position < len(self.chunks):
+            chunk = self.chunks[self.position]
+            if chunk["sections"] == len(texts) and chunk["digest"] == _chunk_digest(
+                texts
+            ):
+                offset = sum(
+                    c["sections"] * c["dim"] * 4 for c in self.chunks[: self.position]
+                )
+                vectors = np.fromfile(
+                    os.path.join(self.path, VECTORS_NAME),
+                    dtype=np.float32,
+                    count=chunk["sections"] * chunk["dim"],
+                    offset=offset,
+                ).reshape(chunk["sections"], chunk["dim"])
+                self.position += 1
+                self.replayed += 1
+                return vectors
+            # the sections changed since the checkpoint, embed from here on
+            del self.chunks[self.position :]
+            self._write_chunks()
+        return None
+
+    def checkpoint(self, texts: List[str], vectors: np.ndarray) -> None:
+        """Persist the vectors of a chunk just embedded."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with open(os.path.join(self.path, VECTORS_NAME), "ab") as f:
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        # listed only once its vectors are on disk
+        chunk = {
+            "sections": vectors.shape[0],
+            "dim": vectors.shape[1],
+            "digest": _chunk_digest(texts),
+        }
+        with open(os.path.join(self.path, CHUNKS_NAME), "a") as f:
+            f.write(json.dumps(chunk) + "\n")
+        self.chunks.append(chunk)
+        self.position += 1
+        self.embedded += 1
+        self.save()
+
+    def fail(self, error: BaseException) -> None:
+        """Keep the job for the next run, recording why this one stopped."""
+        self.status = "failed"
+        self.error = f"{type(error).__name__}: {error}"
+        self.save()
+
+    def finish(self) -> None:
+        """Remove the job once the index it was building is published."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def stats(self) -> Dict:
+        return {
+            "resumed": self.resumed,
+            "replayed_chunks": self.replayed,
+            "embedded_chunks": self.embedded,
+        }
@@ -0,0 +1,151 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Literal, Optional
+
+import numpy as np
+
+from .embedding_providers import EmbeddingProvider
+from .faiss_ds import FAISSDS, get_query_embeddings
+
+# FAISS releases the GIL while searching, so subjects are searched in parallel
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS") or 8)
+# Hits per subject whose score distribution the top hits are normalized against
+FANOUT_CANDIDATES = 50
+
+# "zscore" scores hits by how far they stand out from the other candidates of
+# their subject, "minmax" rescales each subject to [0, 1], "none" keeps the
+# raw inner products
+Normalization = Literal["zscore", "minmax", "none"]
+# What a broken datasource raises, e.g. for files missing or cut short, which
+# skips its subject instead of failing the answer of the others
+SUBJECT_ERRORS = (OSError, RuntimeError, ValueError)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=FANOUT_WORKERS, thread_name_prefix="fanout"
+            )
+        return _executor
+
+
+def normalize_scores(
+    scores: np.ndarray, method: Normalization = "zscore"
+) -> np.ndarray:
+    """Map the scores of one subject's hits onto a scale shared by all subjects.
+
+    Every method is increasing, so the order of the hits is kept.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if method == "none" or len(scores) == 0:
+        return scores
+    if method == "minmax":
+        spread = scores.max() - scores.min()
+        if spread == 0:
+            return np.ones_like(scores)
+        return (scores - scores.min()) / spread
+    if method == "zscore":
+        std = scores.std()
+        if std == 0:
+            return np.zeros_like(scores)
+        return (scores - scores.mean()) / std
+    raise ValueError(f"Unknown score normalization: {method}")
+
+
+def search_subjects(
+    datasources: Dict[str, FAISSDS],
+    query: str,
+    topk: int,
+    normalization: Optional[Normalization] = None,
+    candidates: int = FANOUT_CANDIDATES,
+    errors: Optional[Dict[str, Exception]] = None,
+) -> List[Dict]:
+    """
+    Search several subjects' datasources at once and merge their hits.
+
+    The query is embedded once per distinct embedding provider (once, when
+    every subject uses the same model), each datasource is searched on a
+    thread pool and the best `topk` hits overall are merged with a heap.
+    Subjects embedded by the same provider share a vector space, so their raw
+    scores are merged as they are; otherwise scores are normalized per
+    subject over its top `candidates` hits. A subject whose search raises
+    one of SUBJECT_ERRORS is skipped, unless every subject failed, and the
+    error is recorded in `errors`.
+
+    Args:
+        datasources (Dict[str, FAISSDS]): The datasource of each subject.
+        query (str): The search query.
+        topk (int): The number of hits to return across all subjects.
+        normalization (Optional[Normalization]): How scores are made comparable
+            across subjects, "none" when they share a provider and "zscore"
+            otherwise by default.
+        candidates (int): Hits retrieved per subject to normalize against.
+        errors (Optional[Dict[str, Exception]]): Filled with the error of
+            every subject skipped.
+
+    Returns:
+        List[Dict]: The best hits, each with its "subject", normalized "score"
+            and the index's "raw_score".
+    """
+    if not datasources or topk <= 0:
+        return []
+
+    # one query embedding per vector space
+    providers: Dict[str, EmbeddingProvider] = {}
+    for ds in datasources.values():
+        providers.setdefault(_provider_key(ds), ds.provider)
+    vectors = {
+        key: get_query_embeddings([query], provider=provider)
+        for key, provider in providers.items()
+    }
+
+    if normalization is None:
+        normalization = "none" if len(providers) == 1 else "zscore"
+    k = topk if normalization == "none" else max(topk, candidates)
+    executor = _get_executor()
+    futures = {
+        subject: executor.submit(ds.search_vectors, vectors[_provider_key(ds)], k)
+        for subject, ds in datasources.items()
+    }
+
+    ranked = []
+    failed: Dict[str, Exception] = {}
+    for subject, future in futures.items():
+        try:
+            hits = future.result()[0]
+        except SUBJECT_ERRORS as e:
+            # one broken datasource must not fail the answer of the others
+            failed[subject] = e
+            continue
+        scores = normalize_scores(
+            np.array([hit["score"] for hit in hits]), normalization
+        )
+        ranked.append(
+            [
+                {**hit, "subject": subject, "raw_score": hit["score"], "score": score}
+                for hit, score in zip(hits, scores.tolist())
+            ]
+        )
+
+    if errors is not None:
+        errors.update(failed)
+    if failed and not ranked:
+        # nothing to answer with, fail as the search of a single subject would
+        raise next(iter(failed.values()))
+
+    # every subject's list is already sorted, so a k-way heap merge suffices
+    merged = heapq.merge(*ranked, key=lambda hit: -hit["score"])
+    return list(itertools.islice(merged, topk))
+
+
+def _provider_key(ds: FAISSDS) -> str:
+    return json.dumps(ds.provider.describe(), sort_keys=True)
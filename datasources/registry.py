@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, cast
+
+from .faiss_ds import FAISSDS, Storage, datasource_files
+
+# Upper bound on the total size of datasources kept loaded, overridable per host
+DEFAULT_MAX_BYTES = int(os.getenv("FAISS_REGISTRY_MAX_BYTES") or 1024**3)
+DEFAULT_STORAGE = cast(Storage, os.getenv("FAISS_STORAGE") or "mmap")
+
+# the path, mtime and size of every datasource file, None for missing files
+FileStat = Tuple[str, Optional[int], Optional[int]]
+Signature = Tuple[FileStat, ...]
+
+
+class _Entry:
+    def __init__(self, ds: FAISSDS, signature: Signature, nbytes: int):
+        self.ds = ds
+        self.signature = signature
+        self.nbytes = nbytes
+
+
+class FAISSDSRegistry:
+    """A thread-safe, process-wide cache of loaded FAISSDS instances.
+
+    Datasources are opened with the given `storage` mode, kept in
+    least-recently-used order and evicted once the total resident size
+    exceeds `max_bytes`. Every lookup compares the mtime and size of the
+    datasource files against the loaded copy, so a re-ingested subject is
+    picked up without restarting the bot.
+    """
+
+    def __init__(
+        self, max_bytes: int = DEFAULT_MAX_BYTES, storage: Storage = DEFAULT_STORAGE
+    ):
+        self.max_bytes = max_bytes
+        self.storage = storage
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # per-datasource locks so concurrent misses on one subject load it once
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+        self.load_time = 0.0
+
+    @staticmethod
+    def _signature(index_name: str) -> Signature:
+        signature: List[FileStat] = []
+        for path in datasource_files(index_name):
+            try:
+                st = os.stat(path)
+                signature.append((path, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+    def get(self, index_name: str) -> FAISSDS:
+        """Return the loaded datasource for `index_name`, loading it if needed."""
+        signature = self._signature(index_name)
+
+        with self._lock:
+            entry = self._entries.get(index_name)
+            if entry is not None and entry.signature == signature:
+                self._entries.move_to_end(index_name)
+                self.hits += 1
+                return entry.ds
+            load_lock = self._load_locks.setdefault(index_name, threading.Lock())
+
+        with load_lock:
+            # another thread may have finished loading while we waited
+            with self._lock:
+                entry = self._entries.get(index_name)
+                if entry is not None and entry.signature == signature:
+                    self._entries.move_to_end(index_name)
+                    self.hits += 1
+                    return entry.ds
+
+            start = time.perf_counter()
+            ds = FAISSDS(index_name=index_name, storage=self.storage)
+            elapsed = time.perf_counter() - start
+            new_entry = _Entry(ds, signature, ds.nbytes)
+
+            with self._lock:
+                self.misses += 1
+                self.load_time += elapsed
+                if index_name in self._entries:
+                    self.reloads += 1
+                    del self._entries[index_name]
+                self._entries[index_name] = new_entry
+                self._evict()
+
+        return ds
+
+    def _evict(self) -> None:
+        # the most recently used entry is always kept, even if it alone exceeds the cap
+        while len(self._entries) > 1 and self.resident_bytes > self.max_bytes:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def invalidate(self, index_name: Optional[str] = None) -> None:
+        """Drop one datasource, or every datasource if no name is given."""
+        with self._lock:
+            if index_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(index_name, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "load_time": self.load_time,
+                "loaded": list(self._entries.keys()),
+                "resident_bytes": self.resident_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+registry = FAISSDSRegistry()
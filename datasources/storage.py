@@ -0,0 +1,290 @@
+import array
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zipfile
+from typing import Dict, Iterable, Iterator, Optional, Protocol, Tuple
+
+import faiss
+import numpy as np
+
+META_DATA_NAME = "meta_data.bin"
+META_OFFSETS_NAME = "meta_data.idx"
+
+# fourcc of the IndexFlat variants written by faiss.write_index
+_FLAT_FOURCC = {b"IxFI": faiss.METRIC_INNER_PRODUCT, b"IxF2": faiss.METRIC_L2}
+
+
+class Records(Protocol):
+    """The section records of a datasource, a list or a MetaStore."""
+
+    def __len__(self) -> int: ...
+
+    def __getitem__(self, i: int) -> Dict: ...
+
+    def __iter__(self) -> Iterator[Dict]: ...
+
+
+class MetaStore:
+    """A read-only, memory-mapped store of section records.
+
+    Records are kept as concatenated JSON blobs in `meta_data.bin`, with a
+    `meta_data.idx` array of uint64 offsets (n + 1 entries) next to it, so
+    looking up a record only touches the bytes of that record.
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self._offsets = np.load(
+            os.path.join(index_dir, META_OFFSETS_NAME), mmap_mode="r"
+        )
+        self._file = open(os.path.join(index_dir, META_DATA_NAME), "rb")
+        self._data = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(self) > 0
+            else b""
+        )
+
+    def __len__(self) -> int:
+        return max(len(self._offsets) - 1, 0)
+
+    def __getitem__(self, i: int) -> Dict:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"record {i} out of range")
+        return json.loads(self._data[int(self._offsets[i]) : int(self._offsets[i + 1])])
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held outside the page cache: only the offsets array."""
+        return int(self._offsets.nbytes)
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    @staticmethod
+    def write(index_dir: str, records: Iterable[Dict]) -> int:
+        """Write records to the store, atomically replacing any previous one."""
+        with MetaStoreWriter(index_dir) as writer:
+            for record in records:
+                writer.append(record)
+        writer.publish()
+        return writer.count
+
+    @staticmethod
+    def from_jsonl(index_dir: str, jsonl_path: str) -> "MetaStore":
+        """Open the store, (re)building it first if it is older than `jsonl_path`."""
+        offsets_path = os.path.join(index_dir, META_OFFSETS_NAME)
+        if not os.path.exists(offsets_path) or os.path.getmtime(
+            offsets_path
+        ) < os.path.getmtime(jsonl_path):
+            with open(jsonl_path, "r") as fi:
+                MetaStore.write(index_dir, (json.loads(line) for line in fi))
+        return MetaStore(index_dir)
+
+
+class MetaStoreWriter:
+    """Appends records to a new MetaStore, kept beside the old one until published.
+
+    The new files get names unique to the writer, as processes loading the
+    same datasource may all rebuild its store at once.
+    """
+
+    def __init__(self, index_dir: str):
+        self.data_path = os.path.join(index_dir, META_DATA_NAME)
+        self.offsets_path = os.path.join(index_dir, META_OFFSETS_NAME)
+        self._offsets = array.array("Q", [0])
+        fd, self.data_tmp_path = tempfile.mkstemp(
+            prefix=f"{META_DATA_NAME}.", suffix=".tmp", dir=index_dir
+        )
+        self._file = os.fdopen(fd, "wb")
+        fd, self.offsets_tmp_path = tempfile.mkstemp(
+            prefix=f"{META_OFFSETS_NAME}.", suffix=".tmp", dir=index_dir
+        )
+        os.close(fd)
+
+    @property
+    def count(self) -> int:
+        return len(self._offsets) - 1
+
+    def append(self, record: Dict) -> None:
+        blob = json.dumps(record).encode("utf-8")
+        self._file.write(blob)
+        self._offsets.append(self._offsets[-1] + len(blob))
+
+    def close(self) -> None:
+        self._file.close()
+        # np.save appends .npy to names without it, so write through a file object
+        with open(self.offsets_tmp_path, "wb") as f:
+            np.save(f, np.frombuffer(self._offsets, dtype=np.uint64))
+
+    def publish(self) -> None:
+        """Replace the previous store with the closed new one."""
+        os.replace(self.data_tmp_path, self.data_path)
+        os.replace(self.offsets_tmp_path, self.offsets_path)
+
+    def discard(self) -> None:
+        self._file.close()
+        for path in [self.data_tmp_path, self.offsets_tmp_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __enter__(self) -> "MetaStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        # keep the previous store when writing the new one failed
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class VectorSpill:
+    """A raw float32 file that embeddings are appended to chunk by chunk.
+
+    Lets an index be trained and filled from disk after the whole corpus has
+    been embedded, without keeping every vector in memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self.dim: Optional[int] = None
+        self._file = open(path, "wb")
+
+    def append(self, vectors: np.ndarray) -> None:
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        self._file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self.count += vectors.shape[0]
+
+    def open(self) -> np.ndarray:
+        """Finish writing and map the vectors as a read-only (count, dim) matrix."""
+        self._file.close()
+        if self.count == 0 or self.dim is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(
+            self.path, dtype=np.float32, mode="r", shape=(self.count, self.dim)
+        )
+
+    def remove(self) -> None:
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class MmapFlatIndex:
+    """Exact search over the vectors of a flat index file, without loading it.
+
+    `faiss.write_index` stores an IndexFlat as a small header followed by the
+    raw float32 matrix, so the matrix can be mapped straight from `faiss.index`
+    and shared through the page cache by every process that opens it.
+    """
+
+    def __init__(self, vectors: np.ndarray, metric_type: int):
+        self.vectors = vectors
+        self.metric_type = metric_type
+        self.ntotal, self.d = vectors.shape
+
+    def search(self, x: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        n = x.shape[0]
+        kk = min(k, self.ntotal)
+        if kk > 0:
+            scores, indices = faiss.knn(x, self.vectors, kk, self.metric_type)
+        else:
+            scores = np.empty((n, 0), dtype=np.float32)
+            indices = np.empty((n, 0), dtype=np.int64)
+        if kk < k:
+            # pad the same way faiss does when there are fewer than k vectors
+            fill = (
+                -np.finfo(np.float32).max
+                if self.metric_type == faiss.METRIC_INNER_PRODUCT
+                else np.finfo(np.float32).max
+            )
+            scores = np.hstack([scores, np.full((n, k - kk), fill, np.float32)])
+            indices = np.hstack([indices, np.full((n, k - kk), -1, np.int64)])
+        return scores, indices
+
+    @staticmethod
+    def open(index_path: str) -> "MmapFlatIndex":
+        """Map the vectors of `index_path`, raising ValueError if it is not flat."""
+        with open(index_path, "rb") as f:
+            header = f.read(64)
+        fourcc = header[:4]
+        if fourcc not in _FLAT_FOURCC:
+            raise ValueError(f"{index_path} is not a flat index")
+
+        # Index header: d, ntotal, two unused int64, is_trained, metric_type
+        d, ntotal, _, _, _, metric_type = struct.unpack_from("<iqqq?i", header, 4)
+        pos = 4 + struct.calcsize("<iqqq?i")
+        if metric_type > 1:
+            pos += 4  # metric_arg
+        (size,) = struct.unpack_from("<Q", header, pos)
+        pos += 8
+
+        expected = pos + size * 4
+        if size != ntotal * d or os.path.getsize(index_path) != expected:
+            raise ValueError(f"unexpected flat index layout in {index_path}")
+
+        vectors = np.memmap(
+            index_path, dtype=np.float32, mode="r", offset=pos, shape=(ntotal, d)
+        )
+        return MmapFlatIndex(vectors, metric_type)
+
+
+def map_npz(path: str) -> Dict[str, np.ndarray]:
+    """Map the arrays of an uncompressed .npz file, as written by np.savez.
+
+    np.load reads every member of an .npz into memory whatever its
+    mmap_mode, but np.savez stores them uncompressed, each an .npy file whose
+    data can be mapped in place once the zip and .npy headers are skipped.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{info.filename} of {path} is compressed")
+            # local file header: 30 bytes, then the name and extra field
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", f.read(4))
+            f.seek(name_length + extra_length, os.SEEK_CUR)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[: -len(".npy")]
+            if dtype.hasobject or fortran_order:
+                raise ValueError(f"{name} of {path} cannot be mapped")
+            if not shape or 0 in shape:
+                # nothing to map, and scalars are read as they are
+                arrays[name] = np.load(zf.open(info))
+                continue
+            arrays[name] = np.memmap(
+                path, dtype=dtype, mode="r", offset=f.tell(), shape=shape
+            )
+    return arrays
+
+
+def read_index_mmap(index_path: str):
+    """Open an index so its vectors are served from the page cache where possible.
+
+    Flat indexes are mapped directly; other index types fall back to faiss'
+    IO_FLAG_MMAP, which maps the inverted lists of IVF indexes.
+    """
+    try:
+        return MmapFlatIndex.open(index_path)
+    except ValueError:
+        return faiss.read_index(
+            index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        )
@@ -18,7 +18,11 @@ from resources.prompt import (
     qa_prompt_msg2,
 )
 from tools.form_recognizer import analyze_image
-from tools.messenger import retrieve_from_subject, schola_reply
+from tools.messenger import (
+    SEARCH_ENROLLED_SUBJECTS,
+    retrieve_from_subjects,
+    schola_reply,
+)
 from tools.whisper import transcribe_voice
 from utils.const import DEFAULT_PIPELINE, QA_PIPELINE
 from utils.keyboard_markup import send_main_menu
@@ -51,13 +55,17 @@ async def _qa_retrieval_generation(update: Update, user_id: str, user_message: s
     try:
         history: List[Dict[str, str]] = db.get_chat_history(user_id)
         subject: str = db.get_current_subject(user_id)
+        subjects: List[str] = [subject]
+        if SEARCH_ENROLLED_SUBJECTS:
+            # the other enrolled subjects' datasources are searched along with it
+            subjects += [s.strip() for s in db.get_user_subjects(user_id)]
 
         bot_response: str = call_openai(
             history=history,
             query=qa_prompt_msg2.format(
                 subject=subject,
                 query=user_message,
-                sources=retrieve_from_subject(user_message, subject),
+                sources=retrieve_from_subjects(user_message, subjects),
             ),
         )
     except Exception as e:
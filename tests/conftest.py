@@ -0,0 +1,109 @@
+import hashlib
+import os
+from io import BytesIO
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+# the OpenAI clients are created at import time, they never make a call in tests
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("EMBEDDING_CACHE_FILE", ":memory:")
+os.environ.setdefault("EMBEDDING_STORE_FILE", ":memory:")
+
+EMBEDDING_DIM = 16
+
+
+def fake_embedding(text: str) -> np.ndarray:
+    """A deterministic, unit-length stand-in for an OpenAI embedding."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM)
+    return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+
+@pytest.fixture
+def datasource_path(tmp_path, monkeypatch):
+    """Point every datasource module at an empty temporary directory."""
+    from datasources import faiss_ds, ingest
+
+    monkeypatch.setattr(faiss_ds, "DATASOURCE_PATH", str(tmp_path))
+    monkeypatch.setattr(ingest, "DATASOURCE_PATH", str(tmp_path))
+    return tmp_path
+
+
+class FakeOpenAI:
+    """Just enough of openai.OpenAI for the embeddings endpoint, counting calls."""
+
+    def __init__(self):
+        self.calls = []
+        self.embeddings = self
+
+    def create(self, input, model, dimensions=None, **kwargs):
+        self.calls.append(list(input))
+        vectors = [fake_embedding(text) for text in input]
+        if dimensions:
+            # shortened like the text-embedding-3 models: truncated, renormalized
+            vectors = [v[:dimensions] / np.linalg.norm(v[:dimensions]) for v in vectors]
+        return SimpleNamespace(
+            data=[SimpleNamespace(embedding=vector.tolist()) for vector in vectors]
+        )
+
+
+class FakeAsyncOpenAI:
+    """The async counterpart of FakeOpenAI, recording into the same calls list."""
+
+    def __init__(self, sync_client: FakeOpenAI, headers=None):
+        self.sync_client = sync_client
+        self.headers = headers or {}
+        self.embeddings = self
+        self.with_raw_response = self
+
+    async def create(self, input, model, **kwargs):
+        response = self.sync_client.create(input, model, **kwargs)
+        return SimpleNamespace(headers=self.headers, parse=lambda: response)
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    """Route embedding requests, sync and async, to a FakeOpenAI client."""
+    import openai
+
+    from datasources import embedding_providers
+
+    client = FakeOpenAI()
+    monkeypatch.setattr(embedding_providers, "openai_client", lambda: client)
+    monkeypatch.setattr(openai, "AsyncOpenAI", lambda **kw: FakeAsyncOpenAI(client))
+    return client
+
+
+@pytest.fixture
+def fake_embeddings(fake_openai, monkeypatch):
+    """Embed with `fake_embedding`, starting from an empty query cache and store."""
+    from datasources import faiss_ds
+    from datasources.embedding_cache import EmbeddingCache
+    from datasources.embedding_store import EmbeddingStore
+
+    cache, store = EmbeddingCache(":memory:"), EmbeddingStore(":memory:")
+    monkeypatch.setattr(faiss_ds, "query_cache", lambda: cache)
+    monkeypatch.setattr(faiss_ds, "embedding_store", lambda: store)
+    return fake_openai
+
+
+def make_upload(filename: str, content: bytes):
+    """An uploaded file as handed to datasources.ingest."""
+    return SimpleNamespace(filename=filename, file=BytesIO(content))
+
+
+def make_sections(n: int, prefix: str = "doc"):
+    return [
+        {
+            "id": f"{prefix}-{i}",
+            "search_key": f"{prefix} section number {i}",
+            "content": f"{prefix} section number {i}",
+            "file_url": f"{prefix}/{prefix}.pdf#page={i + 1}",
+        }
+        for i in range(n)
+    ]
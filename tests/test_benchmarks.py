@@ -0,0 +1,57 @@
+import json
+
+from benchmarks import chunking, retrieval
+from datasources import faiss_ds
+
+
+def test_retrieval_benchmark_smoke(tmp_path, capsys):
+    """The benchmark harness runs end to end on a tiny corpus."""
+    output = tmp_path / "bench.json"
+    previous_path = faiss_ds.DATASOURCE_PATH
+
+    retrieval.main(
+        [
+            "--sizes", "200",
+            "--modes", "vector", "auto",
+            "--dim", "16",
+            "--queries", "20",
+            "--output", str(output),
+        ]
+    )  # fmt: skip
+
+    results = json.loads(output.read_text())
+    assert faiss_ds.DATASOURCE_PATH == previous_path
+    assert results["meta"]["embedding"] == {"provider": "stub", "dim": 16}
+    assert [(r["storage"], r["size"]) for r in results["results"]] == [
+        ("memory", 200),
+        ("mmap", 200),
+    ]
+    for result in results["results"]:
+        assert result["create"]["sections_per_second"] > 0
+        assert result["create"]["recall"] == 1.0
+        assert result["load"]["resident_bytes"] > 0
+        assert [s["mode"] for s in result["search"]] == ["vector", "auto"]
+        assert all(0 < s["p50_ms"] <= s["p99_ms"] for s in result["search"])
+
+
+def test_retrieval_benchmark_prints_only_json_to_stdout(tmp_path, capsys):
+    """Progress goes to stderr, so stdout can be piped to a JSON consumer."""
+    retrieval.main(
+        ["--sizes", "50", "--storages", "memory", "--dim", "8", "--queries", "5"]
+    )
+
+    captured = capsys.readouterr()
+    assert json.loads(captured.out)["results"][0]["size"] == 50
+    assert "Building Flat index of 50 sections..." in captured.err
+
+
+def test_chunking_benchmark_smoke(tmp_path):
+    output = tmp_path / "chunking.json"
+
+    chunking.main(["--pages", "20", "--repeats", "1", "--output", str(output)])
+
+    results = json.loads(output.read_text())
+    assert results["pages"] == 20
+    assert results["identical"] is True
+    assert results["sections"] > 0
+    assert 0 < results["streaming_peak_bytes"]
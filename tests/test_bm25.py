@@ -0,0 +1,162 @@
+import numpy as np
+import pytest
+
+from datasources.bm25 import BM25Builder, BM25Index, tokenize
+from datasources.faiss_ds import FAISSDS
+
+from .conftest import make_sections
+
+TEXTS = [
+    "Franco ruled Spain from 1939 until 1975",
+    "The Spanish Civil War began in 1936",
+    "Philip II sent the Armada against England in 1588",
+    "The Reconquista ended with the fall of Granada in 1492",
+    "Spain joined the EU in 1986",
+] + [f"filler section about the history of Spain number {i}" for i in range(40)]
+
+
+def build(texts=TEXTS) -> BM25Index:
+    builder = BM25Builder()
+    for text in texts:
+        builder.add(text)
+    return builder.build()
+
+
+def test_tokenize():
+    assert tokenize("The EU, in 1986!") == ["the", "eu", "in", "1986"]
+    assert tokenize("x" * 65 + " ok") == ["ok"]
+
+
+def test_search_ranks_by_bm25():
+    bm25 = build()
+    scores, rows, coverage = bm25.search("civil war 1936", 3)
+    assert rows[0] == 1
+    assert coverage[0] == 1.0
+    assert list(scores) == sorted(scores, reverse=True)
+    # a rarer term outweighs a common one
+    scores, rows, _ = bm25.search("spain armada", 1)
+    assert rows.tolist() == [2]
+    assert len(bm25.search("unknown words", 5)[1]) == 0
+
+
+def test_confident_search_only_answers_rare_specific_queries():
+    bm25 = build()
+    scores, rows = bm25.confident_search("Granada 1492", 5)
+    assert rows.tolist() == [3]
+    # "spain" is in most sections, "wibble" in none, and long queries are left to vectors
+    assert bm25.confident_search("Spain", 5) is None
+    assert bm25.confident_search("franco wibble", 5) is None
+    assert bm25.confident_search("when did franco rule spain from 1939", 5) is None
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_save_and_load(tmp_path, mmap):
+    bm25 = build(TEXTS + ["Málaga and Cádiz", "東京 1964"])
+    path = str(tmp_path / "bm25.npz")
+    bm25.save(path)
+    loaded = BM25Index.load(path, mmap=mmap)
+    for query in ["franco", "the fall of granada", "eu", "cádiz", "東京"]:
+        expected, actual = bm25.search(query, 3), loaded.search(query, 3)
+        assert len(expected[1]) > 0
+        assert np.array_equal(expected[1], actual[1])
+        assert np.allclose(expected[0], actual[0])
+    # mapped postings are served from the page cache
+    assert (loaded.nbytes == 0) == mmap
+
+
+def test_load_index_with_unpacked_terms(tmp_path):
+    """Indexes written with a fixed-width array of terms still load."""
+    bm25 = build()
+    terms = [
+        bm25.term_bytes[start:end].tobytes().decode()
+        for start, end in zip(bm25.term_offsets[:-1], bm25.term_offsets[1:])
+    ]
+    path = tmp_path / "bm25.npz"
+    with open(path, "wb") as f:
+        np.savez(
+            f,
+            terms=np.array(terms, dtype=str),
+            indptr=bm25.indptr,
+            doc_ids=bm25.doc_ids,
+            weights=bm25.weights,
+            num_docs=np.int64(bm25.num_docs),
+        )
+
+    loaded = BM25Index.load(str(path), mmap=True)
+
+    assert loaded.search("civil war 1936", 1)[1].tolist() == [1]
+    assert loaded.document_frequency("spain") == bm25.document_frequency("spain")
+
+
+def rare_sections():
+    sections = make_sections(40)
+    sections[7] = {**sections[7], "search_key": "Treaty of Tordesillas 1494"}
+    return sections
+
+
+@pytest.mark.parametrize("storage", ["memory", "mmap"])
+def test_auto_mode_answers_rare_terms_without_embedding(
+    datasource_path, fake_embeddings, storage
+):
+    FAISSDS.create(iter(rare_sections()), "History")
+    ds = FAISSDS("History", storage=storage)
+    fake_embeddings.calls.clear()
+
+    hits = ds.search_request("tordesillas", topk=3, mode="auto")
+    assert [hit["id"] for hit in hits] == ["doc-7"]
+    assert fake_embeddings.calls == []
+
+    # a common term goes through the embeddings
+    hits = ds.search_request("section number", topk=3, mode="auto")
+    assert len(hits) == 3
+    assert fake_embeddings.calls == [["section number"]]
+
+
+def test_lexical_and_hybrid_modes(datasource_path, fake_embeddings):
+    FAISSDS.create(iter(rare_sections()), "History")
+    ds = FAISSDS("History")
+
+    lexical = ds.search_request("section number 12", topk=2, mode="lexical")
+    assert lexical[0]["id"] == "doc-12"
+
+    hybrid = ds.search_many(
+        ["Treaty of Tordesillas 1494", "doc section number 3"], topk=4, mode="hybrid"
+    )
+    assert [hits[0]["id"] for hits in hybrid] == ["doc-7", "doc-3"]
+    assert all(len(hits) == 4 for hits in hybrid)
+    assert (
+        hybrid[0][1:]
+        == ds.search_request(
+            "Treaty of Tordesillas 1494", topk=4, skip=1, mode="hybrid"
+        )[:3]
+    )
+
+    with pytest.raises(ValueError):
+        ds.search_request("treaty", topk=1, mode="fuzzy")
+
+
+def test_updates_keep_the_lexical_index_aligned(datasource_path, fake_embeddings):
+    FAISSDS.create(iter(make_sections(10)), "History")
+    FAISSDS.append(iter(make_sections(3, prefix="war")), "History")
+    FAISSDS.remove_files("History", ["doc.pdf"])
+
+    ds = FAISSDS("History")
+    assert ds.bm25.num_docs == 3
+    hits = ds.search_request("war section number 2", topk=1, mode="lexical")
+    assert hits[0]["id"] == "war-2"
+
+
+def test_datasources_without_lexical_index(datasource_path, fake_embeddings):
+    FAISSDS.create(iter(make_sections(10)), "History")
+    (datasource_path / "History" / "bm25.npz").unlink()
+    ds = FAISSDS("History")
+
+    assert (
+        ds.search_request("doc section number 1", topk=1, mode="auto")[0]["id"]
+        == "doc-1"
+    )
+    assert ds.search_request("doc section number 4", topk=3, mode="hybrid") == (
+        ds.search_request("doc section number 4", topk=3, mode="vector")
+    )
+    with pytest.raises(ValueError):
+        ds.search_request("doc", topk=1, mode="lexical")
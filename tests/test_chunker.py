@@ -0,0 +1,69 @@
+import itertools
+import random
+
+from benchmarks.chunking import (
+    reference_split_text,
+    synthetic_page_map,
+    synthetic_pages,
+)
+from datasources.chunker import PageLocator, split_text
+
+
+def _random_page_map(rng):
+    pieces = ["a", "bc", "é", "字", ".", "!", "?", " ", ",", ";", "\n", "(", "<table>", "</table>"]  # fmt: skip
+    page_map = []
+    offset = 0
+    for page_num in range(rng.randint(0, 6)):
+        text = "".join(rng.choices(pieces, k=rng.randint(0, 120)))
+        page_map.append((page_num, offset, text))
+        offset += len(text)
+    return page_map
+
+
+def _sections(split, page_map, *args):
+    # degenerate settings can loop forever in both, compare their first sections
+    return list(itertools.islice(split(page_map, *args), 200))
+
+
+def test_split_text_matches_reference_splitter():
+    rng = random.Random(0)
+    for _ in range(3000):
+        page_map = _random_page_map(rng)
+        max_length = rng.randint(1, 60)
+        args = (max_length, rng.randint(0, 20), rng.randint(0, max_length))
+        assert _sections(split_text, page_map, *args) == _sections(
+            reference_split_text, page_map, *args
+        ), (page_map, args)
+
+
+def test_split_text_matches_reference_on_a_book():
+    page_map = synthetic_page_map(30)
+    for args in [(1000, 100, 100), (1500, 100, 200), (300, 50, 0)]:
+        sections = list(split_text(page_map, *args))
+        assert sections == list(reference_split_text(page_map, *args))
+        assert sections[-1][1] == len(page_map) - 1
+
+
+def test_page_locator():
+    locate = PageLocator([0, 10, 10, 25])
+    assert [locate(offset) for offset in [0, 9, 10, 24, 25, 1000]] == [0, 0, 2, 2, 3, 3]
+    assert PageLocator([5, 10])(0) == 1
+
+
+def test_split_text_streams_pages():
+    """Sections come out while later pages are still to be extracted."""
+    read = []
+
+    def pages():
+        for page in synthetic_pages(50):
+            read.append(page[0])
+            yield page
+
+    sections = split_text(pages(), 1000, 100, 100)
+    first = next(sections)
+
+    assert len(read) <= 2
+    assert [first, *sections] == list(
+        split_text(synthetic_page_map(50), 1000, 100, 100)
+    )
+    assert len(read) == 50
@@ -0,0 +1,125 @@
+import sys
+import time
+
+import pytest
+
+from datasources import ingest
+from tools import conversion
+
+from .conftest import make_upload
+from .test_ingest import _pdf_bytes
+
+# "Converts" by copying each input to <outdir>/<stem>.pdf, logging the batch
+# sizes, and hangs halfway through writing documents starting with b"hang"
+FAKE_LIBREOFFICE = """#!{python}
+import os, sys, time
+
+args = sys.argv[1:]
+if "--version" in args:
+    sys.exit(0)
+outdir = args[args.index("--outdir") + 1]
+inputs = args[args.index("--outdir") + 2 :]
+with open({log!r}, "a") as log:
+    log.write(f"{{len(inputs)}}\\n")
+os.makedirs(outdir, exist_ok=True)
+for path in inputs:
+    with open(path, "rb") as f:
+        data = f.read()
+    stem = os.path.splitext(os.path.basename(path))[0]
+    with open(os.path.join(outdir, stem + ".pdf"), "wb") as f:
+        if data.startswith(b"hang"):
+            f.write(data[:2])
+            f.flush()
+            time.sleep(60)
+        f.write(data)
+"""
+
+
+@pytest.fixture
+def fake_libreoffice(tmp_path, monkeypatch):
+    """Point the conversion at a fake LibreOffice, returning its batch sizes."""
+    log = tmp_path / "invocations.log"
+    binary = tmp_path / "libreoffice"
+    binary.write_text(FAKE_LIBREOFFICE.format(python=sys.executable, log=str(log)))
+    binary.chmod(0o755)
+    monkeypatch.setattr(conversion, "LIBREOFFICE_BINARY", str(binary))
+    return lambda: [int(n) for n in log.read_text().split()] if log.exists() else []
+
+
+def test_documents_are_converted_in_batches(fake_libreoffice):
+    documents = [(f"doc{i}.docx", f"content {i}".encode()) for i in range(5)]
+    # documents sharing a name do not overwrite each other
+    documents.append(("doc0.pptx", b"other content"))
+
+    pdfs = conversion.convert_to_pdf(documents, workers=2, batch_size=4)
+
+    assert pdfs == [data for _, data in documents]
+    assert sorted(fake_libreoffice()) == [2, 4]
+
+
+def test_a_hanging_document_only_fails_itself(fake_libreoffice):
+    documents = [("a.doc", b"a"), ("hang.doc", b"hang"), ("c.doc", b"c")]
+
+    with pytest.raises(conversion.ConversionError) as error:
+        conversion.convert_to_pdf(documents, workers=1, batch_size=3, timeout=0.5)
+
+    # the PDF cut short by the kill is not taken for a conversion
+    assert error.value.failed == ["hang.doc"]
+    # the timed out batch is retried one document at a time
+    assert fake_libreoffice() == [3, 1, 1, 1]
+
+
+def test_a_hang_is_noticed_within_a_document_timeout(fake_libreoffice):
+    documents = [("hang.doc", b"hang")] + [(f"{i}.doc", b"x") for i in range(7)]
+
+    start = time.monotonic()
+    with pytest.raises(conversion.ConversionError):
+        conversion.convert_to_pdf(documents, workers=1, batch_size=8, timeout=0.5)
+
+    # not killed after 8 documents' worth of timeouts
+    assert time.monotonic() - start < 4
+    assert fake_libreoffice() == [8] + [1] * 8
+
+
+def test_missing_libreoffice(tmp_path, monkeypatch):
+    monkeypatch.setattr(conversion, "LIBREOFFICE_BINARY", str(tmp_path / "missing"))
+    with pytest.raises(conversion.ConversionError):
+        conversion.convert_to_pdf([("a.doc", b"a")])
+
+
+def test_ingest_converts_documents_together(fake_libreoffice, monkeypatch):
+    monkeypatch.setattr(ingest, "PDF_PAGEMAP_EXTRACTION_METHOD", "PyMuPDF")
+    files = [
+        make_upload("a.doc", _pdf_bytes(["Alpha. " * 40])),
+        make_upload("b.txt", b"beta"),
+        make_upload("c.pptx", _pdf_bytes(["Gamma. " * 40])),
+    ]
+
+    sections = list(
+        ingest.extract_sections(files, "History", ingest.DatasourceConfig())
+    )
+
+    assert fake_libreoffice() == [2]
+    assert [s["file_url"] for s in sections] == [
+        "History/a.doc#page=1",
+        "History/b.txt",
+        "History/c.pptx#page=1",
+    ]
+    assert sections[0]["content"].startswith("Alpha.")
+
+
+def test_ingest_converts_documents_as_they_are_reached(fake_libreoffice, monkeypatch):
+    monkeypatch.setattr(ingest, "PDF_PAGEMAP_EXTRACTION_METHOD", "PyMuPDF")
+    monkeypatch.setattr(ingest, "CONVERSION_WINDOW", 2)
+    files = [
+        make_upload(f"{i}.doc", _pdf_bytes([f"Page {i}. " * 40])) for i in range(5)
+    ]
+    config = ingest.DatasourceConfig(extraction_workers=1)
+
+    sections = ingest.extract_sections(files, "History", config)
+
+    assert next(sections)["content"].startswith("Page 0.")
+    # the later windows are converted once the extraction reaches them
+    assert fake_libreoffice() == [2]
+    assert len(list(sections)) == 4
+    assert fake_libreoffice() == [2, 2, 1]
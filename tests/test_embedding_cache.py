@@ -0,0 +1,78 @@
+import numpy as np
+
+from datasources import faiss_ds
+from datasources.embedding_cache import EmbeddingCache
+
+from .conftest import fake_embedding
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    """Vectors survive a restart through the SQLite tier."""
+    path = str(tmp_path / "cache.db")
+    cache = EmbeddingCache(path)
+    vector = fake_embedding("what is agile?")
+
+    assert cache.get("ada", "what is agile?") is None
+    cache.put("ada", "what is agile?", vector)
+    assert np.array_equal(cache.get("ada", "what  is\nagile? "), vector)
+    cache.close()
+
+    reopened = EmbeddingCache(path)
+    assert np.array_equal(reopened.get("ada", "what is agile?"), vector)
+    assert reopened.get("other-model", "what is agile?") is None
+    stats = reopened.stats()
+    assert stats["disk_hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_memory_tier_is_bounded():
+    """The LRU tier keeps at most max_memory_entries vectors."""
+    cache = EmbeddingCache(":memory:", max_memory_entries=2)
+    for text in ["a", "b", "c"]:
+        cache.put("ada", text, fake_embedding(text))
+
+    assert cache.stats()["memory_entries"] == 2
+    assert cache.get("ada", "a") is not None
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_is_pruned():
+    """The oldest rows are dropped once the table outgrows its cap."""
+    cache = EmbeddingCache(":memory:", max_memory_entries=1, max_disk_entries=10)
+    for i in range(11):
+        cache.put("ada", str(i), fake_embedding(str(i)))
+
+    (count,) = cache.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+    assert count == 9
+    assert cache.get("ada", "0") is None
+    assert cache.get("ada", "10") is not None
+
+
+def test_disk_tier_count_survives_restarts_and_replacements(tmp_path):
+    """Rows already on disk count towards the cap, replaced rows do not count twice."""
+    path = str(tmp_path / "cache.db")
+    cache = EmbeddingCache(path, max_disk_entries=10)
+    for i in range(10):
+        cache.put("ada", str(i), fake_embedding(str(i)))
+    for _ in range(5):
+        cache.put("ada", "9", fake_embedding("9"))
+    assert cache.get("ada", "0") is not None
+    cache.close()
+
+    reopened = EmbeddingCache(path, max_memory_entries=1, max_disk_entries=10)
+    reopened.put("ada", "10", fake_embedding("10"))
+
+    (count,) = reopened.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+    assert count == 9
+    assert reopened.get("ada", "0") is None
+
+
+def test_get_embedding_skips_repeated_requests(fake_embeddings):
+    """Only the first of several equivalent queries reaches the API."""
+    first = faiss_ds.get_embedding("who was Franco?")
+    second = faiss_ds.get_embedding("who was\nFranco? ")
+
+    assert fake_embeddings.calls == [["who was Franco?"]]
+    assert np.array_equal(first, second)
+    assert faiss_ds.query_cache().stats()["memory_hits"] == 1
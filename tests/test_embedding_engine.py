@@ -0,0 +1,116 @@
+import asyncio
+import random
+
+import httpx
+import numpy as np
+import openai
+import pytest
+
+from datasources import faiss_ds
+from datasources.embedding_engine import EmbeddingEngine, estimate_tokens, parse_reset
+
+from .conftest import FakeAsyncOpenAI, FakeOpenAI, fake_embedding
+
+
+class SlowFlakyClient(FakeAsyncOpenAI):
+    """Answers out of order and rate-limits the first `failures` requests."""
+
+    def __init__(self, sync_client, failures=0):
+        super().__init__(sync_client)
+        self.failures = failures
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def create(self, input, model, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(random.random() / 100)
+            if self.failures > 0:
+                self.failures -= 1
+                request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+                response = httpx.Response(
+                    429, headers={"retry-after-ms": "10"}, request=request
+                )
+                raise openai.RateLimitError("slow down", response=response, body=None)
+            return await super().create(input, model, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+
+def test_pack_batches_respects_size_and_tokens():
+    engine = EmbeddingEngine(max_batch_size=3, max_batch_tokens=40)
+    texts = ["x" * 30, "y" * 30, "z" * 30, "a", "b", "c", "d"]
+
+    assert engine.pack_batches(texts) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert estimate_tokens("x" * 30) == 11
+
+
+def test_parse_reset():
+    assert parse_reset("6m0s") == 360
+    assert parse_reset("1.5s") == 1.5
+    assert parse_reset("120ms") == pytest.approx(0.12)
+    assert parse_reset(None) == 0
+
+
+def test_embed_keeps_order_under_concurrency():
+    sync_client = FakeOpenAI()
+    client = SlowFlakyClient(sync_client)
+    engine = EmbeddingEngine(
+        max_batch_size=2, max_concurrency=4, client_factory=lambda: client
+    )
+    texts = [f"text {i}" for i in range(20)]
+
+    vectors = engine.embed(texts)
+
+    assert len(sync_client.calls) == 10
+    assert client.max_in_flight > 1
+    for text, vector in zip(texts, vectors):
+        assert np.array_equal(vector, fake_embedding(text))
+    assert engine.stats["texts"] == 20
+
+
+def test_embed_retries_rate_limits():
+    sync_client = FakeOpenAI()
+    client = SlowFlakyClient(sync_client, failures=3)
+    engine = EmbeddingEngine(max_batch_size=5, client_factory=lambda: client)
+
+    vectors = engine.embed([f"text {i}" for i in range(10)])
+
+    assert len(vectors) == 10
+    assert engine.stats["retries"] == 3
+    assert engine.stats["requests"] == 2
+
+
+def test_embed_gives_up_after_max_retries():
+    client = SlowFlakyClient(FakeOpenAI(), failures=10)
+    engine = EmbeddingEngine(max_retries=2, client_factory=lambda: client)
+
+    with pytest.raises(openai.RateLimitError):
+        engine.embed(["text"])
+
+
+def test_rate_limit_headers_pause_requests():
+    client = FakeAsyncOpenAI(
+        FakeOpenAI(),
+        headers={
+            "x-ratelimit-remaining-tokens": "0",
+            "x-ratelimit-reset-tokens": "50ms",
+        },
+    )
+    engine = EmbeddingEngine(max_batch_size=1, client_factory=lambda: client)
+
+    engine.embed(["a", "b"])
+
+    assert engine._pause_until > 0
+
+
+def test_get_embeddings_inside_running_loop(fake_openai):
+    """The synchronous API still works when called from the bot's event loop."""
+
+    async def call():
+        return faiss_ds.get_embeddings(["a", "b"])
+
+    vectors = asyncio.run(call())
+
+    assert np.array_equal(vectors[1], fake_embedding("b"))
@@ -0,0 +1,111 @@
+import json
+
+import numpy as np
+import pytest
+
+from datasources import faiss_ds
+from datasources.embedding_providers import (
+    HashingProvider,
+    OpenAIProvider,
+    StubProvider,
+    get_provider,
+    provider_from_info,
+)
+from datasources.faiss_ds import FAISSDS
+
+from .conftest import fake_embedding, make_sections
+
+
+def test_hashing_provider_is_deterministic_and_lexical():
+    provider = HashingProvider(dim=256)
+    vectors = provider.embed(
+        [
+            "the fall of granada in 1492",
+            "granada fell in 1492",
+            "photosynthesis in plants",
+            "",
+        ]
+    )
+    assert vectors.shape == (4, 256)
+    assert vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vectors[:3], axis=1), 1.0)
+    assert not vectors[3].any()
+    assert vectors[0] @ vectors[1] > vectors[0] @ vectors[2]
+    assert np.array_equal(provider.embed(["granada fell in 1492"])[0], vectors[1])
+
+
+def test_stub_provider_matches_test_embeddings():
+    assert np.allclose(StubProvider().embed(["abc"])[0], fake_embedding("abc"))
+
+
+def test_providers_are_rebuilt_from_their_description():
+    for provider in [OpenAIProvider("text-embedding-3-small"), HashingProvider(64)]:
+        rebuilt = get_provider(**provider.describe())
+        assert type(rebuilt) is type(provider)
+        assert rebuilt.model == provider.model
+    # datasources predating providers were embedded with ada-002
+    assert provider_from_info(None).model == "text-embedding-ada-002"
+    with pytest.raises(ValueError):
+        get_provider("word2vec")
+
+
+def test_local_provider_is_recorded_and_used_for_queries(
+    datasource_path, fake_embeddings
+):
+    provider = HashingProvider(dim=64)
+    FAISSDS.create(iter(make_sections(20)), "History", provider=provider)
+
+    with open(datasource_path / "History" / "index_info.json") as f:
+        assert json.load(f)["embedding"] == {"provider": "hashing", "dim": 64}
+
+    ds = FAISSDS("History")
+    assert ds.provider.model == "hashing-64"
+    assert ds.search_request("doc section number 13", topk=1)[0]["id"] == "doc-13"
+
+    FAISSDS.append(iter(make_sections(2, prefix="war")), "History")
+    hits = FAISSDS("History").search_request("war section number 1", topk=1)
+    assert hits[0]["id"] == "war-1"
+    assert fake_embeddings.calls == []
+
+
+def test_shortened_openai_embeddings_are_recorded(datasource_path, fake_embeddings):
+    """The output dimension chosen at creation is applied to later queries."""
+    provider = OpenAIProvider("text-embedding-3-small", dimensions=8)
+    FAISSDS.create(iter(make_sections(20)), "History", provider=provider)
+
+    with open(datasource_path / "History" / "index_info.json") as f:
+        assert json.load(f)["embedding"] == {
+            "provider": "openai",
+            "model": "text-embedding-3-small",
+            "dimensions": 8,
+        }
+
+    ds = FAISSDS("History")
+    assert ds.index.d == 8
+    assert ds.provider.model == "text-embedding-3-small@8"
+    assert ds.search_request("doc section number 4", topk=1)[0]["id"] == "doc-4"
+
+    with pytest.raises(ValueError):
+        OpenAIProvider("text-embedding-ada-002", dimensions=256)
+
+
+def test_openai_chunks_fill_every_request_in_flight(
+    datasource_path, fake_embeddings, monkeypatch
+):
+    """create embeds enough sections at a time for every request slot, on one engine."""
+    monkeypatch.setattr(faiss_ds, "CREATE_CHUNK_SIZE", 2)
+    chunks = []
+    get_embeddings = faiss_ds.get_embeddings
+
+    def recording_get_embeddings(texts, provider):
+        chunks.append(len(texts))
+        return get_embeddings(texts, provider)
+
+    monkeypatch.setattr(faiss_ds, "get_embeddings", recording_get_embeddings)
+    provider = OpenAIProvider(max_batch_size=2, max_concurrency=3)
+
+    FAISSDS.create(iter(make_sections(14)), "History", provider=provider)
+
+    assert chunks == [6, 6, 2]
+    # the engine and its rate-limit state outlive each chunk
+    assert provider.engine.stats["requests"] == 7
@@ -0,0 +1,66 @@
+import numpy as np
+
+from datasources.embedding_store import EmbeddingStore, collect_garbage, main
+from datasources.faiss_ds import FAISSDS
+
+from .conftest import fake_embedding, make_sections
+
+
+def test_get_many_returns_none_for_unknown_texts(tmp_path):
+    path = str(tmp_path / "store.db")
+    store = EmbeddingStore(path)
+    store.put_many(
+        "ada", ["alpha", "beta"], [fake_embedding("alpha"), fake_embedding("beta")]
+    )
+    store.close()
+
+    reopened = EmbeddingStore(path)
+    vectors = reopened.get_many("ada", ["beta", "gamma", "alpha"])
+    assert np.array_equal(vectors[0], fake_embedding("beta"))
+    assert vectors[1] is None
+    assert np.array_equal(vectors[2], fake_embedding("alpha"))
+    assert reopened.get_many("other-model", ["alpha"]) == [None]
+    assert reopened.stats()["hits"] == 2
+
+
+def test_recreate_only_embeds_changed_sections(datasource_path, fake_embeddings):
+    """A re-ingest with one edited section sends only that section to the API."""
+    sections = make_sections(20)
+    FAISSDS.create(iter(sections), "History")
+    fake_embeddings.calls.clear()
+
+    sections[3] = {**sections[3], "search_key": "an edited section"}
+    FAISSDS.create(iter(sections), "History")
+
+    assert fake_embeddings.calls == [["an edited section"]]
+    hit = FAISSDS("History").search_request("an edited section", topk=1)[0]
+    assert hit["id"] == "doc-3"
+
+
+def test_gc_drops_unreferenced_embeddings(datasource_path, fake_embeddings):
+    from datasources import faiss_ds
+
+    store = faiss_ds.embedding_store()
+    FAISSDS.create(iter(make_sections(5)), "History")
+    FAISSDS.create(iter(make_sections(3, prefix="war")), "Wars")
+    FAISSDS.create(iter(make_sections(2, prefix="war")), "Wars")
+
+    dry = collect_garbage(store, str(datasource_path), dry_run=True)
+    assert dry["removed"] == 1
+    assert store.stats()["entries"] == 8
+
+    result = collect_garbage(store, str(datasource_path))
+    assert result["removed"] == 1
+    assert result["entries"] == 7
+    assert store.get_many("text-embedding-ada-002", ["war section number 2"]) == [None]
+
+
+def test_gc_command(tmp_path, capsys):
+    store_path = str(tmp_path / "store.db")
+    store = EmbeddingStore(store_path)
+    store.put_many("ada", ["orphan"], [fake_embedding("orphan")])
+    store.close()
+
+    main(["gc", "--store", store_path, "--datasources", str(tmp_path / "none")])
+
+    assert "Removed 1 unreferenced embeddings, 0 entries" in capsys.readouterr().out
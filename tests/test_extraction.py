@@ -0,0 +1,153 @@
+import math
+from io import BytesIO
+from types import SimpleNamespace
+
+from tools import extraction
+
+
+def _span(offset, length):
+    return SimpleNamespace(offset=offset, length=length)
+
+
+def _cell(row, column, content, kind="content", column_span=1):
+    return SimpleNamespace(
+        row_index=row,
+        column_index=column,
+        content=content,
+        kind=kind,
+        row_span=1,
+        column_span=column_span,
+    )
+
+
+def _table(page_number, spans, cells, row_count):
+    return SimpleNamespace(
+        bounding_regions=[SimpleNamespace(page_number=page_number)],
+        spans=spans,
+        cells=cells,
+        row_count=row_count,
+    )
+
+
+def test_azure_page_map_replaces_table_spans(monkeypatch):
+    content = "Intro. A B 1 2 Outro.Page two."
+    result = SimpleNamespace(
+        content=content,
+        pages=[
+            SimpleNamespace(spans=[_span(0, 21)]),
+            SimpleNamespace(spans=[_span(21, 9)]),
+        ],
+        tables=[
+            _table(
+                1,
+                # a table split over two spans is inserted once, at its start
+                [_span(7, 4), _span(11, 4)],
+                [
+                    _cell(1, 1, "2"),
+                    _cell(0, 1, "B", kind="columnHeader"),
+                    _cell(1, 0, "1 & 0"),
+                    _cell(0, 0, "A", kind="columnHeader"),
+                ],
+                row_count=2,
+            ),
+            _table(2, [_span(21, 4)], [_cell(0, 0, "Page", column_span=2)], 1),
+        ],
+    )
+    client = SimpleNamespace(
+        begin_analyze_document=lambda *args, **kwargs: SimpleNamespace(
+            result=lambda: result
+        )
+    )
+    monkeypatch.setattr(extraction, "get_doc_analysis_client", lambda: client)
+
+    page_map = extraction.pdf_to_page_map_azure(SimpleNamespace(file=BytesIO(b"%PDF")))
+
+    table = (
+        "<table><tr><th>A</th><th>B</th></tr>"
+        "<tr><td>1 &amp; 0</td><td>2</td></tr></table>"
+    )
+    first_page = f"Intro. {table}Outro. "
+    assert page_map == [
+        (0, 0, first_page),
+        (1, len(first_page), "<table><tr><td colSpan=2>Page</td></tr></table> two. "),
+    ]
+
+
+def test_pdf_extractors_yield_pages(monkeypatch):
+    from pypdf import PageObject
+
+    from .test_ingest import _pdf_bytes
+
+    pdf = _pdf_bytes(["First page.", "Second page.", "Third page."])
+    calls = []
+    extract_text = PageObject.extract_text
+
+    def counting_extract_text(self, *args, **kwargs):
+        calls.append(1)
+        return extract_text(self, *args, **kwargs)
+
+    monkeypatch.setattr(PageObject, "extract_text", counting_extract_text)
+
+    for iter_pages in [extraction.iter_pages_pypdf, extraction.iter_pages_pymupdf]:
+        pages = iter_pages(BytesIO(pdf))
+        first = next(pages)
+        assert first[:2] == (0, 0)
+        assert first[2].startswith("First page.")
+        page_map = [first, *pages]
+        assert [page[0] for page in page_map] == [0, 1, 2]
+        assert page_map[2][1] == len(page_map[0][2]) + len(page_map[1][2])
+    # every page's text is extracted once
+    assert len(calls) == 3
+
+
+def test_csv_records_are_read_in_chunks(monkeypatch):
+    monkeypatch.setattr(extraction, "CSV_CHUNK_ROWS", 2)
+    data = b"issue,cause\nslow,disk\nhot,fan\nloud,fan\noff,power\nblue,driver\n"
+
+    records = extraction.iter_csv_records(BytesIO(data), csv_header=True)
+
+    assert next(records) == {"issue": "slow", "cause": "disk"}
+    assert [r["issue"] for r in records] == ["hot", "loud", "off", "blue"]
+    assert extraction.extract_csv(BytesIO(b"1,a\n2,b\n3,c\n"), csv_header=False) == [
+        {"k0": "1", "k1": "a"},
+        {"k0": "2", "k1": "b"},
+        {"k0": "3", "k1": "c"},
+    ]
+
+
+def test_csv_values_read_the_same_in_every_chunk(monkeypatch):
+    """A chunk with a missing value does not turn the numbers of its column into floats."""
+    monkeypatch.setattr(extraction, "CSV_CHUNK_ROWS", 2)
+    data = b"issue,count\nslow,3\nhot,4\nloud,3\noff,\n"
+
+    records = list(extraction.iter_csv_records(BytesIO(data), csv_header=True))
+
+    assert [r["count"] for r in records[:3]] == ["3", "4", "3"]
+    assert math.isnan(records[3]["count"])
+
+
+def test_office_documents_are_read_in_memory(tmp_path, monkeypatch):
+    import tempfile
+
+    from docx import Document
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    document = Document()
+    document.add_paragraph("first paragraph")
+    document.add_paragraph("second paragraph")
+    docx_bytes = BytesIO()
+    document.save(docx_bytes)
+
+    presentation = Presentation()
+    slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+    for text in ["one", "two"]:
+        box = slide.shapes.add_textbox(Inches(1), Inches(1), Inches(4), Inches(1))
+        box.text_frame.text = text
+    pptx_bytes = BytesIO()
+    presentation.save(pptx_bytes)
+
+    assert extraction.read_docx(docx_bytes) == "first paragraph\nsecond paragraph"
+    assert extraction.read_pptx(pptx_bytes) == "one two "
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,40 @@
+from datasources.extraction_cache import ExtractionCache
+
+
+def test_cached_pages_are_written_and_read_lazily(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache"))
+    key = cache.key("sha", "PyMuPDF", "v1", doc_slice=True)
+    page_map = [(0, 0, "First page. "), (1, 12, "Second, with ünïcode.")]
+
+    assert cache.get(key) is None
+    kind, pages = cache.record(key, ("pages", iter(page_map)))
+    assert kind == "pages"
+    # the entry only appears once every page went through
+    assert next(pages) == page_map[0]
+    assert cache.get(key) is None
+    assert list(pages) == page_map[1:]
+
+    kind, pages = cache.get(key)
+    assert (kind, list(pages)) == ("pages", page_map)
+    assert cache.stats() == {"hits": 1, "misses": 2, "stored": 1, "hit_ratio": 1 / 3}
+
+
+def test_abandoned_recording_leaves_no_entry(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    _, pages = cache.record("key", ("pages", iter([(0, 0, "a"), (1, 1, "b")])))
+    next(pages)
+    pages.close()
+
+    assert list(tmp_path.iterdir()) == []
+    assert cache.get("key") is None
+
+
+def test_text_entries_and_pruning(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    cache.record("a", ("text", "whole document"))
+    cache.record("b", ("rows", [{"issue": "slow", "cause": None}]))
+
+    assert cache.get("a") == ("text", "whole document")
+    assert cache.get("b") == ("rows", [{"issue": "slow", "cause": None}])
+    assert cache.prune(keep=["a"]) == 1
+    assert cache.get("b") is None
@@ -0,0 +1,244 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from datasources import faiss_ds
+from datasources.faiss_ds import FAISSDS
+from datasources.index_factory import IndexConfig
+from datasources.storage import MetaStore, MetaStoreWriter, MmapFlatIndex
+
+from .conftest import fake_embedding, make_sections
+
+
+def test_create_and_search(datasource_path, fake_embeddings):
+    """The section whose search key is queried comes back first."""
+    FAISSDS.create(iter(make_sections(20)), "History")
+    ds = FAISSDS("History")
+
+    hits = ds.search_request("doc section number 7", topk=3)
+
+    assert len(hits) == 3
+    assert hits[0]["id"] == "doc-7"
+    assert hits[0]["file_url"] == "/datasource/doc/doc.pdf#page=8"
+    assert hits[0]["score"] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_mmap_storage_matches_memory(datasource_path, fake_embeddings):
+    """mmap storage returns exactly the hits of the in-memory datasource."""
+    FAISSDS.create(iter(make_sections(50)), "History")
+    memory = FAISSDS("History")
+    mapped = FAISSDS("History", storage="mmap")
+
+    assert isinstance(mapped.index, MmapFlatIndex)
+    assert isinstance(mapped.documents, MetaStore)
+    assert mapped.nbytes < memory.nbytes
+    for query in ["doc section number 3", "something else entirely"]:
+        assert mapped.search_request(query, topk=5) == memory.search_request(
+            query, topk=5
+        )
+
+
+def test_mmap_storage_pads_short_results(datasource_path, fake_embeddings):
+    """Asking for more hits than there are sections returns every section."""
+    FAISSDS.create(iter(make_sections(3)), "History")
+
+    hits = FAISSDS("History", storage="mmap").search_request("doc", topk=10)
+
+    assert sorted(hit["id"] for hit in hits) == ["doc-0", "doc-1", "doc-2"]
+
+
+def test_meta_store_rebuilds_from_newer_jsonl(datasource_path):
+    """A store older than meta_data.jsonl is rebuilt on open."""
+    index_dir = datasource_path / "History"
+    index_dir.mkdir()
+    MetaStore.write(str(index_dir), [{"id": "old"}])
+    jsonl_path = index_dir / "meta_data.jsonl"
+    jsonl_path.write_text(
+        "\n".join(json.dumps({"id": f"new-{i}"}) for i in range(3)) + "\n"
+    )
+
+    store = MetaStore.from_jsonl(str(index_dir), str(jsonl_path))
+
+    assert len(store) == 3
+    assert store[np.int64(2)] == {"id": "new-2"}
+    assert [record["id"] for record in store] == ["new-0", "new-1", "new-2"]
+
+
+def test_meta_store_writers_do_not_share_files(tmp_path):
+    """Processes rebuilding the same store at once each write their own files."""
+    first, second = MetaStoreWriter(str(tmp_path)), MetaStoreWriter(str(tmp_path))
+    assert first.data_tmp_path != second.data_tmp_path
+    assert first.offsets_tmp_path != second.offsets_tmp_path
+
+    with first:
+        first.append({"id": "first"})
+    first.publish()
+    with pytest.raises(RuntimeError):
+        with second:
+            raise RuntimeError("extraction failed")
+
+    assert [record["id"] for record in MetaStore(str(tmp_path))] == ["first"]
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_mmap_flat_index_reads_vectors_in_place(tmp_path):
+    """The mapped matrix is the one written by faiss.write_index."""
+    import faiss
+
+    vectors = np.stack([fake_embedding(str(i)) for i in range(10)])
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    faiss.write_index(index, str(tmp_path / "faiss.index"))
+
+    mapped = MmapFlatIndex.open(str(tmp_path / "faiss.index"))
+
+    assert np.array_equal(np.asarray(mapped.vectors), vectors)
+    np.testing.assert_array_equal(
+        mapped.search(vectors[:2], 4)[1], index.search(vectors[:2], 4)[1]
+    )
+
+
+def test_search_many_batches_queries(datasource_path, fake_embeddings):
+    """search_many embeds every query in one request and keeps query order."""
+    FAISSDS.create(iter(make_sections(30)), "History")
+    ds = FAISSDS("History")
+    queries = ["doc section number 4", "doc section number 9", "doc section number 4"]
+    fake_embeddings.calls.clear()
+
+    results = ds.search_many(queries, topk=2, skip=1)
+
+    assert fake_embeddings.calls == [["doc section number 4", "doc section number 9"]]
+    assert [len(hits) for hits in results] == [2, 2, 2]
+    assert results[0] == results[2]
+    for query, hits in zip(queries, results):
+        full = ds.search_request(query, topk=3)
+        assert hits == full[1:]
+
+
+@pytest.mark.parametrize("index_type", ["Flat", "IVFFlat"])
+def test_append_and_remove_files(datasource_path, fake_embeddings, index_type):
+    """Sections can be appended and dropped per file without a rebuild."""
+    config = IndexConfig(index_type=index_type, nlist=2, nprobe=2, eval_queries=5)
+    FAISSDS.create(
+        iter(make_sections(40, prefix="a") + make_sections(40, prefix="b")),
+        "History",
+        index_config=config,
+    )
+
+    assert FAISSDS.remove_files("History", ["a.pdf"])["removed"] == 40
+    assert FAISSDS.append(iter(make_sections(10, prefix="c")), "History") == {
+        "index_name": "History",
+        "added": 10,
+    }
+
+    for storage in ["memory", "mmap"]:
+        ds = FAISSDS("History", storage=storage)
+        assert ds.index.ntotal == 50
+        assert len(ds.documents) == 50
+        for query in ["b section number 3", "c section number 7"]:
+            assert ds.search_request(query, topk=1)[0]["search_key"] == query
+        hits = ds.search_request("a section number 3", topk=50)
+        assert not any(hit["id"].startswith("a-") for hit in hits)
+
+
+def test_remove_unknown_file_is_a_no_op(datasource_path, fake_embeddings):
+    FAISSDS.create(iter(make_sections(5)), "History")
+
+    assert FAISSDS.remove_files("History", ["missing.pdf"])["removed"] == 0
+    assert FAISSDS("History").index.ntotal == 5
+
+
+@pytest.mark.parametrize("index_type", ["Flat", "IVFFlat"])
+def test_create_streams_sections_in_chunks(
+    datasource_path, fake_embeddings, index_type
+):
+    """Sections are pulled from the iterator chunk by chunk and embedded as they come."""
+    produced = []
+
+    def sections():
+        for section in make_sections(50):
+            produced.append(section["id"])
+            yield section
+
+    def embedded_so_far():
+        return sum(len(call) for call in fake_embeddings.calls)
+
+    original_create = fake_embeddings.create
+
+    def create(input, model, **kwargs):
+        # never more than one chunk has been read ahead of the embeddings
+        assert len(produced) - embedded_so_far() <= 7
+        return original_create(input, model, **kwargs)
+
+    fake_embeddings.create = create
+    config = IndexConfig(index_type=index_type, nlist=2, nprobe=2, eval_queries=10)
+
+    info = FAISSDS.create(sections(), "History", index_config=config, chunk_size=7)
+
+    assert len(fake_embeddings.calls) == 8
+    assert info["report"]["ntotal"] == 50
+    assert not (datasource_path / "History" / "vectors.tmp").exists()
+    for storage in ["memory", "mmap"]:
+        ds = FAISSDS("History", storage=storage)
+        assert len(ds.documents) == 50
+        hit = ds.search_request("doc section number 43", topk=1)[0]
+        assert hit["id"] == "doc-43"
+
+
+def test_failed_create_keeps_previous_store(datasource_path, fake_embeddings):
+    FAISSDS.create(iter(make_sections(5)), "History")
+
+    def failing():
+        yield from make_sections(3)
+        raise RuntimeError("extraction failed")
+
+    with pytest.raises(RuntimeError):
+        FAISSDS.create(failing(), "History", chunk_size=2)
+
+    assert len(MetaStore(str(datasource_path / "History"))) == 5
+    assert len(FAISSDS("History").documents) == 5
+    assert not (datasource_path / "History" / "vectors.tmp").exists()
+    assert not (datasource_path / "History" / "meta_data.jsonl.tmp").exists()
+
+
+def test_create_publishes_the_jsonl_last(datasource_path, fake_embeddings, monkeypatch):
+    """index_info.json goes before the index files and the JSONL after all of them."""
+    FAISSDS.create(iter(make_sections(5)), "History")
+    (datasource_path / "History" / "vector_ids.npy").write_bytes(b"stale")
+    published = []
+    replace = os.replace
+
+    def recording_replace(src, dst):
+        published.append(os.path.basename(dst))
+        replace(src, dst)
+
+    monkeypatch.setattr(faiss_ds.os, "replace", recording_replace)
+    FAISSDS.create(iter(make_sections(8)), "History")
+
+    assert published[0] == "index_info.json"
+    assert published.index("faiss.index") < published.index("meta_data.jsonl")
+    assert published[-1] == "meta_data.jsonl"
+    assert not (datasource_path / "History" / "vector_ids.npy").exists()
+
+
+def test_import_creates_no_database_files(tmp_path):
+    """The query cache and embedding store are only opened on first use."""
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key not in ("EMBEDDING_CACHE_FILE", "EMBEDDING_STORE_FILE")
+    }
+    env["PYTHONPATH"] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    subprocess.run(
+        [sys.executable, "-c", "import datasources.faiss_ds"],
+        cwd=tmp_path,
+        env=env,
+        check=True,
+    )
+
+    assert not list(tmp_path.glob("*.db"))
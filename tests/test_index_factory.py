@@ -0,0 +1,164 @@
+import faiss
+import numpy as np
+import pytest
+
+from datasources.faiss_ds import FAISSDS, read_index_info
+from datasources.index_factory import (
+    IndexConfig,
+    build_index,
+    evaluate_index,
+    exact_rerank,
+    select_training_sample,
+)
+
+from .conftest import EMBEDDING_DIM, make_sections
+
+
+@pytest.fixture
+def embeddings():
+    vectors = np.random.default_rng(0).standard_normal((2000, EMBEDDING_DIM))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+@pytest.mark.parametrize(
+    "index_type, min_recall",
+    [("Flat", 1.0), ("IVFFlat", 0.8), ("IVFPQ", 0.3), ("HNSW", 0.9)],
+)
+def test_index_types_report_recall(embeddings, index_type, min_recall):
+    """Every index type builds, and approximate ones stay close to exact search."""
+    config = IndexConfig(index_type=index_type, pq_m=4, nprobe=16, eval_queries=50)
+
+    built = build_index(embeddings, config)
+    report = evaluate_index(built["index"], embeddings, config)
+
+    assert built["index"].ntotal == len(embeddings)
+    assert report["k"] == 10
+    assert report["recall"] >= min_recall
+    assert report["qps"] > 0
+
+
+@pytest.mark.parametrize(
+    "index_type, encoding, factory",
+    [
+        ("Flat", "sq8", "SQ8"),
+        ("Flat", "fp16", "SQfp16"),
+        ("IVFFlat", "sq8", "IVF11,SQ8"),
+        ("HNSW", "fp16", "HNSW32,SQfp16"),
+    ],
+)
+def test_encodings_shrink_the_index(embeddings, index_type, encoding, factory):
+    """Scalar-quantized encodings cut memory and barely move the scores."""
+    config = IndexConfig(
+        index_type=index_type, encoding=encoding, nlist=11, nprobe=11, eval_queries=50
+    )
+    float32 = IndexConfig(index_type=index_type, nlist=11, nprobe=11, eval_queries=50)
+
+    built = build_index(embeddings, config)
+    report = evaluate_index(built["index"], embeddings, config)
+    unencoded = build_index(embeddings, float32)["index"]
+
+    assert built["factory"] == factory
+    size = faiss.serialize_index(built["index"]).nbytes
+    assert size < faiss.serialize_index(unencoded).nbytes
+    if index_type == "Flat":
+        assert size < embeddings.nbytes * 0.6
+        assert evaluate_index(unencoded, embeddings, float32)["score_deviation"] < 1e-6
+    assert 0 < report["score_deviation"] < 0.02
+    assert report["recall"] >= 0.85
+
+
+def test_ivfpq_rejects_encodings(embeddings):
+    with pytest.raises(ValueError):
+        IndexConfig(index_type="IVFPQ", encoding="sq8").factory_string(16, 2000)
+
+
+def test_exact_rerank(embeddings):
+    queries = embeddings[:2]
+    rows = np.array([[5, 0, -1, 9], [-1, -1, 7, 1]])
+
+    scores, top = exact_rerank(queries, rows, embeddings, 3)
+
+    exact = {row: float(embeddings[row] @ queries[0]) for row in [0, 5, 9]}
+    assert top[0].tolist() == sorted(exact, key=lambda row: -exact[row])
+    assert scores[0].tolist() == pytest.approx(sorted(exact.values(), reverse=True))
+    assert top[1].tolist()[:2] == [1, 7] and top[1][2] == -1
+
+
+def test_pq_m_must_divide_dimension(embeddings):
+    with pytest.raises(ValueError):
+        build_index(embeddings, IndexConfig(index_type="IVFPQ", pq_m=5))
+
+
+def test_training_sample_is_bounded_and_deterministic(embeddings):
+    first = select_training_sample(embeddings, 100, seed=1)
+    second = select_training_sample(embeddings, 100, seed=1)
+
+    assert first.shape == (100, EMBEDDING_DIM)
+    assert np.array_equal(first, second)
+    assert select_training_sample(embeddings, None, seed=1) is embeddings
+
+
+def test_create_records_index_info(datasource_path, fake_embeddings):
+    """The build report and query knobs are stored and applied on load."""
+    config = IndexConfig(index_type="IVFFlat", nlist=4, nprobe=3, eval_queries=20)
+
+    info = FAISSDS.create(iter(make_sections(200)), "History", index_config=config)
+
+    assert info["report"]["factory"] == "IVF4,Flat"
+    stored = read_index_info(str(datasource_path / "History"))
+    assert stored["report"] == info["report"]
+    for storage in ["memory", "mmap"]:
+        ds = FAISSDS("History", storage=storage)
+        assert faiss.extract_index_ivf(ds.index).nprobe == 3
+        assert ds.search_request("doc section number 5", topk=1)[0]["id"] == "doc-5"
+
+
+def test_create_sq8_with_exact_rerank(datasource_path, fake_embeddings):
+    """A quantized index reranked against float32 vectors matches exact search."""
+    sections = make_sections(300)
+    exact = FAISSDS.create(iter(sections), "Exact")
+    config = IndexConfig(encoding="sq8", rerank_factor=4, eval_queries=50)
+
+    info = FAISSDS.create(iter(sections), "History", index_config=config)
+
+    report = info["report"]
+    assert report["factory"] == "SQ8"
+    assert report["memory_saving"] > 0.7
+    assert report["recall"] == 1.0
+    assert report["score_deviation"] < 1e-6
+    assert report["index_bytes"] < exact["report"]["index_bytes"] / 3
+    assert (datasource_path / "History" / "rerank_vectors.npy").exists()
+    # the mapped float32 copy does not count against the registry budget
+    assert FAISSDS("History").nbytes < FAISSDS("Exact").nbytes
+
+    FAISSDS.remove_files("History", ["doc.pdf"])
+    FAISSDS.append(iter(make_sections(20, prefix="war")), "History")
+    for storage in ["memory", "mmap"]:
+        ds = FAISSDS("History", storage=storage)
+        assert ds.rerank_vectors.shape == (20, EMBEDDING_DIM)
+        hit = ds.search_request("war section number 12", topk=1)[0]
+        assert hit["id"] == "war-12"
+        assert hit["score"] == pytest.approx(1.0)
+
+    # recreating without rerank drops the float32 copy
+    FAISSDS.create(iter(sections), "History", index_config=IndexConfig(encoding="fp16"))
+    assert not (datasource_path / "History" / "rerank_vectors.npy").exists()
+
+
+def test_create_with_pca_projection(datasource_path, fake_embeddings):
+    """The PCA is trained at build time and applied to queries by the index."""
+    config = IndexConfig(pca_dim=8, eval_queries=20)
+
+    info = FAISSDS.create(iter(make_sections(200)), "History", index_config=config)
+
+    report = info["report"]
+    assert report["factory"] == "PCA8,Flat"
+    assert report["pca_dim"] == 8
+    assert report["memory_saving"] > 0.3
+    for storage in ["memory", "mmap"]:
+        ds = FAISSDS("History", storage=storage)
+        assert ds.search_request("doc section number 5", topk=1)[0]["id"] == "doc-5"
+
+    with pytest.raises(ValueError):
+        IndexConfig(pca_dim=32).factory_string(16, 200)
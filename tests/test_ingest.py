@@ -0,0 +1,275 @@
+import json
+
+import pytest
+
+from datasources import extraction_cache, ingest
+from datasources.extraction_cache import ExtractionCache
+from datasources.faiss_ds import FAISSDS
+
+from .conftest import make_upload
+
+
+def _config():
+    return ingest.DatasourceConfig(doc_slice=False)
+
+
+def _indexed_files(ds):
+    return sorted({doc["file_url"] for doc in ds.documents})
+
+
+def test_main_records_file_manifest(datasource_path, fake_embeddings):
+    files = [make_upload("a.txt", b"alpha"), make_upload("b b.md", b"beta")]
+
+    ingest.main(files, [], "History", _config())
+
+    manifest = ingest.read_file_manifest("History")
+    assert sorted(manifest) == ["a.txt", "b_b.md"]
+    assert (datasource_path / "History" / "b_b.md").read_bytes() == b"beta"
+
+
+def test_update_only_embeds_changed_files(datasource_path, fake_embeddings):
+    """Unchanged files are skipped, changed ones replaced, removed ones dropped."""
+    ingest.main(
+        [
+            make_upload("a.txt", b"alpha"),
+            make_upload("b.txt", b"beta"),
+            make_upload("c.txt", b"gamma"),
+        ],
+        [],
+        "History",
+        _config(),
+    )
+    fake_embeddings.calls.clear()
+
+    result = ingest.update(
+        [
+            make_upload("a.txt", b"alpha"),
+            make_upload("b.txt", b"beta, revised"),
+            make_upload("d.txt", b"delta"),
+        ],
+        "History",
+        _config(),
+        removed_file_names=["c.txt"],
+    )
+
+    assert result == {
+        "added": ["d.txt"],
+        "replaced": ["b.txt"],
+        "removed": ["c.txt"],
+        "unchanged": ["a.txt"],
+    }
+    assert fake_embeddings.calls == [["beta, revised", "delta"]]
+    ds = FAISSDS("History")
+    assert _indexed_files(ds) == ["History/a.txt", "History/b.txt", "History/d.txt"]
+    assert sorted(ingest.read_file_manifest("History")) == ["a.txt", "b.txt", "d.txt"]
+    assert not (datasource_path / "History" / "c.txt").exists()
+    assert (datasource_path / "History" / "b.txt").read_bytes() == b"beta, revised"
+
+
+def test_update_creates_missing_datasource(datasource_path, fake_embeddings):
+    result = ingest.update([make_upload("a.txt", b"alpha")], "History", _config())
+
+    assert result["added"] == ["a.txt"]
+    assert _indexed_files(FAISSDS("History")) == ["History/a.txt"]
+
+
+def _pdf_bytes(pages):
+    import fitz
+
+    document = fitz.open()
+    for text in pages:
+        document.new_page().insert_textbox(fitz.Rect(72, 72, 540, 770), text)
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+def test_parallel_extraction_keeps_section_order(monkeypatch):
+    """A process pool yields the same sections in the same order as one process."""
+    monkeypatch.setattr(ingest, "PDF_PAGEMAP_EXTRACTION_METHOD", "PyMuPDF")
+
+    def uploads():
+        return [
+            make_upload("a.pdf", _pdf_bytes(["First. " * 40, "Second. " * 40])),
+            make_upload(
+                "b.csv", b"issue,cause,solution\nslow,disk,clean\nhot,fan,fix\n"
+            ),
+            make_upload("c.txt", b"gamma"),
+            make_upload("d.pdf", _pdf_bytes(["Third. " * 40])),
+        ]
+
+    def sections(workers):
+        config = ingest.DatasourceConfig(
+            doc_max_section_length=200, extraction_workers=workers
+        )
+        return list(ingest.extract_sections(uploads(), "History", config))
+
+    sequential = sections(1)
+    files = [s["file_url"].split("#")[0] for s in sequential]
+    assert files == sorted(files)
+    assert set(files) == {
+        f"History/{name}" for name in ["a.pdf", "b.csv", "c.txt", "d.pdf"]
+    }
+    assert sections(3) == sequential
+
+
+def test_parallel_extraction_reads_files_as_they_are_submitted(monkeypatch):
+    read = []
+    read_upload = ingest._read_upload
+
+    def recording_read(file):
+        read.append(file.filename)
+        return read_upload(file)
+
+    monkeypatch.setattr(ingest, "_read_upload", recording_read)
+    files = [make_upload(f"{i}.txt", f"text {i}".encode()) for i in range(8)]
+    config = ingest.DatasourceConfig(doc_slice=False, extraction_workers=2)
+
+    sections = ingest.extract_sections(files, "History", config)
+    assert next(sections)["content"] == "text 0"
+    # two files in flight, not all eight
+    assert read == ["0.txt", "1.txt"]
+    assert [s["content"] for s in sections] == [f"text {i}" for i in range(1, 8)]
+    assert len(read) == 8
+
+
+def test_unchanged_files_are_not_extracted_again(
+    datasource_path, fake_embeddings, monkeypatch
+):
+    monkeypatch.setattr(ingest, "PDF_PAGEMAP_EXTRACTION_METHOD", "PyMuPDF")
+    extracted = []
+    extract = ingest.iter_pages_pymupdf
+
+    def counting_extract(file):
+        extracted.append(file.filename)
+        return extract(file)
+
+    monkeypatch.setattr(ingest, "iter_pages_pymupdf", counting_extract)
+    config = ingest.DatasourceConfig(extraction_workers=1)
+
+    alpha = _pdf_bytes(["Alpha. " * 40])
+
+    def uploads(second):
+        return [
+            make_upload("a.pdf", alpha),
+            make_upload("b.pdf", _pdf_bytes([second * 40])),
+            make_upload("c.txt", b"gamma"),
+        ]
+
+    ingest.main(uploads("Beta. "), [], "History", config)
+    first = FAISSDS("History").documents
+    ingest.main(uploads("Beta, revised. "), [], "History", config)
+
+    assert extracted == ["a.pdf", "b.pdf", "b.pdf"]
+    info = FAISSDS("History").info
+    assert info["report"]["extraction_cache"] == {
+        "hits": 1,
+        "misses": 1,
+        "stored": 1,
+        "hit_ratio": 0.5,
+    }
+    # the entry of the old b.pdf is gone, the cached a.pdf gives the same sections
+    assert len(list((datasource_path / "History" / "extraction_cache").iterdir())) == 2
+    assert FAISSDS("History").documents[0] == first[0]
+
+
+def test_cached_extractions_are_opened_one_file_at_a_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "PDF_PAGEMAP_EXTRACTION_METHOD", "PyMuPDF")
+    files = [
+        make_upload(f"{i}.pdf", _pdf_bytes([f"Page {i}. " * 40])) for i in range(5)
+    ]
+    config = ingest.DatasourceConfig(extraction_workers=1)
+    first = list(
+        ingest.extract_sections(
+            files, "History", config, ExtractionCache(str(tmp_path))
+        )
+    )
+    opened = []
+    gzip_open = extraction_cache.gzip.open
+
+    def recording_open(path, *args, **kwargs):
+        opened.append(path)
+        return gzip_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(extraction_cache.gzip, "open", recording_open)
+    cache = ExtractionCache(str(tmp_path))
+
+    sections = ingest.extract_sections(files, "History", config, cache)
+    assert next(sections) == first[0]
+    assert len(opened) == 1
+    assert [first[0], *sections] == first
+    assert cache.stats()["hits"] == 5
+
+
+def test_csv_rows_are_streamed_into_sections(monkeypatch, capsys):
+    from tools import extraction
+
+    monkeypatch.setattr(extraction, "CSV_CHUNK_ROWS", 2)
+    rows = [f"issue {i},cause {i},solution {i}" for i in range(5)]
+    data = ("issue,cause,solution\n" + "\n".join(rows) + "\n").encode()
+    config = ingest.DatasourceConfig(extraction_workers=2)
+
+    sections = list(
+        ingest.extract_sections([make_upload("faq.csv", data)], "Help", config)
+    )
+
+    assert [s["search_key"] for s in sections] == [f"issue {i}" for i in range(5)]
+    assert (
+        sections[4]["content"]
+        == "Issue:issue 4\n\nCause:cause 4\n\nSolution:solution 4"
+    )
+    assert sections[4]["id"] == "faq_csv-4"
+    assert "Read 5 rows of faq.csv" in capsys.readouterr().out
+
+
+def test_interrupted_ingest_resumes_from_checkpoints(
+    datasource_path, fake_embeddings, monkeypatch
+):
+    """A run failing mid-embedding keeps its chunks, the next one embeds the rest."""
+    from datasources import faiss_ds
+    from datasources.embedding_store import EmbeddingStore
+
+    rows = [f"issue {i},cause {i},solution {i}" for i in range(9000)]
+    data = ("issue,cause,solution\n" + "\n".join(rows) + "\n").encode()
+    create = fake_embeddings.create
+
+    def failing_create(input, model, **kwargs):
+        # the 6th request is in the second chunk of 4000 sections
+        if len(fake_embeddings.calls) == 5:
+            raise RuntimeError("connection lost")
+        return create(input, model, **kwargs)
+
+    monkeypatch.setattr(fake_embeddings, "create", failing_create)
+    with pytest.raises(RuntimeError):
+        ingest.main(
+            [make_upload("faq.csv", data)], [], "Help", ingest.DatasourceConfig()
+        )
+
+    job_dir = datasource_path / "Help" / "ingest_job"
+    job = json.loads((job_dir / "job.json").read_text())
+    assert job["status"] == "failed"
+    assert job["error"] == "RuntimeError: connection lost"
+    assert job["embedded_chunks"] == 1 and job["embedded_sections"] == 4000
+    assert not (datasource_path / "Help" / "faiss.index").exists()
+
+    # checkpoints do not depend on the embedding store
+    store = EmbeddingStore(":memory:")
+    monkeypatch.setattr(faiss_ds, "embedding_store", lambda: store)
+    monkeypatch.setattr(fake_embeddings, "create", create)
+    fake_embeddings.calls.clear()
+    ingest.main([make_upload("faq.csv", data)], [], "Help", ingest.DatasourceConfig())
+
+    # the first chunk was replayed, the two others embedded in 1000-text requests
+    assert len(fake_embeddings.calls) == 5
+    assert not job_dir.exists()
+    info = faiss_ds.read_index_info(str(datasource_path / "Help"))
+    assert info["report"]["ingest_job"] == {
+        "resumed": True,
+        "replayed_chunks": 1,
+        "embedded_chunks": 2,
+    }
+    ds = FAISSDS("Help")
+    assert ds.index.ntotal == 9000
+    assert ds.search_request("issue 17", topk=1)[0]["content"].startswith(
+        "Issue:issue 17\n"
+    )
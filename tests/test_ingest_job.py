@@ -0,0 +1,54 @@
+import numpy as np
+
+from datasources.ingest_job import IngestJob
+
+from .conftest import fake_embedding
+
+EMBEDDING = {"provider": "openai", "model": "text-embedding-ada-002"}
+
+
+def _embed(texts):
+    return np.vstack([fake_embedding(text) for text in texts])
+
+
+def _checkpointed_job(path, chunks):
+    job = IngestJob.start(str(path), {"a.pdf": "abc"}, EMBEDDING)
+    for texts in chunks:
+        assert job.replay(texts) is None
+        job.checkpoint(texts, _embed(texts))
+    return job
+
+
+def test_replays_chunks_until_the_first_that_changed(tmp_path):
+    chunks = [["a", "b"], ["c", "d"], ["e"]]
+    _checkpointed_job(tmp_path, chunks)
+
+    job = IngestJob.start(str(tmp_path), {"a.pdf": "abc"}, EMBEDDING)
+    assert job.resumed
+    np.testing.assert_array_equal(job.replay(["a", "b"]), _embed(["a", "b"]))
+    # a changed chunk drops its checkpoint and every later one
+    assert job.replay(["c", "x"]) is None
+    job.checkpoint(["c", "x"], _embed(["c", "x"]))
+    assert job.replay(["e"]) is None
+    assert job.stats() == {"resumed": True, "replayed_chunks": 1, "embedded_chunks": 1}
+
+    job = IngestJob.start(str(tmp_path), {"a.pdf": "abc"}, EMBEDDING)
+    assert len(job.chunks) == 2
+    job.replay(["a", "b"])
+    np.testing.assert_array_equal(job.replay(["c", "x"]), _embed(["c", "x"]))
+
+
+def test_torn_checkpoints_and_other_providers_are_not_replayed(tmp_path):
+    _checkpointed_job(tmp_path, [["a", "b"], ["c", "d"]])
+    # a crash while the vectors of the last chunk were written
+    vectors = tmp_path / "vectors.f32"
+    vectors.write_bytes(vectors.read_bytes()[:-4])
+
+    job = IngestJob.start(str(tmp_path), {"a.pdf": "abc"}, EMBEDDING)
+    assert len(job.chunks) == 1
+    assert vectors.stat().st_size == 2 * fake_embedding("a").nbytes
+
+    other = {"provider": "openai", "model": "text-embedding-3-small"}
+    job = IngestJob.start(str(tmp_path), {"a.pdf": "abc"}, other)
+    assert not job.resumed
+    assert job.replay(["a", "b"]) is None
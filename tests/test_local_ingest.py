@@ -0,0 +1,63 @@
+import local_ingest
+from datasources import ingest
+from datasources.faiss_ds import FAISSDS
+
+
+def test_collect_files_walks_directories_and_globs(tmp_path):
+    (tmp_path / "books" / "old").mkdir(parents=True)
+    for name in ["books/a.pdf", "books/old/b.docx", "books/notes.xyz", "c.md"]:
+        (tmp_path / name).write_bytes(b"x")
+
+    files = local_ingest.collect_files(
+        [str(tmp_path / "books"), str(tmp_path / "*.md"), str(tmp_path / "c.md")]
+    )
+
+    assert [f[len(str(tmp_path)) + 1 :] for f in files] == [
+        "books/a.pdf",
+        "books/old/b.docx",
+        "c.md",
+    ]
+
+
+def test_ingests_files_and_reports_every_stage(datasource_path, monkeypatch, capsys):
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "stub")
+    (datasource_path / "in").mkdir()
+    (datasource_path / "in" / "a.txt").write_text("alpha " * 300)
+    rows = "\n".join(f"issue {i},cause {i},solution {i}" for i in range(50))
+    (datasource_path / "in" / "faq.csv").write_text(f"issue,cause,solution\n{rows}\n")
+
+    local_ingest.main(["Help", str(datasource_path / "in"), "--workers", "1"])
+
+    assert FAISSDS("Help").index.ntotal == 51
+    assert (datasource_path / "Help" / "a.txt").read_text() == "alpha " * 300
+    out = capsys.readouterr().out
+    assert "Ingested Help in" in out
+    assert "2 files, 0 pages, 50 rows, 51 sections" in out
+    assert "tokens/s" in out
+    assert "index build" in out
+
+
+def test_files_are_opened_one_at_a_time(datasource_path, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "stub")
+    (datasource_path / "in").mkdir()
+    for i in range(30):
+        (datasource_path / "in" / f"{i}.txt").write_text(f"text {i}")
+    handles = []
+    most_open = 0
+
+    def recording_open(path, *args, **kwargs):
+        nonlocal most_open
+        handle = open(path, *args, **kwargs)
+        if str(path).startswith(str(datasource_path / "in")):
+            handles.append(handle)
+            most_open = max(most_open, sum(not h.closed for h in handles))
+        return handle
+
+    monkeypatch.setattr(ingest, "open", recording_open, raising=False)
+
+    local_ingest.main(["Help", str(datasource_path / "in"), "--workers", "1"])
+
+    assert FAISSDS("Help").index.ntotal == 30
+    assert len(handles) >= 30
+    assert most_open == 1
+    assert all(handle.closed for handle in handles)
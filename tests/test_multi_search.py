@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from datasources.embedding_providers import HashingProvider
+from datasources.faiss_ds import FAISSDS
+from datasources.multi_search import normalize_scores, search_subjects
+
+from .conftest import make_sections
+
+
+def test_normalize_scores_keeps_order():
+    scores = np.array([0.9, 0.5, 0.4, 0.2])
+    for method in ["zscore", "minmax", "none"]:
+        normalized = normalize_scores(scores, method)
+        assert list(np.argsort(-normalized)) == [0, 1, 2, 3]
+    assert normalize_scores(scores, "minmax").tolist() == pytest.approx(
+        [1.0, 3 / 7, 2 / 7, 0.0]
+    )
+    assert normalize_scores(np.array([0.3, 0.3]), "zscore").tolist() == [0.0, 0.0]
+    with pytest.raises(ValueError):
+        normalize_scores(scores, "softmax")
+
+
+def test_search_subjects_merges_hits(datasource_path, fake_embeddings):
+    FAISSDS.create(iter(make_sections(30, prefix="history")), "History")
+    FAISSDS.create(iter(make_sections(30, prefix="math")), "Math")
+    datasources = {"History": FAISSDS("History"), "Math": FAISSDS("Math")}
+    fake_embeddings.calls.clear()
+
+    hits = search_subjects(datasources, "math section number 17", topk=5)
+
+    # the query is embedded once for both subjects
+    assert fake_embeddings.calls == [["math section number 17"]]
+    assert len(hits) == 5
+    assert hits[0]["id"] == "math-17"
+    assert hits[0]["subject"] == "Math"
+    assert [hit["score"] for hit in hits] == sorted(
+        (hit["score"] for hit in hits), reverse=True
+    )
+    exact = datasources["Math"].search_request("math section number 17", topk=1)[0]
+    assert hits[0]["raw_score"] == exact["score"]
+
+
+def test_search_subjects_embeds_once_per_provider(datasource_path, fake_embeddings):
+    FAISSDS.create(iter(make_sections(10, prefix="history")), "History")
+    FAISSDS.create(
+        iter(make_sections(10, prefix="math")), "Math", provider=HashingProvider(64)
+    )
+    datasources = {"History": FAISSDS("History"), "Math": FAISSDS("Math")}
+    fake_embeddings.calls.clear()
+
+    hits = search_subjects(datasources, "math section number 3", topk=40)
+
+    assert fake_embeddings.calls == [["math section number 3"]]
+    assert len(hits) == 20
+    assert {hit["subject"] for hit in hits} == {"History", "Math"}
+    assert search_subjects({}, "anything", topk=3) == []
+
+
+def test_search_subjects_keeps_raw_scores_of_one_provider(
+    datasource_path, fake_embeddings
+):
+    FAISSDS.create(iter(make_sections(10, prefix="history")), "History")
+    FAISSDS.create(iter(make_sections(10, prefix="math")), "Math")
+    datasources = {"History": FAISSDS("History"), "Math": FAISSDS("Math")}
+
+    hits = search_subjects(datasources, "math section number 3", topk=4)
+
+    assert [hit["score"] for hit in hits] == [hit["raw_score"] for hit in hits]
+    assert hits[0]["id"] == "math-3"
+
+
+def test_search_subjects_skips_failing_subjects(
+    datasource_path, fake_embeddings, monkeypatch
+):
+    FAISSDS.create(iter(make_sections(10, prefix="history")), "History")
+    FAISSDS.create(iter(make_sections(10, prefix="math")), "Math")
+    datasources = {"History": FAISSDS("History"), "Math": FAISSDS("Math")}
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("index is gone")
+
+    monkeypatch.setattr(datasources["Math"], "search_vectors", broken)
+    errors = {}
+    hits = search_subjects(datasources, "math section number 3", topk=4, errors=errors)
+
+    assert len(hits) == 4
+    assert {hit["subject"] for hit in hits} == {"History"}
+    assert list(errors) == ["Math"]
+
+    # with no subject left to answer, the error is raised
+    monkeypatch.setattr(datasources["History"], "search_vectors", broken)
+    with pytest.raises(RuntimeError, match="index is gone"):
+        search_subjects(datasources, "math section number 3", topk=4)
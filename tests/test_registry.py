@@ -0,0 +1,89 @@
+import os
+import threading
+
+from datasources.faiss_ds import FAISSDS
+from datasources.registry import FAISSDSRegistry
+
+from .conftest import make_sections
+
+
+def test_registry_caches_loaded_datasource(datasource_path, fake_embeddings):
+    """Repeated lookups return the same instance without reloading."""
+    FAISSDS.create(iter(make_sections(10)), "History")
+    registry = FAISSDSRegistry()
+
+    first = registry.get("History")
+    second = registry.get("History")
+
+    assert first is second
+    stats = registry.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["loaded"] == ["History"]
+    assert stats["resident_bytes"] == first.nbytes
+
+
+def test_registry_reloads_changed_files(datasource_path, fake_embeddings):
+    """A re-ingested datasource is picked up by mtime."""
+    FAISSDS.create(iter(make_sections(10)), "History")
+    registry = FAISSDSRegistry()
+    first = registry.get("History")
+
+    FAISSDS.create(iter(make_sections(12)), "History")
+    index_path = os.path.join(first.index_dir, "faiss.index")
+    st = os.stat(index_path)
+    os.utime(index_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+    second = registry.get("History")
+    assert second is not first
+    assert len(second.documents) == 12
+    assert registry.stats()["reloads"] == 1
+
+
+def test_registry_evicts_least_recently_used(datasource_path, fake_embeddings):
+    """Entries are evicted in LRU order once the byte budget is exceeded."""
+    for name in ["A", "B", "C"]:
+        FAISSDS.create(iter(make_sections(10, prefix=name)), name)
+    size = FAISSDSRegistry().get("A").nbytes
+    registry = FAISSDSRegistry(max_bytes=2 * size + size // 2)
+
+    registry.get("A")
+    registry.get("B")
+    registry.get("A")
+    registry.get("C")
+
+    stats = registry.stats()
+    assert stats["loaded"] == ["A", "C"]
+    assert stats["evictions"] == 1
+
+
+def test_registry_loads_once_under_concurrency(datasource_path, fake_embeddings):
+    """Concurrent misses on one datasource share a single load."""
+    FAISSDS.create(iter(make_sections(10)), "History")
+    registry = FAISSDSRegistry()
+    results = []
+
+    threads = [
+        threading.Thread(target=lambda: results.append(registry.get("History")))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len({id(ds) for ds in results}) == 1
+    assert registry.stats()["misses"] == 1
+
+
+def test_registry_reloads_on_a_new_provider(datasource_path, fake_embeddings):
+    """index_info.json is watched, so the provider is never older than the index."""
+    FAISSDS.create(iter(make_sections(10)), "History")
+    registry = FAISSDSRegistry()
+    first = registry.get("History")
+
+    info_path = os.path.join(first.index_dir, "index_info.json")
+    st = os.stat(info_path)
+    os.utime(info_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+    assert registry.get("History") is not first
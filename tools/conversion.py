@@ -0,0 +1,200 @@
+import functools
+import os
+import pathlib
+import queue
+import signal
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+LIBREOFFICE_BINARY = os.getenv("LIBREOFFICE_BINARY") or "libreoffice"
+# LibreOffice instances converting at once, each with its own user profile
+CONVERSION_WORKERS = int(os.getenv("CONVERSION_WORKERS") or 2)
+# Documents converted by one LibreOffice invocation, which pays startup once
+CONVERSION_BATCH_SIZE = int(os.getenv("CONVERSION_BATCH_SIZE") or 16)
+# Seconds a single document may take: a batch is killed once LibreOffice went
+# this long without finishing a document
+CONVERSION_TIMEOUT = float(os.getenv("CONVERSION_TIMEOUT") or 120)
+# Seconds between checks of a running batch for finished documents
+PROGRESS_INTERVAL = 1.0
+
+
+class ConversionError(Exception):
+    """Raised when documents could not be converted, listing which."""
+
+    def __init__(self, message: str, failed: Optional[List[str]] = None):
+        super().__init__(message)
+        self.failed = failed or []
+
+
+@functools.lru_cache(maxsize=None)
+def check_libreoffice(binary: str) -> None:
+    """Fail early, once per process, if LibreOffice cannot be run."""
+    try:
+        subprocess.run(
+            [binary, "--version"],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        raise ConversionError("Please install LibreOffice to convert documents to PDF.")
+
+
+def _run(command: List[str], timeout: float, progress: Callable[[], int]) -> bool:
+    """Run LibreOffice, killing it and its children once it stalls.
+
+    `progress` counts the documents done so far; LibreOffice is killed when
+    that count did not grow for `timeout` seconds, however long the batch.
+    """
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    done = progress()
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        try:
+            process.wait(timeout=max(min(PROGRESS_INTERVAL, remaining), 0))
+            return True
+        except subprocess.TimeoutExpired:
+            pass
+        current = progress()
+        if current > done:
+            done, deadline = current, time.monotonic() + timeout
+        elif time.monotonic() >= deadline:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+            return False
+
+
+def _convert_batch(
+    batch: List[Tuple[int, str, bytes]], profile: str, timeout: float
+) -> Optional[Dict[int, bytes]]:
+    """Convert documents in one LibreOffice invocation.
+
+    Args:
+        batch (List[Tuple[int, str, bytes]]): the position, extension and
+            content of each document.
+        profile (str): the LibreOffice user profile directory to run with.
+        timeout (float): the seconds allowed per document, counted from the
+            start or the last document converted.
+
+    Returns:
+        Optional[Dict[int, bytes]]: the PDF of every converted document by
+            position, None if the invocation was killed past its timeout, as
+            any PDF it left may be cut short.
+    """
+    with tempfile.TemporaryDirectory(prefix="schola-convert-") as workdir:
+        # inputs are named by position, documents may share a name
+        paths = []
+        for position, extension, data in batch:
+            path = os.path.join(workdir, f"{position}{extension}")
+            with open(path, "wb") as f:
+                f.write(data)
+            paths.append(path)
+
+        outdir = os.path.join(workdir, "pdf")
+        command = [
+            LIBREOFFICE_BINARY,
+            f"-env:UserInstallation={pathlib.Path(profile).as_uri()}",
+            "--headless",
+            "--norestore",
+            "--convert-to",
+            "pdf",
+            "--outdir",
+            outdir,
+            *paths,
+        ]
+
+        def progress() -> int:
+            return len(os.listdir(outdir)) if os.path.isdir(outdir) else 0
+
+        if not _run(command, timeout, progress):
+            return None
+
+        converted = {}
+        for position, _, _ in batch:
+            pdf_path = os.path.join(outdir, f"{position}.pdf")
+            if os.path.exists(pdf_path):
+                with open(pdf_path, "rb") as pdf:
+                    converted[position] = pdf.read()
+        return converted
+
+
+def convert_to_pdf(
+    documents: List[Tuple[str, bytes]],
+    workers: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> List[bytes]:
+    """Convert documents to PDF with LibreOffice, many per invocation.
+
+    Documents are split into batches converted concurrently by up to
+    `workers` LibreOffice instances, each running on its own user profile as
+    instances sharing one would block each other. A batch that goes past the
+    timeout without finishing a document is killed, its output discarded and
+    its documents retried one by one, so a single document that hangs
+    LibreOffice only fails itself and is noticed within about its timeout.
+
+    Args:
+        documents (List[Tuple[str, bytes]]): the filename and content of each document.
+        workers (Optional[int]): LibreOffice instances run at once.
+        batch_size (Optional[int]): documents converted per invocation.
+        timeout (Optional[float]): seconds allowed per document.
+
+    Returns:
+        List[bytes]: the PDF of each document, in order.
+
+    Raises:
+        ConversionError: if LibreOffice is missing or a document failed to convert.
+    """
+    if not documents:
+        return []
+    check_libreoffice(LIBREOFFICE_BINARY)
+    workers = workers or CONVERSION_WORKERS
+    batch_size = batch_size or CONVERSION_BATCH_SIZE
+    timeout = timeout or CONVERSION_TIMEOUT
+
+    items = [
+        (position, os.path.splitext(filename)[1].lower(), data)
+        for position, (filename, data) in enumerate(documents)
+    ]
+    batches = [items[i : i + batch_size] for i in range(0, len(items), batch_size)]
+    workers = min(workers, len(batches))
+
+    with tempfile.TemporaryDirectory(prefix="schola-libreoffice-") as profiles_dir:
+        profiles: queue.Queue = queue.Queue()
+        for n in range(workers):
+            profiles.put(os.path.join(profiles_dir, f"profile-{n}"))
+
+        def convert(batch: List[Tuple[int, str, bytes]]) -> Dict[int, bytes]:
+            profile = profiles.get()
+            try:
+                converted = _convert_batch(batch, profile, timeout)
+                if converted is not None:
+                    return converted
+                converted = {}
+                if len(batch) > 1:
+                    for item in batch:
+                        converted.update(_convert_batch([item], profile, timeout) or {})
+                return converted
+            finally:
+                profiles.put(profile)
+
+        pdfs: Dict[int, bytes] = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for converted in executor.map(convert, batches):
+                pdfs.update(converted)
+
+    failed = [documents[i][0] for i in range(len(documents)) if i not in pdfs]
+    if failed:
+        raise ConversionError(
+            f"LibreOffice could not convert {', '.join(failed)} to PDF.", failed
+        )
+    return [pdfs[i] for i in range(len(documents))]
@@ -1,18 +1,32 @@
 import html
-import os
-import subprocess
-import tempfile
 from io import BytesIO
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import fitz
+import numpy as np
 import pandas as pd
+import pypdf
 from docx import Document
 from pptx import Presentation
 from pypdf import PdfReader
 
+from tools.conversion import convert_to_pdf
 from tools.form_recognizer import get_doc_analysis_client
 
+# Bump when a change here alters what the extractors return, so extractions
+# cached by an older version are not reused
+EXTRACTION_VERSION = 1
+
+# Rows of a CSV file parsed and held in memory at a time
+CSV_CHUNK_ROWS = 10_000
+
+# What the output of each PDF extraction method depends on, beside the file
+EXTRACTOR_VERSIONS = {
+    "AzureFormRecognizer": f"prebuilt-layout/{EXTRACTION_VERSION}",
+    "PyPDF": f"pypdf-{pypdf.__version__}/{EXTRACTION_VERSION}",
+    "PyMuPDF": f"pymupdf-{fitz.VersionBind}/{EXTRACTION_VERSION}",
+}
+
 
 def read_docx(docx_file) -> str:
     """Reads a DOCX file and returns a string of the text content.
@@ -23,13 +37,9 @@ def read_docx(docx_file) -> str:
     Returns:
         str: A string containing all the text from the document.
     """
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as temp:
-        docx_file.seek(0)
-        data = docx_file.read()
-        temp.write(data)
-        temp_filename = temp.name
-    # Use python-docx to read the temporary file
-    doc = Document(temp_filename)
+    docx_file.seek(0)
+    # python-docx reads the document from memory, never from a temporary file
+    doc = Document(BytesIO(docx_file.read()))
     text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
     return text
 
@@ -43,196 +53,219 @@ def read_pptx(pptx_file) -> str:
     Returns:
         str: A string containing all the text from the presentation.
     """
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pptx") as temp:
-        pptx_file.seek(0)
-        contents = pptx_file.read()
-        temp.write(contents)
-        temp_filename = temp.name
-    # Use python-pptx to read the temporary file
-    presentation = Presentation(temp_filename)
-    text = ""
-    for slide in presentation.slides:
-        for shape in slide.shapes:
-            if hasattr(shape, "text"):
-                text += shape.text + " "
-    return text
+    pptx_file.seek(0)
+    # python-pptx reads the presentation from memory, never from a temporary file
+    presentation = Presentation(BytesIO(pptx_file.read()))
+    return "".join(
+        shape.text + " "
+        for slide in presentation.slides
+        for shape in slide.shapes
+        if hasattr(shape, "text")
+    )
 
 
 def doc_to_pdf(file):
     """
     Converts a document file to PDF using LibreOffice and returns a file-like object representing the PDF.
 
+    Converting many documents is much faster with `tools.conversion.convert_to_pdf`,
+    which runs one LibreOffice process per batch of documents.
+
     Args:
         file: A file-like object representing the document to convert.
 
     Returns:
         file-like object: A file-like object representing the converted PDF.
     """
-    try:
-        # Check if LibreOffice is installed
-        subprocess.run(
-            ["libreoffice", "--version"],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-    except subprocess.CalledProcessError:
-        raise Exception("Please install LibreOffice to convert documents to PDF.")
-
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        temp_file_name = temp_file.name
-        with open(temp_file_name, "wb") as buffer:
-            file.seek(0)
-            buffer.write(file.read())
-
-    pdf_file_name = os.path.splitext(temp_file_name)[0] + ".pdf"
-
-    # Convert document to PDF using LibreOffice
-    command = [
-        "libreoffice",
-        "--headless",
-        "--convert-to",
-        "pdf",
-        temp_file_name,
-        "--outdir",
-        os.path.dirname(temp_file_name),
-    ]
-    subprocess.run(command, check=True)
-
-    # Read the converted PDF into a file-like object
-    pdf_file = open(pdf_file_name, "rb")
+    file.seek(0)
+    filename = getattr(file, "filename", None) or getattr(file, "name", "")
+    (pdf,) = convert_to_pdf([(str(filename), file.read())])
+    return BytesIO(pdf)
 
-    # Remove the temporary files
-    os.remove(temp_file_name)
-    os.remove(pdf_file_name)
 
-    return pdf_file
+def _table_to_html(table) -> str:
+    """
+    Converts a table to HTML string.
 
+    Args:
+        table: The table to convert.
 
-def pdf_to_page_map_azure(file) -> List[Tuple[int, int, str]]:
+    Returns:
+        str: HTML representation of the table.
     """
-    Extracts text from a PDF file and returns a page map using Azure Form Recognizer.
+    # cells are grouped by row in one pass, not rescanned for every row
+    rows: List[List] = [[] for _ in range(table.row_count)]
+    for cell in table.cells:
+        if 0 <= cell.row_index < table.row_count:
+            rows[cell.row_index].append(cell)
+
+    parts = ["<table>"]
+    for row_cells in rows:
+        parts.append("<tr>")
+        for cell in sorted(row_cells, key=lambda cell: cell.column_index):
+            tag = (
+                "th"
+                if (cell.kind == "columnHeader" or cell.kind == "rowHeader")
+                else "td"
+            )
+            cell_spans = ""
+            if cell.column_span > 1:
+                cell_spans += f" colSpan={cell.column_span}"
+            if cell.row_span > 1:
+                cell_spans += f" rowSpan={cell.row_span}"
+            parts.append(f"<{tag}{cell_spans}>{html.escape(cell.content)}</{tag}>")
+        parts.append("</tr>")
+    parts.append("</table>")
+    return "".join(parts)
+
+
+def _assemble_page(content: str, page_offset: int, page_length: int, tables) -> str:
+    """
+    Builds the text of a page, replacing the spans of its tables with their HTML.
 
     Args:
-        file: A file-like object representing the PDF file.
+        content (str): The content of the whole document.
+        page_offset (int): Where the page starts in the content.
+        page_length (int): The length of the page in the content.
+        tables: The tables on the page, a later table winning overlapping spans.
 
     Returns:
-        List[Tuple[int, int, str]]: A list of tuples containing page number, offset, and text content.
+        str: The page text, each table's HTML at the first character it covers.
     """
+    if not tables or page_length <= 0:
+        return content[page_offset : page_offset + page_length]
+
+    # the table covering each character of the page, -1 for plain text
+    owner = np.full(page_length, -1, dtype=np.int32)
+    for table_id, table in enumerate(tables):
+        for span in table.spans:
+            start = max(span.offset - page_offset, 0)
+            end = min(span.offset - page_offset + span.length, page_length)
+            if start < end:
+                owner[start:end] = table_id
+
+    # slice the content by runs of characters with the same owner
+    bounds = (np.flatnonzero(np.diff(owner)) + 1).tolist()
+    parts = []
+    added_tables = set()
+    for start, end in zip([0] + bounds, bounds + [page_length]):
+        table_id = int(owner[start])
+        if table_id == -1:
+            parts.append(content[page_offset + start : page_offset + end])
+        elif table_id not in added_tables:
+            parts.append(_table_to_html(tables[table_id]))
+            added_tables.add(table_id)
+    return "".join(parts)
+
+
+def iter_pages_azure(file) -> Iterator[Tuple[int, int, str]]:
+    """
+    Extracts text from a PDF file with Azure Form Recognizer, yielding each page as it is assembled.
 
-    def _table_to_html(table) -> str:
-        """
-        Converts a table to HTML string.
-
-        Args:
-            table: The table to convert.
-
-        Returns:
-            str: HTML representation of the table.
-        """
-        table_html = "<table>"
-        rows = [
-            sorted(
-                [cell for cell in table.cells if cell.row_index == i],
-                key=lambda cell: cell.column_index,
-            )
-            for i in range(table.row_count)
-        ]
-        for row_cells in rows:
-            table_html += "<tr>"
-            for cell in row_cells:
-                tag = (
-                    "th"
-                    if (cell.kind == "columnHeader" or cell.kind == "rowHeader")
-                    else "td"
-                )
-                cell_spans = ""
-                if cell.column_span > 1:
-                    cell_spans += f" colSpan={cell.column_span}"
-                if cell.row_span > 1:
-                    cell_spans += f" rowSpan={cell.row_span}"
-                table_html += f"<{tag}{cell_spans}>{html.escape(cell.content)}</{tag}>"
-            table_html += "</tr>"
-        table_html += "</table>"
-        return table_html
-
-    offset = 0
-    page_map: List[Tuple[int, int, str]] = []
+    Args:
+        file: An uploaded file whose `.file` is the PDF.
 
+    Yields:
+        Tuple[int, int, str]: The page number, offset, and text content of each page.
+    """
     # Initialize the Azure Form Recognizer client
     form_recognizer_client = get_doc_analysis_client()
 
-    # Read file data into bytes
+    # The file is uploaded as is, without copying it into memory first
     file = file.file
     file.seek(0)
-    file_data = file.read()
-
-    # Create a BytesIO object from the file data
-    file_stream = BytesIO(file_data)
-
     poller = form_recognizer_client.begin_analyze_document(
-        "prebuilt-layout", document=file_stream
+        "prebuilt-layout", document=file
     )
     form_recognizer_results = poller.result()
 
+    # Group the tables by the page they start on, once for the document
+    tables_by_page: Dict[int, List] = {}
+    for table in form_recognizer_results.tables or []:
+        if table.bounding_regions is None:
+            continue
+        page_number = table.bounding_regions[0].page_number
+        tables_by_page.setdefault(page_number, []).append(table)
+
+    offset = 0
     for page_num, page in enumerate(form_recognizer_results.pages):
-        tables_on_page = []
-        if form_recognizer_results.tables is not None:
-            for table in form_recognizer_results.tables:
-                if table.bounding_regions is None:
-                    continue
-                if table.bounding_regions[0].page_number == page_num + 1:
-                    tables_on_page.append(table)
-
-        # Mark all positions of the table spans in the page
-        page_offset = page.spans[0].offset
-        page_length = page.spans[0].length
-        table_chars = [-1] * page_length
-        for table_id, table in enumerate(tables_on_page):
-            for span in table.spans:
-                # Replace all table spans with "table_id" in table_chars array
-                for i in range(span.length):
-                    idx = span.offset - page_offset + i
-                    if 0 <= idx < page_length:
-                        table_chars[idx] = table_id
-
-        # Build page text by replacing characters in table spans with table HTML
-        page_text = ""
-        added_tables = set()
-        for idx, table_id in enumerate(table_chars):
-            if table_id == -1:
-                page_text += form_recognizer_results.content[page_offset + idx]
-            elif table_id not in added_tables:
-                page_text += _table_to_html(tables_on_page[table_id])
-                added_tables.add(table_id)
+        page_text = _assemble_page(
+            form_recognizer_results.content,
+            page.spans[0].offset,
+            page.spans[0].length,
+            tables_by_page.get(page_num + 1, []),
+        )
         page_text += " "
-        page_map.append((page_num, offset, page_text))
+        yield (page_num, offset, page_text)
         offset += len(page_text)
 
-    return page_map
 
-
-def pdf_to_page_map_pypdf(file) -> List[Tuple[int, int, str]]:
+def iter_pages_pypdf(file) -> Iterator[Tuple[int, int, str]]:
     """
-    Extracts text from a PDF file and returns a page map using PyPDF.
+    Extracts text from a PDF file with PyPDF, yielding each page as it is decoded.
 
     Args:
         file: A file-like object representing the PDF file.
 
-    Returns:
-        List[Tuple[int, int, str]]: A list of tuples containing page number, offset, and text content.
+    Yields:
+        Tuple[int, int, str]: The page number, offset, and text content of each page.
     """
     file.seek(0)
     reader = PdfReader(file)
 
-    pages_text = []
     offset = 0
     for page_num, page in enumerate(reader.pages):
-        text = page.extract_text() if page.extract_text() is not None else ""
-        pages_text.append((page_num, offset, text))
+        text = page.extract_text() or ""
+        yield (page_num, offset, text)
         offset += len(text)
 
-    return pages_text
+
+def iter_pages_pymupdf(file) -> Iterator[Tuple[int, int, str]]:
+    """
+    Extracts text from a PDF file with PyMuPDF, yielding each page as it is decoded.
+
+    Args:
+        file: A file-like object representing the PDF file.
+
+    Yields:
+        Tuple[int, int, str]: The page number, offset, and text content of each page.
+    """
+    file.seek(0)
+    pdf_document = fitz.open(stream=file.read(), filetype="pdf")
+    try:
+        offset = 0
+        for page_num in range(len(pdf_document)):
+            text = pdf_document[page_num].get_text("text")
+            yield (page_num, offset, text)
+            offset += len(text)
+    finally:
+        pdf_document.close()
+
+
+def pdf_to_page_map_azure(file) -> List[Tuple[int, int, str]]:
+    """
+    Extracts text from a PDF file and returns a page map using Azure Form Recognizer.
+
+    Args:
+        file: A file-like object representing the PDF file.
+
+    Returns:
+        List[Tuple[int, int, str]]: A list of tuples containing page number, offset, and text content.
+    """
+    return list(iter_pages_azure(file))
+
+
+def pdf_to_page_map_pypdf(file) -> List[Tuple[int, int, str]]:
+    """
+    Extracts text from a PDF file and returns a page map using PyPDF.
+
+    Args:
+        file: A file-like object representing the PDF file.
+
+    Returns:
+        List[Tuple[int, int, str]]: A list of tuples containing page number, offset, and text content.
+    """
+    return list(iter_pages_pypdf(file))
 
 
 def pdf_to_page_map_pymupdf(file) -> List[Tuple[int, int, str]]:
@@ -245,20 +278,43 @@ def pdf_to_page_map_pymupdf(file) -> List[Tuple[int, int, str]]:
     Returns:
         List[Tuple[int, int, str]]: A list of tuples containing page number, offset, and text content.
     """
-    file.seek(0)
-    pdf_document = fitz.open(stream=file.read(), filetype="pdf")
+    return list(iter_pages_pymupdf(file))
 
-    pages_text = []
-    offset = 0
-    for page_num in range(len(pdf_document)):
-        page = pdf_document[page_num]
-        text = page.get_text("text")
-        pages_text.append((page_num, offset, text))
-        offset += len(text)
 
-    pdf_document.close()
+def iter_csv_records(
+    file, csv_header: bool, chunk_rows: Optional[int] = None
+) -> Iterator[Dict]:
+    """
+    Reads a CSV file a chunk of rows at a time, yielding each row as a dictionary.
 
-    return pages_text
+    Only one chunk is held in memory, so files of millions of rows are read
+    in bounded memory. Values are kept as the text written in the file, as
+    types inferred chunk by chunk could render a column differently from one
+    chunk to the next, e.g. 3 as "3.0" only in chunks with a missing value.
+    Missing values are NaN.
+
+    Args:
+        file: A file-like object representing the CSV file.
+        csv_header (bool): Whether the CSV contains a header row.
+        chunk_rows (Optional[int]): Rows parsed at a time, CSV_CHUNK_ROWS by default.
+
+    Yields:
+        Dict: Each row, keyed by column name, or "k0", "k1"... without a header.
+    """
+    file.seek(0)
+    with pd.read_csv(
+        file,
+        encoding="utf-8",
+        header=0 if csv_header else None,
+        dtype=str,
+        keep_default_na=True,
+        chunksize=chunk_rows or CSV_CHUNK_ROWS,
+    ) as reader:
+        for chunk in reader:
+            # Convert all integer column names to strings (e.g., 0 -> "k0")
+            if not csv_header:
+                chunk.columns = [f"k{k}" for k in chunk.columns]
+            yield from chunk.to_dict(orient="records")
 
 
 def extract_csv(file, csv_header) -> List[Dict]:
@@ -272,12 +328,4 @@ def extract_csv(file, csv_header) -> List[Dict]:
     Returns:
         List[Dict]: A list of dictionaries representing the CSV data.
     """
-    file.seek(0)
-    csvdf = pd.read_csv(file, encoding="utf-8", header=0 if csv_header else None)
-    record = csvdf.to_dict(orient="records")
-
-    # Convert all integer keys to strings (e.g., 0 -> "k0")
-    if not csv_header:
-        record = [{f"k{k}": v for k, v in d.items()} for d in record]
-
-    return record
+    return list(iter_csv_records(file, csv_header))
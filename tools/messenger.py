@@ -1,10 +1,25 @@
+import os
 import re
+from typing import Dict, List, cast
 
 from telegram import Update
 
-from datasources.faiss_ds import FAISSDS
+from datasources.faiss_ds import SearchMode
+from datasources.multi_search import SUBJECT_ERRORS, search_subjects
+from datasources.registry import registry
 from db.db import db
 
+# Opt-in: "auto" answers queries naming rare terms from the lexical index,
+# without embedding them, and "hybrid" fuses the lexical and vector rankings
+SEARCH_MODE = cast(SearchMode, os.getenv("SEARCH_MODE") or "vector")
+# Opt-in: Q&A also searches every subject the user is enrolled in, not only
+# the current one
+SEARCH_ENROLLED_SUBJECTS = (os.getenv("SEARCH_ENROLLED_SUBJECTS") or "").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
 
 async def schola_reply(
     update: Update,
@@ -38,34 +53,66 @@ async def schola_reply(
         return
 
 
-def retrieve_from_subject(query: str, subject: str, topk: int = 5) -> str:
-    """search if given subject has a datasource, and return formatting search results
-
-    Return:
-        str: the retrieved docs if hit, "" if not hit / no subject info / doesn't use datasource
-    """
-
+def _uses_datasource(subject: str) -> bool:
     info = db.get_subject_info_by_subject_name(subject)
 
-    # check if the subject the user enrolled to has an entry in the DB, if not return ""
+    # check if the subject has an entry in the DB and if it uses any datasource files
     if not info:
-        return ""
-
-    ds: bool = dict(info).get("use_datasource", False)
+        return False
+    return dict(info).get("use_datasource", False)
 
-    # the subject has an entry, check if it uses any datasource files, if not return ""
-    if not ds:
-        return ""
 
-    # perform a search on its datasource, and return the search results.
-    faiss_ds = FAISSDS(index_name=subject)
-    hits = faiss_ds.search_request(query, topk=topk)
+def _format_hits(hits: List[Dict]) -> str:
     res = ""
     for i, result in enumerate(hits, start=1):
         res += f"<b>Result {i}:</b>"
+        if "subject" in result:
+            res += f"Subject: {result['subject']}"
         res += f"Content: {result['content']}"
         res += f"File URL: {result['file_url']}"
         res += f"<i>Score: {result['score']} </i>"
         res += '<hr class="solid">'
-
     return res
+
+
+def retrieve_from_subject(query: str, subject: str, topk: int = 5) -> str:
+    """search if given subject has a datasource, and return formatting search results
+
+    Return:
+        str: the retrieved docs if hit, "" if not hit / no subject info / doesn't use datasource
+    """
+
+    if not _uses_datasource(subject):
+        return ""
+
+    # perform a search on its datasource, and return the search results.
+    faiss_ds = registry.get(subject)
+    hits = faiss_ds.search_request(query, topk=topk, mode=SEARCH_MODE)
+    return _format_hits(hits)
+
+
+def retrieve_from_subjects(query: str, subjects: List[str], topk: int = 5) -> str:
+    """search the datasources of several subjects at once, and return the merged results
+
+    Return:
+        str: the best retrieved docs across subjects, "" if none of them uses a datasource
+    """
+
+    subjects = [s for s in dict.fromkeys(subjects) if s and _uses_datasource(s)]
+    if not subjects:
+        return ""
+    if len(subjects) == 1:
+        return retrieve_from_subject(query, subjects[0], topk=topk)
+
+    datasources = {}
+    errors: Dict[str, Exception] = {}
+    for subject in subjects:
+        try:
+            datasources[subject] = registry.get(subject)
+        except SUBJECT_ERRORS as e:
+            # e.g. a subject without an index yet, the others still answer
+            errors[subject] = e
+    if not datasources:
+        # nothing to answer with, fail as the search of a single subject would
+        raise next(iter(errors.values()))
+    return _format_hits(search_subjects(datasources, query, topk=topk))